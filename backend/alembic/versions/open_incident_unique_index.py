@@ -0,0 +1,55 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'open_incident_unique_index'
+down_revision: Union[str, None] = 'initial_migration'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Merge duplicate open incidents into the oldest one before the index is created
+    op.execute("""
+        CREATE TEMP TABLE incident_merge ON COMMIT DROP AS
+        SELECT id, first_value(id) OVER w AS keep_id
+        FROM incidents
+        WHERE status IN ('NEW', 'INVESTIGATING')
+        WINDOW w AS (PARTITION BY honeypot_id, source_ip ORDER BY first_seen, id)
+    """)
+    op.execute("DELETE FROM incident_merge WHERE id = keep_id")
+    op.execute("""
+        UPDATE incidents AS keep
+        SET event_count = COALESCE(keep.event_count, 0) + merged.event_count,
+            threat_level = GREATEST(keep.threat_level, merged.threat_level),
+            last_seen = GREATEST(keep.last_seen, merged.last_seen)
+        FROM (
+            SELECT m.keep_id,
+                   SUM(COALESCE(i.event_count, 0)) AS event_count,
+                   MAX(i.threat_level) AS threat_level,
+                   MAX(i.last_seen) AS last_seen
+            FROM incident_merge m
+            JOIN incidents i ON i.id = m.id
+            GROUP BY m.keep_id
+        ) AS merged
+        WHERE keep.id = merged.keep_id
+    """)
+    op.execute("""
+        UPDATE events SET incident_id = m.keep_id
+        FROM incident_merge m
+        WHERE events.incident_id = m.id
+    """)
+    op.execute("DELETE FROM incidents WHERE id IN (SELECT id FROM incident_merge)")
+    
+    op.create_index(
+        'uq_incidents_open_source',
+        'incidents',
+        ['honeypot_id', 'source_ip'],
+        unique=True,
+        postgresql_where=sa.text("status IN ('NEW', 'INVESTIGATING')")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_incidents_open_source', table_name='incidents')
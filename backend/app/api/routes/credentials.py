@@ -173,8 +173,7 @@ async def delete_credential(
     if not cred:
         raise HTTPException(status_code=404, detail="Credential not found")
     
-    db.delete(cred)
-    db.commit()
+    await storage.delete_credential(db, cred)
     
     return {"status": "deleted", "credential_id": credential_id}
 
@@ -185,8 +184,6 @@ async def bulk_delete_credentials(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    from app.models.credential import Credential
-    
     if not credential_ids:
         raise HTTPException(status_code=400, detail="No credential IDs provided")
     
@@ -200,7 +197,6 @@ async def bulk_delete_credentials(
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid credential_id format: {cred_id}")
     
-    deleted_count = db.query(Credential).filter(Credential.id.in_(cred_uuids)).delete(synchronize_session=False)
-    db.commit()
+    deleted_count = await storage.bulk_delete_credentials(db, cred_uuids)
     
     return {"status": "deleted", "count": deleted_count}
@@ -1,21 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Header
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Request
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, func, select, update
 from app.schemas.event import EventResponse, EventListResponse, EventFilter
 from app.schemas.incident import IncidentResponse, IncidentListResponse, IncidentUpdate
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.security import get_current_active_user
 from app.core.config import settings
 from app.models.user import User
 from app.models.event import Event
 from app.models.incident import Incident, IncidentStatus
+from app.models.credential import Credential
 from app.services.events.processor import EventProcessor
+from app.services.events.pipeline import event_pipeline
+from app.services.events.stream import event_stream
+from app.services.events.incident_cache import incident_cache
+from app.services.events.aggregator import scan_aggregator
+from app.services.events.dedup import duplicate_filter
+from app.services.events.wire import PayloadError, decode_event_payload
+from app.services.alerts.dispatcher import alert_dispatcher
 from app.services.credentials.validator import CredentialValidator
+from app.services.credentials.index import honeytoken_index
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+import asyncio
 import uuid
 import json
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 router = APIRouter()
 
@@ -29,91 +42,408 @@ class InternalEventRequest(BaseModel):
     honeytoken_check: Optional[dict] = None
 
 
-def check_honeytoken_in_request_text(request_text: str, db: Session) -> tuple[Optional[str], int]:
+InternalEventBatch = TypeAdapter(List[InternalEventRequest])
+
+
+def is_transient_store_error(error: Exception) -> bool:
+    """True for connection and operational database failures, which a later retry may get past."""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError))
+
+
+def build_request_text(details: dict) -> str:
+    request_text = details.get('request_text', '')
+    if request_text:
+        return request_text
+    
+    full_url = details.get('full_url', '')
+    path = details.get('path', '')
+    query_string = details.get('query_string', '')
+    query_params = details.get('query', {})
+    body = details.get('body') or ''
+    headers_str = json.dumps(details.get('headers', {}), ensure_ascii=False)
+    query_params_str = json.dumps(query_params, ensure_ascii=False) if query_params else ''
+    request_text = f"{full_url}\n{path}\n{query_string}\n{query_params_str}\n{headers_str}\n{body}"
+    
+    if 'full_url' in details:
+        # HTTP runners leave request_text out of the wire format; keep it on the stored event
+        details['request_text'] = request_text
+    return request_text
+
+
+def body_validation_error(e: ValidationError) -> RequestValidationError:
+    return RequestValidationError([
+        {**error, 'loc': ('body', *error['loc'])} for error in e.errors(include_url=False)
+    ])
+
+
+async def read_internal_payload(request: Request):
+    try:
+        return decode_event_payload(
+            await request.body(),
+            request.headers.get('content-type'),
+            request.headers.get('content-encoding'),
+            settings.internal_event_max_body_bytes
+        )
+    except PayloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+
+
+async def internal_event(payload=Depends(read_internal_payload)) -> InternalEventRequest:
+    try:
+        return InternalEventRequest.model_validate(payload)
+    except ValidationError as e:
+        raise body_validation_error(e)
+
+
+async def internal_event_batch(payload=Depends(read_internal_payload)) -> List[InternalEventRequest]:
+    try:
+        return InternalEventBatch.validate_python(payload)
+    except ValidationError as e:
+        raise body_validation_error(e)
+
+
+def verify_honeypot_token(x_honeypot_token: Optional[str]):
+    expected_token = settings.secret_key[:16]
+    if x_honeypot_token != expected_token:
+        raise HTTPException(status_code=401, detail="Invalid honeypot token")
+
+
+def find_honeytokens(request_text: str) -> List[str]:
     if not request_text:
-        return None, 1
+        return []
     
-    from app.models.credential import Credential
-    from sqlalchemy import or_
+    matched_ids = honeytoken_index.match(request_text)
+    for credential_id in matched_ids:
+        username = honeytoken_index.usernames.get(credential_id)
+        print(f"[EVENTS] ✅ Honeytoken detected! username='{username[:30] if username else 'N/A'}'")
     
-    credentials = db.query(Credential).all()
+    return matched_ids
+
+
+async def mark_honeytokens_used(db: AsyncSession, credential_ids: List[str]) -> List[str]:
+    """Sets used_at on matched honeytokens and returns the ids that still exist.
+    
+    Only runs when something matched, so it does not add queries to the common
+    ingest path. Ids missing from the table mean another process deleted them
+    and they are dropped from the index.
+    """
+    requested = [uuid.UUID(credential_id) for credential_id in credential_ids]
+    result = await db.execute(select(Credential.id).where(Credential.id.in_(requested)))
+    existing = {str(credential_id) for credential_id in result.scalars()}
+    
+    missing = set(credential_ids) - existing
+    if missing:
+        honeytoken_index.remove(missing)
+    
+    if existing:
+        await db.execute(
+            update(Credential)
+            .where(
+                Credential.id.in_([uuid.UUID(credential_id) for credential_id in existing]),
+                Credential.used_at.is_(None)
+            )
+            .values(used_at=datetime.utcnow())
+        )
     
-    if not credentials:
+    return [credential_id for credential_id in credential_ids if credential_id in existing]
+
+
+async def check_honeytoken_in_request_text(request_text: str, db: AsyncSession) -> tuple[Optional[str], int]:
+    if not request_text:
         return None, 1
     
-    request_text_lower = request_text.lower()
+    await honeytoken_index.ensure_fresh(db)
     
-    for cred in credentials:
-        username = cred.username
-        password = cred.password
-        
-        username_found = False
-        password_found = False
-        
-        if username:
-            username_found = username.lower() in request_text_lower
-        if password:
-            password_found = password.lower() in request_text_lower
-        
-        if username_found or password_found:
-            if cred.used_at is None:
-                from datetime import datetime
-                cred.used_at = datetime.utcnow()
-                db.commit()
-            print(f"[EVENTS] ✅ Honeytoken detected! username='{username[:30] if username else 'N/A'}' (found: {username_found}), password='{password[:20] if password else 'N/A'}...' (found: {password_found})")
-            return str(cred.id), 3
+    matched_ids = find_honeytokens(request_text)
+    if not matched_ids:
+        return None, 1
     
-    return None, 1
+    matched_ids = await mark_honeytokens_used(db, matched_ids)
+    await db.commit()
+    if not matched_ids:
+        return None, 1
+    return matched_ids[0], 3
 
 
 @router.post("/events/internal")
 async def receive_internal_event(
-    event_data: InternalEventRequest,
-    db: Session = Depends(get_db),
+    event_data: InternalEventRequest = Depends(internal_event),
+    db: AsyncSession = Depends(get_async_db),
     x_honeypot_token: Optional[str] = Header(None, alias="X-Honeypot-Token")
 ):
-    expected_token = settings.secret_key[:16]
-    if x_honeypot_token != expected_token:
-        raise HTTPException(status_code=401, detail="Invalid honeypot token")
+    verify_honeypot_token(x_honeypot_token)
     
-    request_text = event_data.details.get('request_text', '')
-    if not request_text:
-        full_url = event_data.details.get('full_url', '')
-        path = event_data.details.get('path', '')
-        query_string = event_data.details.get('query_string', '')
-        query_params = event_data.details.get('query', {})
-        body = event_data.details.get('body', '')
-        headers_str = json.dumps(event_data.details.get('headers', {}))
-        query_params_str = json.dumps(query_params) if query_params else ''
-        request_text = f"{full_url}\n{path}\n{query_string}\n{query_params_str}\n{headers_str}\n{body}"
+    request_text = build_request_text(event_data.details)
     
-    honeytoken_id, detected_level = check_honeytoken_in_request_text(request_text, db)
+    honeytoken_id, detected_level = await check_honeytoken_in_request_text(request_text, db)
     
     honeytoken_username = None
     if honeytoken_id:
-        from app.models.credential import Credential
-        credential = db.query(Credential).filter(Credential.id == uuid.UUID(honeytoken_id)).first()
-        if credential:
-            honeytoken_username = credential.username
+        honeytoken_username = honeytoken_index.usernames.get(honeytoken_id)
+        if honeytoken_username:
             event_data.details['honeytoken_username'] = honeytoken_username
     
     if honeytoken_id and event_data.level < detected_level:
         event_data.level = detected_level
     
+    item = {
+        'honeypot_id': event_data.honeypot_id,
+        'event_type': event_data.event_type,
+        'level': event_data.level,
+        'source_ip': event_data.source_ip,
+        'details': event_data.details,
+        'honeytoken_id': honeytoken_id
+    }
+    
+    if duplicate_filter.enabled or scan_aggregator.enabled or settings.event_ingest_mode in ("queue", "stream"):
+        try:
+            uuid.UUID(event_data.honeypot_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid honeypot_id format")
+    
+    fingerprint = duplicate_filter.key(item)
+    original_id = duplicate_filter.repeat(fingerprint)
+    if original_id:
+        return {"status": "duplicate", "event_id": str(original_id)}
+    
+    if scan_aggregator.absorb(item):
+        return {"status": "aggregated"}
+    
+    if settings.event_ingest_mode in ("queue", "stream"):
+        if settings.event_ingest_mode == "stream":
+            try:
+                event_id = await event_stream.submit(item)
+            except (RedisError, RuntimeError) as e:
+                print(f"[EVENTS] Failed to append event to stream: {e}")
+                raise HTTPException(status_code=503, detail="Event stream unavailable")
+        else:
+            try:
+                event_id = event_pipeline.submit(item)
+            except asyncio.QueueFull:
+                raise HTTPException(status_code=503, detail="Event queue is full")
+        
+        duplicate_filter.remember(fingerprint, event_id)
+        return {"status": "queued", "event_id": str(event_id)}
+    
     processor = EventProcessor()
-    event, incident = await processor.process_event(
-        db=db,
-        honeypot_id=event_data.honeypot_id,
-        event_type=event_data.event_type,
-        level=event_data.level,
-        source_ip=event_data.source_ip,
-        details=event_data.details,
-        honeytoken_id=honeytoken_id
-    )
+    event, incident = await processor.process_event(db=db, **item)
+    duplicate_filter.remember(fingerprint, event.id)
     
     return {"status": "ok", "event_id": str(event.id)}
 
 
+@router.post("/events/internal/batch")
+async def receive_internal_event_batch(
+    events_data: List[InternalEventRequest] = Depends(internal_event_batch),
+    db: AsyncSession = Depends(get_async_db),
+    x_honeypot_token: Optional[str] = Header(None, alias="X-Honeypot-Token")
+):
+    verify_honeypot_token(x_honeypot_token)
+    
+    if len(events_data) > settings.internal_event_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch cannot contain more than {settings.internal_event_batch_max_size} events"
+        )
+    
+    from app.models.honeypot import HoneypotService
+    
+    results: list[dict] = [{"index": i, "status": "error"} for i in range(len(events_data))]
+    valid: list[tuple[int, uuid.UUID]] = []
+    
+    for i, event_data in enumerate(events_data):
+        try:
+            valid.append((i, uuid.UUID(event_data.honeypot_id)))
+        except ValueError:
+            results[i]["error"] = "Invalid honeypot_id format"
+    
+    honeypot_uuids = {honeypot_uuid for _, honeypot_uuid in valid}
+    known_honeypots = set()
+    if honeypot_uuids:
+        result = await db.execute(select(HoneypotService.id).where(HoneypotService.id.in_(honeypot_uuids)))
+        known_honeypots = set(result.scalars())
+    
+    if valid:
+        await honeytoken_index.ensure_fresh(db)
+    
+    accepted_items: list[tuple[int, list[str]]] = []
+    for i, honeypot_uuid in valid:
+        if honeypot_uuid not in known_honeypots:
+            results[i]["error"] = "Honeypot not found"
+            continue
+        accepted_items.append((i, find_honeytokens(build_request_text(events_data[i].details))))
+    
+    detected = {credential_id for _, matched_ids in accepted_items for credential_id in matched_ids}
+    confirmed = set(await mark_honeytokens_used(db, list(detected))) if detected else set()
+    
+    batch = []
+    fingerprints = {}
+    for i, matched_ids in accepted_items:
+        event_data = events_data[i]
+        matched_ids = [credential_id for credential_id in matched_ids if credential_id in confirmed]
+        
+        honeytoken_id = None
+        if matched_ids:
+            honeytoken_id = matched_ids[0]
+            honeytoken_username = honeytoken_index.usernames.get(honeytoken_id)
+            if honeytoken_username:
+                event_data.details['honeytoken_username'] = honeytoken_username
+            if event_data.level < 3:
+                event_data.level = 3
+        
+        item = {
+            'honeypot_id': event_data.honeypot_id,
+            'event_type': event_data.event_type,
+            'level': event_data.level,
+            'source_ip': event_data.source_ip,
+            'details': event_data.details,
+            'honeytoken_id': honeytoken_id
+        }
+        
+        fingerprint = duplicate_filter.key(item)
+        original_id = duplicate_filter.repeat(fingerprint)
+        if original_id:
+            results[i] = {"index": i, "status": "duplicate", "event_id": str(original_id)}
+            continue
+        if scan_aggregator.absorb(item):
+            results[i] = {"index": i, "status": "aggregated"}
+            continue
+        
+        if fingerprint is not None:
+            # Remembered before the write so that repeats later in this batch are caught too
+            item['id'] = uuid.uuid4()
+            duplicate_filter.remember(fingerprint, item['id'])
+            fingerprints[i] = fingerprint
+        batch.append((i, item))
+    
+    if batch and settings.event_ingest_mode == "stream":
+        if detected:
+            await db.commit()
+        try:
+            event_ids = await event_stream.submit_many([item for _, item in batch])
+        except (RedisError, RuntimeError) as e:
+            print(f"[EVENTS] Failed to append event batch to stream: {e}")
+            duplicate_filter.forget(fingerprints.values())
+            for i, _ in batch:
+                results[i]["error"] = "Event stream unavailable"
+                results[i]["retry"] = True
+        else:
+            for (i, _), event_id in zip(batch, event_ids):
+                results[i] = {"index": i, "status": "queued", "event_id": str(event_id)}
+    elif batch and settings.event_ingest_mode == "queue":
+        if detected:
+            await db.commit()
+        for i, item in batch:
+            try:
+                event_id = event_pipeline.submit(item)
+            except asyncio.QueueFull:
+                duplicate_filter.forget([fingerprints.get(i)])
+                results[i]["error"] = "Event queue is full"
+                results[i]["retry"] = True
+            else:
+                results[i] = {"index": i, "status": "queued", "event_id": str(event_id)}
+    elif batch:
+        processor = EventProcessor()
+        try:
+            event_ids = await processor.process_batch(db, [item for _, item in batch])
+        except Exception as e:
+            await db.rollback()
+            if is_transient_store_error(e):
+                print(f"[EVENTS] Failed to store event batch: {e}")
+                duplicate_filter.forget(fingerprints.values())
+                for i, _ in batch:
+                    results[i]["error"] = "Failed to store event"
+                    results[i]["retry"] = True
+            else:
+                # One bad item (e.g. a honeypot deleted meanwhile) must not fail the whole batch on every retry
+                print(f"[EVENTS] Event batch failed, storing one by one: {e}")
+                for i, item in batch:
+                    try:
+                        event_id = (await processor.process_batch(db, [item]))[0]
+                    except Exception as item_error:
+                        await db.rollback()
+                        duplicate_filter.forget([fingerprints.get(i)])
+                        results[i]["error"] = "Failed to store event"
+                        if is_transient_store_error(item_error):
+                            results[i]["retry"] = True
+                        else:
+                            print(f"[EVENTS] Rejected event {i} of batch: {item_error}")
+                    else:
+                        results[i] = {"index": i, "status": "ok", "event_id": str(event_id)}
+        else:
+            for (i, _), event_id in zip(batch, event_ids):
+                results[i] = {"index": i, "status": "ok", "event_id": str(event_id)}
+    
+    accepted = sum(1 for r in results if r["status"] != "error")
+    return {
+        "status": "ok" if accepted == len(results) else "partial",
+        "accepted": accepted,
+        "failed": len(results) - accepted,
+        "results": results
+    }
+
+
+@router.get("/events/pipeline/stats")
+async def get_event_pipeline_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    return {
+        "mode": settings.event_ingest_mode,
+        **event_pipeline.stats(),
+        "incident_cache": incident_cache.stats(),
+        "aggregation": scan_aggregator.stats(),
+        "dedup": duplicate_filter.stats(),
+        "alerts": alert_dispatcher.stats(),
+        "stream": await event_stream.stats()
+    }
+
+
+async def load_honeypots(db: AsyncSession, honeypot_ids) -> dict:
+    from app.models.honeypot import HoneypotService
+    
+    honeypot_ids = set(honeypot_ids)
+    if not honeypot_ids:
+        return {}
+    result = await db.execute(select(HoneypotService).where(HoneypotService.id.in_(honeypot_ids)))
+    return {honeypot.id: honeypot for honeypot in result.scalars()}
+
+
+def build_event_response(e: Event, honeypot) -> EventResponse:
+    return EventResponse(
+        id=str(e.id),
+        honeypot_id=str(e.honeypot_id),
+        honeypot_name=honeypot.name if honeypot else None,
+        honeypot_type=honeypot.type if honeypot else None,
+        honeypot_port=honeypot.port if honeypot else None,
+        incident_id=str(e.incident_id) if e.incident_id else None,
+        event_type=e.event_type,
+        level=e.level,
+        source_ip=e.source_ip,
+        honeytoken_id=str(e.honeytoken_id) if e.honeytoken_id else None,
+        timestamp=e.timestamp,
+        details=e.details
+    )
+
+
+def build_incident_response(incident: Incident, honeypot) -> IncidentResponse:
+    return IncidentResponse(
+        id=str(incident.id),
+        honeypot_id=str(incident.honeypot_id),
+        honeypot_name=honeypot.name if honeypot else None,
+        honeypot_type=honeypot.type if honeypot else None,
+        honeypot_port=honeypot.port if honeypot else None,
+        source_ip=incident.source_ip,
+        threat_level=incident.threat_level,
+        status=incident.status.value,
+        event_count=incident.event_count,
+        first_seen=incident.first_seen,
+        last_seen=incident.last_seen,
+        details=incident.details
+    )
+
+
 @router.get("/events", response_model=EventListResponse)
 async def get_events(
     honeypot_id: Optional[str] = Query(None),
@@ -122,55 +452,37 @@ async def get_events(
     incident_id: Optional[str] = Query(None),
     limit: int = Query(100, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    query = db.query(Event)
+    query = select(Event)
     
     if honeypot_id:
         try:
             honeypot_uuid = uuid.UUID(honeypot_id)
-            query = query.filter(Event.honeypot_id == honeypot_uuid)
+            query = query.where(Event.honeypot_id == honeypot_uuid)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid honeypot_id format")
     
     if level:
-        query = query.filter(Event.level == level)
+        query = query.where(Event.level == level)
     
     if source_ip:
-        query = query.filter(Event.source_ip == source_ip)
+        query = query.where(Event.source_ip == source_ip)
     
     if incident_id:
         try:
             incident_uuid = uuid.UUID(incident_id)
-            query = query.filter(Event.incident_id == incident_uuid)
+            query = query.where(Event.incident_id == incident_uuid)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid incident_id format")
     
-    total = query.count()
-    events = query.order_by(Event.timestamp.desc()).offset(offset).limit(limit).all()
-    
-    from app.models.honeypot import HoneypotService
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    result = await db.execute(query.order_by(Event.timestamp.desc()).offset(offset).limit(limit))
+    events = result.scalars().all()
     
-    event_responses = []
-    for e in events:
-        honeypot = db.query(HoneypotService).filter(HoneypotService.id == e.honeypot_id).first()
-        event_responses.append(
-            EventResponse(
-                id=str(e.id),
-                honeypot_id=str(e.honeypot_id),
-                honeypot_name=honeypot.name if honeypot else None,
-                honeypot_type=honeypot.type if honeypot else None,
-                honeypot_port=honeypot.port if honeypot else None,
-                incident_id=str(e.incident_id) if e.incident_id else None,
-                event_type=e.event_type,
-                level=e.level,
-                source_ip=e.source_ip,
-                honeytoken_id=str(e.honeytoken_id) if e.honeytoken_id else None,
-                timestamp=e.timestamp,
-                details=e.details
-            )
-        )
+    honeypots = await load_honeypots(db, [e.honeypot_id for e in events])
+    event_responses = [build_event_response(e, honeypots.get(e.honeypot_id)) for e in events]
     
     return EventListResponse(events=event_responses, total=total)
 
@@ -178,7 +490,7 @@ async def get_events(
 @router.get("/events/{event_id}", response_model=EventResponse)
 async def get_event(
     event_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
@@ -186,27 +498,12 @@ async def get_event(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid event_id format")
     
-    event = db.query(Event).filter(Event.id == event_uuid).first()
+    event = await db.get(Event, event_uuid)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    from app.models.honeypot import HoneypotService
-    honeypot = db.query(HoneypotService).filter(HoneypotService.id == event.honeypot_id).first()
-    
-    return EventResponse(
-        id=str(event.id),
-        honeypot_id=str(event.honeypot_id),
-        honeypot_name=honeypot.name if honeypot else None,
-        honeypot_type=honeypot.type if honeypot else None,
-        honeypot_port=honeypot.port if honeypot else None,
-        incident_id=str(event.incident_id) if event.incident_id else None,
-        event_type=event.event_type,
-        level=event.level,
-        source_ip=event.source_ip,
-        honeytoken_id=str(event.honeytoken_id) if event.honeytoken_id else None,
-        timestamp=event.timestamp,
-        details=event.details
-    )
+    honeypots = await load_honeypots(db, [event.honeypot_id])
+    return build_event_response(event, honeypots.get(event.honeypot_id))
 
 
 @router.get("/incidents", response_model=IncidentListResponse)
@@ -216,52 +513,34 @@ async def get_incidents(
     status: Optional[str] = Query(None),
     limit: int = Query(100, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    query = db.query(Incident)
+    query = select(Incident)
     
     if honeypot_id:
         try:
             honeypot_uuid = uuid.UUID(honeypot_id)
-            query = query.filter(Incident.honeypot_id == honeypot_uuid)
+            query = query.where(Incident.honeypot_id == honeypot_uuid)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid honeypot_id format")
     
     if threat_level:
-        query = query.filter(Incident.threat_level == threat_level)
+        query = query.where(Incident.threat_level == threat_level)
     
     if status:
         try:
             status_enum = IncidentStatus(status)
-            query = query.filter(Incident.status == status_enum)
+            query = query.where(Incident.status == status_enum)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid status")
     
-    total = query.count()
-    incidents = query.order_by(Incident.last_seen.desc()).offset(offset).limit(limit).all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    result = await db.execute(query.order_by(Incident.last_seen.desc()).offset(offset).limit(limit))
+    incidents = result.scalars().all()
     
-    from app.models.honeypot import HoneypotService
-    
-    incident_responses = []
-    for i in incidents:
-        honeypot = db.query(HoneypotService).filter(HoneypotService.id == i.honeypot_id).first()
-        incident_responses.append(
-            IncidentResponse(
-                id=str(i.id),
-                honeypot_id=str(i.honeypot_id),
-                honeypot_name=honeypot.name if honeypot else None,
-                honeypot_type=honeypot.type if honeypot else None,
-                honeypot_port=honeypot.port if honeypot else None,
-                source_ip=i.source_ip,
-                threat_level=i.threat_level,
-                status=i.status.value,
-                event_count=i.event_count,
-                first_seen=i.first_seen,
-                last_seen=i.last_seen,
-                details=i.details
-            )
-        )
+    honeypots = await load_honeypots(db, [i.honeypot_id for i in incidents])
+    incident_responses = [build_incident_response(i, honeypots.get(i.honeypot_id)) for i in incidents]
     
     return IncidentListResponse(incidents=incident_responses, total=total)
 
@@ -269,7 +548,7 @@ async def get_incidents(
 @router.get("/incidents/{incident_id}", response_model=IncidentResponse)
 async def get_incident(
     incident_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
@@ -277,34 +556,19 @@ async def get_incident(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid incident_id format")
     
-    incident = db.query(Incident).filter(Incident.id == incident_uuid).first()
+    incident = await db.get(Incident, incident_uuid)
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
     
-    from app.models.honeypot import HoneypotService
-    honeypot = db.query(HoneypotService).filter(HoneypotService.id == incident.honeypot_id).first()
-    
-    return IncidentResponse(
-        id=str(incident.id),
-        honeypot_id=str(incident.honeypot_id),
-        honeypot_name=honeypot.name if honeypot else None,
-        honeypot_type=honeypot.type if honeypot else None,
-        honeypot_port=honeypot.port if honeypot else None,
-        source_ip=incident.source_ip,
-        threat_level=incident.threat_level,
-        status=incident.status.value,
-        event_count=incident.event_count,
-        first_seen=incident.first_seen,
-        last_seen=incident.last_seen,
-        details=incident.details
-    )
+    honeypots = await load_honeypots(db, [incident.honeypot_id])
+    return build_incident_response(incident, honeypots.get(incident.honeypot_id))
 
 
 @router.put("/incidents/{incident_id}/status", response_model=IncidentResponse)
 async def update_incident_status(
     incident_id: str,
     status_update: IncidentUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     try:
@@ -312,7 +576,7 @@ async def update_incident_status(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid incident_id format")
     
-    incident = db.query(Incident).filter(Incident.id == incident_uuid).first()
+    incident = await db.get(Incident, incident_uuid)
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
     
@@ -321,23 +585,11 @@ async def update_incident_status(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid status value")
     
-    db.commit()
-    db.refresh(incident)
+    await db.commit()
+    await db.refresh(incident)
     
-    from app.models.honeypot import HoneypotService
-    honeypot = db.query(HoneypotService).filter(HoneypotService.id == incident.honeypot_id).first()
+    if incident.status in (IncidentStatus.RESOLVED, IncidentStatus.IGNORED):
+        incident_cache.invalidate(incident.id)
     
-    return IncidentResponse(
-        id=str(incident.id),
-        honeypot_id=str(incident.honeypot_id),
-        honeypot_name=honeypot.name if honeypot else None,
-        honeypot_type=honeypot.type if honeypot else None,
-        honeypot_port=honeypot.port if honeypot else None,
-        source_ip=incident.source_ip,
-        threat_level=incident.threat_level,
-        status=incident.status.value,
-        event_count=incident.event_count,
-        first_seen=incident.first_seen,
-        last_seen=incident.last_seen,
-        details=incident.details
-    )
+    honeypots = await load_honeypots(db, [incident.honeypot_id])
+    return build_incident_response(incident, honeypots.get(incident.honeypot_id))
@@ -5,6 +5,7 @@ from app.core.database import get_db
 from app.core.security import get_current_active_user
 from app.models.user import User
 from app.models.notification_settings import NotificationSettings
+from app.services.alerts.notifier import notification_settings_cache
 import uuid
 
 router = APIRouter()
@@ -30,6 +31,7 @@ async def get_notification_settings(
         db.add(settings)
         db.commit()
         db.refresh(settings)
+        notification_settings_cache.invalidate()
     
     return NotificationSettingsResponse(
         id=str(settings.id),
@@ -78,6 +80,7 @@ async def update_notification_settings(
     
     db.commit()
     db.refresh(settings)
+    notification_settings_cache.invalidate()
     
     return NotificationSettingsResponse(
         id=str(settings.id),
@@ -23,8 +23,53 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
     api_key: Optional[str] = None
     
+    internal_event_batch_max_size: int = 1000
+    internal_event_max_body_bytes: int = 64 * 1024 * 1024
+    honeytoken_index_check_interval: float = 30.0
+    
+    event_ingest_mode: str = "sync"  # sync | queue | stream
+    event_queue_size: int = 10000
+    event_writer_count: int = 2
+    event_batch_size: int = 200
+    event_flush_interval: float = 0.5
+    event_stream_name: str = "honeypot:events"
+    event_stream_group: str = "event-writers"
+    event_stream_consumers: int = 2
+    event_stream_block_ms: int = 1000
+    event_stream_maxlen: int = 1000000
+    event_stream_claim_idle_ms: int = 60000
+    
+    # Level-1 events kept in full per source IP, honeypot and type within a window; off unless set,
+    # since events past a threshold are only stored as a summary row
+    event_aggregation_thresholds: dict[str, int] = {}
+    event_aggregation_window: float = 60.0
+    event_aggregation_max_keys: int = 100000
+    event_aggregation_flush_interval: float = 1.0
+    
+    # Off unless set: repeats are then merged into the first event's repeat_count, not stored
+    event_dedup_size: int = 0  # 0 disables duplicate suppression
+    event_dedup_ttl: float = 300.0
+    event_dedup_flush_interval: float = 1.0
+    event_dedup_volatile_fields: list[str] = ["src_port", "conn_id", "timestamp"]
+    
+    incident_cache_size: int = 10000  # 0 disables the cache
+    incident_cache_ttl: float = 60.0
+    incident_cache_flush_interval: float = 1.0
+    
     telegram_bot_token: Optional[str] = None
     telegram_chat_id: Optional[str] = None
+    telegram_api_url: str = "https://api.telegram.org"
+    telegram_connection_limit: int = 10
+    telegram_keepalive_timeout: float = 60.0
+    telegram_request_timeout: float = 10.0
+    notification_settings_cache_ttl: float = 60.0
+    
+    alert_coalesce_window: float = 60.0
+    alert_chat_rate: float = 1.0  # messages per second per chat
+    alert_chat_burst: int = 5
+    alert_max_retries: int = 3
+    alert_retry_backoff: float = 2.0
+    alert_queue_size: int = 1000
     
     admin_username: str = "admin"
     admin_password: str = "admin"
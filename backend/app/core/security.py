@@ -114,6 +114,9 @@ async def get_current_user(
             )
             db.add(notification_settings)
             db.commit()
+            
+            from app.services.alerts.notifier import notification_settings_cache
+            notification_settings_cache.invalidate()
         
         return user
     
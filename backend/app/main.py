@@ -2,6 +2,14 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import honeypots, credentials, events, auth, notifications
 from app.core.config import settings
+from app.services.events.pipeline import event_pipeline
+from app.services.events.stream import event_stream
+from app.services.events.incident_cache import incident_cache
+from app.services.events.aggregator import scan_aggregator
+from app.services.events.dedup import duplicate_filter
+from app.services.events.wire import EVENT_FORMATS, supported_encodings
+from app.services.alerts.dispatcher import alert_dispatcher
+from app.services.alerts.telegram import telegram_sessions
 from contextlib import asynccontextmanager
 import subprocess
 import sys
@@ -23,7 +31,24 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Migration error: {e}", file=sys.stderr)
     
+    await incident_cache.start()
+    await alert_dispatcher.start()
+    if settings.event_ingest_mode == "queue":
+        await event_pipeline.start()
+    elif settings.event_ingest_mode == "stream":
+        await event_stream.start()
+    await duplicate_filter.start()
+    await scan_aggregator.start()
+    
     yield
+    
+    await scan_aggregator.stop()
+    await event_pipeline.stop()
+    await event_stream.stop()
+    await duplicate_filter.stop()
+    await incident_cache.stop()
+    await alert_dispatcher.stop()
+    await telegram_sessions.close()
 
 app = FastAPI(
     title="Honey Potter",
@@ -55,4 +80,8 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {
+        "status": "ok",
+        "event_formats": EVENT_FORMATS,
+        "event_encodings": supported_encodings()
+    }
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, JSON
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, JSON, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -14,8 +14,20 @@ class IncidentStatus(str, enum.Enum):
     IGNORED = "ignored"
 
 
+OPEN_INCIDENT_CONDITION = text("status IN ('NEW', 'INVESTIGATING')")
+
+
 class Incident(Base):
     __tablename__ = "incidents"
+    __table_args__ = (
+        Index(
+            "uq_incidents_open_source",
+            "honeypot_id",
+            "source_ip",
+            unique=True,
+            postgresql_where=OPEN_INCIDENT_CONDITION
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     honeypot_id = Column(UUID(as_uuid=True), ForeignKey("honeypot_services.id"), nullable=False)
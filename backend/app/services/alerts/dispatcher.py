@@ -0,0 +1,232 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.alerts.telegram import TelegramNotifier
+
+
+class TokenBucket:
+    """Allows `rate` messages per second with bursts of up to `burst`."""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+    
+    def delay(self) -> float:
+        """Takes a token and returns how long to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class AlertDispatcher:
+    """Sends Telegram alerts from a background task, away from event processing.
+    
+    The first alert for an incident is sent right away; further alerts for
+    it within `coalesce_window` seconds are counted and sent as one summary
+    when the window closes. Messages go out through a per-chat token bucket
+    and are retried with exponential backoff (or the Bot API retry_after).
+    Level-3 alerts skip coalescing and the rate limiter and have their own
+    queue and sender, so they never wait behind throttled messages.
+    """
+    
+    def __init__(
+        self,
+        queue_size: int,
+        coalesce_window: float,
+        chat_rate: float,
+        chat_burst: int,
+        max_retries: int,
+        retry_backoff: float
+    ):
+        self.queue_size = queue_size
+        self.coalesce_window = coalesce_window
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._urgent: Optional[asyncio.Queue] = None
+        self._windows: Dict[tuple, Dict] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._notifiers: Dict[str, TelegramNotifier] = {}
+        self._tasks = []
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,
+            'summaries': 0,
+            'sent': 0,
+            'retried': 0,
+            'dropped': 0,
+            'rate_limited_ms': 0.0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._urgent = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._sender(self._queue), name="alert-sender"),
+            asyncio.create_task(self._sender(self._urgent), name="alert-sender-urgent"),
+            asyncio.create_task(self._window_loop(), name="alert-windows"),
+        ]
+        print(f"[ALERTS] Dispatcher started (window {self.coalesce_window}s, {self.chat_rate} msg/s per chat)")
+    
+    async def stop(self, timeout: float = 5.0):
+        if not self.running:
+            return
+        self._close_windows(force=True)
+        try:
+            await asyncio.wait_for(asyncio.gather(self._urgent.join(), self._queue.join()), timeout)
+        except asyncio.TimeoutError:
+            print(f"[ALERTS] Dropping {self._queue.qsize() + self._urgent.qsize()} unsent alerts on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def submit(
+        self,
+        bot_token: str,
+        chat_id: str,
+        level: int,
+        event: Dict,
+        incident: Optional[Dict] = None
+    ):
+        self._stats['submitted'] += 1
+        notifier = self._notifier(bot_token)
+        
+        if level >= 3 or event.get('event_type') == 'credential_reuse':
+            self._enqueue(bot_token, chat_id, notifier.format_alert(level, event, incident), urgent=True)
+            return
+        
+        key = (bot_token, chat_id, incident['id'] if incident else (event.get('honeypot_name'), event.get('source_ip')))
+        window = self._windows.get(key)
+        if window is not None:
+            window['count'] += 1
+            window['event'] = event
+            window['incident'] = incident
+            window['event_types'][event.get('event_type', 'unknown')] += 1
+            self._stats['coalesced'] += 1
+            return
+        
+        self._windows[key] = {
+            'closes_at': time.monotonic() + self.coalesce_window,
+            'count': 0,
+            'event': event,
+            'incident': incident,
+            'event_types': Counter(),
+        }
+        self._enqueue(bot_token, chat_id, notifier.format_alert(level, event, incident))
+    
+    def stats(self) -> Dict:
+        return {
+            'running': self.running,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'urgent_queue_depth': self._urgent.qsize() if self._urgent else 0,
+            'open_windows': len(self._windows),
+            **self._stats,
+            'rate_limited_ms': round(self._stats['rate_limited_ms'], 2),
+        }
+    
+    def _notifier(self, bot_token: str) -> TelegramNotifier:
+        notifier = self._notifiers.get(bot_token)
+        if notifier is None:
+            notifier = self._notifiers[bot_token] = TelegramNotifier(bot_token=bot_token)
+        return notifier
+    
+    def _enqueue(self, bot_token: str, chat_id: str, text: str, urgent: bool = False, attempt: int = 0):
+        message = {'bot_token': bot_token, 'chat_id': chat_id, 'text': text, 'urgent': urgent, 'attempt': attempt}
+        try:
+            (self._urgent if urgent else self._queue).put_nowait(message)
+        except asyncio.QueueFull:
+            self._stats['dropped'] += 1
+            print(f"[ALERTS] Queue full, dropping alert for chat {chat_id}")
+    
+    def _close_windows(self, force: bool = False):
+        now = time.monotonic()
+        for key, window in list(self._windows.items()):
+            if not force and window['closes_at'] > now:
+                continue
+            del self._windows[key]
+            if window['count'] == 0:
+                continue
+            
+            bot_token, chat_id, _ = key
+            text = self._notifier(bot_token).format_summary(
+                window['event'],
+                window['incident'],
+                window['count'],
+                self.coalesce_window,
+                window['event_types']
+            )
+            self._stats['summaries'] += 1
+            self._enqueue(bot_token, chat_id, text)
+    
+    async def _window_loop(self):
+        while True:
+            await asyncio.sleep(min(1.0, self.coalesce_window))
+            self._close_windows()
+    
+    async def _sender(self, queue: asyncio.Queue):
+        while True:
+            message = await queue.get()
+            try:
+                await self._send(message)
+            except Exception as e:
+                print(f"[ALERTS] Error sending alert: {e}")
+            finally:
+                queue.task_done()
+    
+    async def _send(self, message: Dict):
+        if not message['urgent']:
+            bucket = self._buckets.get(message['chat_id'])
+            if bucket is None:
+                bucket = self._buckets[message['chat_id']] = TokenBucket(self.chat_rate, self.chat_burst)
+            delay = bucket.delay()
+            if delay > 0:
+                self._stats['rate_limited_ms'] += delay * 1000
+                await asyncio.sleep(delay)
+        
+        notifier = self._notifier(message['bot_token'])
+        success, retry_after = await notifier.deliver(message['chat_id'], message['text'])
+        if success:
+            self._stats['sent'] += 1
+            return
+        
+        if message['attempt'] >= self.max_retries:
+            self._stats['dropped'] += 1
+            print(f"[ALERTS] Giving up on alert for chat {message['chat_id']} after {message['attempt'] + 1} attempts")
+            return
+        
+        delay = retry_after if retry_after is not None else self.retry_backoff * 2 ** message['attempt']
+        self._stats['retried'] += 1
+        asyncio.get_running_loop().call_later(
+            delay,
+            self._enqueue,
+            message['bot_token'],
+            message['chat_id'],
+            message['text'],
+            message['urgent'],
+            message['attempt'] + 1
+        )
+
+
+alert_dispatcher = AlertDispatcher(
+    queue_size=settings.alert_queue_size,
+    coalesce_window=settings.alert_coalesce_window,
+    chat_rate=settings.alert_chat_rate,
+    chat_burst=settings.alert_chat_burst,
+    max_retries=settings.alert_max_retries,
+    retry_backoff=settings.alert_retry_backoff
+)
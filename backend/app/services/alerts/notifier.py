@@ -1,67 +1,143 @@
-from sqlalchemy.orm import Session
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Optional
+from app.core.config import settings
 from app.models.notification_settings import NotificationSettings
 from app.models.user import User
+from app.services.alerts.dispatcher import alert_dispatcher
 from app.services.alerts.telegram import TelegramNotifier
 
 
+class NotificationSettingsCache:
+    """Snapshot of the admin user's notification settings.
+    
+    Loaded with one query and reused for `ttl` seconds, so the alert path
+    does not hit the database for every event. The notifications API calls
+    invalidate() after changing settings; the TTL covers changes made by
+    other processes.
+    """
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[Dict] = None
+        self._loaded_at: Optional[float] = None
+    
+    async def get(self, db: AsyncSession) -> Dict:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+            self._snapshot = await self._load(db)
+            self._loaded_at = time.monotonic()
+        return self._snapshot
+    
+    def invalidate(self):
+        self._loaded_at = None
+    
+    async def wants(self, db: AsyncSession, level: int) -> bool:
+        """Returns True if an event of `level` would be sent to Telegram under the current snapshot."""
+        snapshot = await self.get(db)
+        notification_settings = snapshot['settings']
+        return bool(
+            snapshot['user_active']
+            and notification_settings
+            and notification_settings['levels'].get(level, False)
+            and notification_settings['telegram_enabled']
+            and notification_settings['telegram_bot_token']
+            and notification_settings['telegram_chat_id']
+        )
+    
+    async def _load(self, db: AsyncSession) -> Dict:
+        result = await db.execute(
+            select(User.is_active, NotificationSettings)
+            .outerjoin(NotificationSettings, NotificationSettings.user_id == User.id)
+            .where(User.username == settings.admin_username)
+        )
+        row = result.first()
+        
+        if not row or not row.is_active:
+            return {'user_active': False, 'settings': None}
+        
+        notification_settings = row.NotificationSettings
+        if not notification_settings:
+            return {'user_active': True, 'settings': None}
+        
+        return {
+            'user_active': True,
+            'settings': {
+                'levels': {
+                    1: bool(notification_settings.level_1_enabled),
+                    2: bool(notification_settings.level_2_enabled),
+                    3: bool(notification_settings.level_3_enabled),
+                },
+                'telegram_enabled': notification_settings.telegram_enabled,
+                'telegram_bot_token': notification_settings.telegram_bot_token,
+                'telegram_chat_id': notification_settings.telegram_chat_id,
+            }
+        }
+
+
+notification_settings_cache = NotificationSettingsCache(ttl=settings.notification_settings_cache_ttl)
+
+
 class AlertNotifier:
     
     def __init__(self):
-        self.telegram = TelegramNotifier()
+        self._telegram: Dict[str, TelegramNotifier] = {}
+    
+    def get_telegram(self, bot_token: str) -> TelegramNotifier:
+        telegram_notifier = self._telegram.get(bot_token)
+        if telegram_notifier is None:
+            telegram_notifier = self._telegram[bot_token] = TelegramNotifier(bot_token=bot_token)
+        return telegram_notifier
     
     async def notify_event(
         self,
-        db: Session,
+        db: AsyncSession,
         level: int,
         event: Dict,
         incident: Optional[Dict] = None
     ):
-        from app.core.config import settings
+        snapshot = await notification_settings_cache.get(db)
         
-        user = db.query(User).filter(User.username == settings.admin_username).first()
-        
-        if not user or not user.is_active:
+        if not snapshot['user_active']:
             print(f"[NOTIFIER] Admin user not found or inactive")
             return
         
-        notification_settings = db.query(NotificationSettings).filter(
-            NotificationSettings.user_id == user.id
-        ).first()
-        
+        notification_settings = snapshot['settings']
         if not notification_settings:
             print(f"[NOTIFIER] Notification settings not found for admin user")
             return
         
-        should_notify = False
-        if level == 1:
-            should_notify = notification_settings.level_1_enabled
-        elif level == 2:
-            should_notify = notification_settings.level_2_enabled
-        elif level == 3:
-            should_notify = notification_settings.level_3_enabled
-        
-        if not should_notify:
+        if not notification_settings['levels'].get(level, False):
             print(f"[NOTIFIER] Level {level} notifications disabled in settings")
             return
         
-        if not notification_settings.telegram_enabled:
+        if not notification_settings['telegram_enabled']:
             print(f"[NOTIFIER] Telegram notifications disabled")
             return
         
-        if not notification_settings.telegram_bot_token or not notification_settings.telegram_chat_id:
+        if not notification_settings['telegram_bot_token'] or not notification_settings['telegram_chat_id']:
             missing = []
-            if not notification_settings.telegram_bot_token:
+            if not notification_settings['telegram_bot_token']:
                 missing.append("bot_token")
-            if not notification_settings.telegram_chat_id:
+            if not notification_settings['telegram_chat_id']:
                 missing.append("chat_id")
             print(f"[NOTIFIER] Telegram enabled but missing: {', '.join(missing)}")
             return
         
+        if alert_dispatcher.running:
+            alert_dispatcher.submit(
+                notification_settings['telegram_bot_token'],
+                notification_settings['telegram_chat_id'],
+                level,
+                event,
+                incident
+            )
+            return
+        
         try:
-            telegram_notifier = TelegramNotifier(bot_token=notification_settings.telegram_bot_token)
+            telegram_notifier = self.get_telegram(notification_settings['telegram_bot_token'])
             success = await telegram_notifier.send_alert(
-                notification_settings.telegram_chat_id,
+                notification_settings['telegram_chat_id'],
                 level,
                 event,
                 incident
@@ -72,3 +148,6 @@ class AlertNotifier:
                 print(f"[NOTIFIER] Successfully sent notification (level {level})")
         except Exception as e:
             print(f"[NOTIFIER] Error sending Telegram notification: {e}")
+
+
+alert_notifier = AlertNotifier()
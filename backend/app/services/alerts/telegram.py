@@ -1,20 +1,73 @@
+import asyncio
 from typing import Dict, Optional
 import aiohttp
 from app.core.config import settings
 
 
+class TelegramSessionPool:
+    """One long-lived aiohttp session per bot token.
+    
+    Connections to the Bot API are kept alive and reused between alerts
+    instead of paying a TCP+TLS handshake per message. Sessions are
+    created lazily and closed from the application lifespan.
+    """
+    
+    def __init__(self, connection_limit: int, keepalive_timeout: float, request_timeout: float):
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+    
+    def get(self, bot_token: str) -> aiohttp.ClientSession:
+        session = self._sessions.get(bot_token)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit,
+                    keepalive_timeout=self.keepalive_timeout
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+            self._sessions[bot_token] = session
+        return session
+    
+    async def close(self):
+        sessions, self._sessions = list(self._sessions.values()), {}
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+
+telegram_sessions = TelegramSessionPool(
+    connection_limit=settings.telegram_connection_limit,
+    keepalive_timeout=settings.telegram_keepalive_timeout,
+    request_timeout=settings.telegram_request_timeout
+)
+
+
 class TelegramNotifier:
     
     def __init__(self, bot_token: Optional[str] = None):
         self.bot_token = bot_token or settings.telegram_bot_token
         if self.bot_token:
-            self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+            self.base_url = f"{settings.telegram_api_url}/bot{self.bot_token}"
         else:
             self.base_url = None
     
     async def send_message(self, chat_id: str, text: str, parse_mode: str = "Markdown") -> bool:
+        success, _ = await self.deliver(chat_id, text, parse_mode)
+        return success
+    
+    async def deliver(
+        self,
+        chat_id: str,
+        text: str,
+        parse_mode: str = "Markdown"
+    ) -> tuple[bool, Optional[float]]:
+        """Sends a message and returns (success, retry_after).
+        
+        retry_after is set when the Bot API asked to slow down (HTTP 429).
+        """
         if not self.bot_token or not self.base_url:
-            return False
+            return False, None
         
         url = f"{self.base_url}/sendMessage"
         payload = {
@@ -24,16 +77,23 @@ class TelegramNotifier:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status != 200:
-                        response_text = await response.text()
-                        print(f"Telegram API error: {response.status} - {response_text}")
-                        return False
-                    return True
+            session = telegram_sessions.get(self.bot_token)
+            async with session.post(url, json=payload) as response:
+                if response.status != 200:
+                    response_text = await response.text()
+                    print(f"Telegram API error: {response.status} - {response_text}")
+                    retry_after = None
+                    if response.status == 429:
+                        try:
+                            retry_after = float((await response.json(content_type=None))['parameters']['retry_after'])
+                        except Exception:
+                            retry_after = 1.0
+                    return False, retry_after
+                await response.read()
+                return True, None
         except Exception as e:
             print(f"Failed to send Telegram message: {e}")
-            return False
+            return False, None
     
     async def send_alert(
         self,
@@ -42,6 +102,14 @@ class TelegramNotifier:
         event: Dict,
         incident: Optional[Dict] = None
     ) -> bool:
+        return await self.send_message(chat_id, self.format_alert(level, event, incident))
+    
+    def format_alert(
+        self,
+        level: int,
+        event: Dict,
+        incident: Optional[Dict] = None
+    ) -> str:
         event_type = event.get('event_type', 'unknown')
         details = event.get('details', {})
         
@@ -138,4 +206,40 @@ class TelegramNotifier:
             message += f"\nThis means attackers have already breached the server!\n"
             message += f"Urgently check the system!"
         
-        return await self.send_message(chat_id, message)
+        return message
+    
+    def format_summary(
+        self,
+        event: Dict,
+        incident: Optional[Dict],
+        count: int,
+        window: float,
+        event_types: Dict[str, int]
+    ) -> str:
+        if all(event_type.endswith('auth_attempt') or event_type == 'login_attempt' for event_type in event_types):
+            what = "auth attempts"
+        elif all(event_type.endswith('_query') or event_type == 'ssh_command' for event_type in event_types):
+            what = "commands/queries"
+        else:
+            what = "events"
+        
+        message = f"📊 *{count} more {what} from* `{event.get('source_ip', 'unknown')}` *in {window:g}s*\n\n"
+        
+        honeypot_name = event.get('honeypot_name')
+        honeypot_type = event.get('honeypot_type', 'unknown')
+        if honeypot_name:
+            message += f"*Honeypot:* `{honeypot_name}` ({honeypot_type})\n"
+        else:
+            message += f"*Honeypot:* `{honeypot_type}`\n"
+        message += f"*Last seen:* {event.get('timestamp', 'unknown')}\n"
+        
+        if len(event_types) > 1:
+            message += "\n*Event types:*\n"
+            for event_type, type_count in sorted(event_types.items(), key=lambda item: -item[1]):
+                message += f"`{event_type}`: {type_count}\n"
+        
+        if incident:
+            message += f"\n*Incident:* #{incident.get('id', 'unknown')[:8]}\n"
+            message += f"*Events in incident:* {incident.get('event_count', 0)}\n"
+        
+        return message
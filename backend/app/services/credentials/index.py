@@ -0,0 +1,134 @@
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.credential import Credential
+from app.services.credentials.matcher import HoneytokenMatcher
+
+
+class HoneytokenIndex:
+    """Process-wide index of honeytokens used by event ingest.
+    
+    Holds the compiled matcher and the id -> username map so that ingest
+    does not query the credentials table. CredentialStorage updates it in
+    place whenever it changes credentials. `version` grows with every
+    change, and a fingerprint of the table (row count and newest
+    generated_at) is re-checked at most every
+    `honeytoken_index_check_interval` seconds to pick up changes made by
+    other processes.
+    """
+    
+    def __init__(self):
+        self.matcher = HoneytokenMatcher()
+        self.usernames: Dict[str, str] = {}
+        self.version = 0
+        self.loaded = False
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = 0.0
+    
+    async def load(self, db: AsyncSession):
+        """Rebuilds the index from the credentials table.
+        
+        The fingerprint is read before the rows, so a credential committed in
+        between makes the next check see a change and reload rather than go
+        missing. The automaton is compiled in a worker thread.
+        """
+        version = self.version
+        fingerprint = await self._read_fingerprint_async(db)
+        result = await db.execute(select(Credential.id, Credential.username, Credential.password))
+        rows = result.all()
+        matcher, usernames = await asyncio.to_thread(self._build, rows)
+        
+        self.matcher = matcher
+        self.usernames = usernames
+        self.loaded = True
+        if self.version != version:
+            # Changed by this process during the rebuild; reload on the next check
+            fingerprint = None
+        self.version += 1
+        self._fingerprint = fingerprint
+        self._checked_at = time.monotonic() if fingerprint is not None else 0.0
+        print(f"[HONEYTOKENS] Index loaded: {len(usernames)} credentials (version {self.version})")
+    
+    @staticmethod
+    def _build(rows) -> tuple[HoneytokenMatcher, Dict[str, str]]:
+        matcher = HoneytokenMatcher()
+        usernames = {}
+        for row in rows:
+            credential_id = str(row.id)
+            matcher.add(credential_id, row.username, row.password)
+            usernames[credential_id] = row.username
+        matcher.compile()
+        return matcher, usernames
+    
+    def add(self, db: Session, credentials: Iterable[Credential]):
+        if not self.loaded:
+            return
+        
+        for cred in credentials:
+            credential_id = str(cred.id)
+            self.matcher.add(credential_id, cred.username, cred.password)
+            self.usernames[credential_id] = cred.username
+        self.version += 1
+        self._remember_fingerprint(db)
+    
+    def remove(self, credential_ids: Iterable, db: Optional[Session] = None):
+        """Drops credentials from the index.
+        
+        Without a session the change did not come from this process, so the
+        fingerprint is reset and the next ensure_fresh() reloads the index.
+        """
+        if not self.loaded:
+            return
+        
+        for credential_id in credential_ids:
+            credential_id = str(credential_id)
+            self.matcher.remove(credential_id)
+            self.usernames.pop(credential_id, None)
+        self.version += 1
+        
+        if db is not None:
+            self._remember_fingerprint(db)
+        else:
+            self._fingerprint = None
+            self._checked_at = 0.0
+    
+    async def is_stale(self, db: AsyncSession) -> bool:
+        return not self.loaded or self._fingerprint != await self._read_fingerprint_async(db)
+    
+    async def ensure_fresh(self, db: AsyncSession):
+        if not self.loaded:
+            await self.load(db)
+            return
+        
+        if time.monotonic() - self._checked_at < settings.honeytoken_index_check_interval:
+            return
+        
+        if await self.is_stale(db):
+            await self.load(db)
+        else:
+            self._checked_at = time.monotonic()
+    
+    def match(self, request_text: str) -> List[str]:
+        return self.matcher.match(request_text)
+    
+    def _read_fingerprint(self, db: Session) -> tuple:
+        count, newest = db.execute(self._fingerprint_query()).one()
+        return count, newest
+    
+    async def _read_fingerprint_async(self, db: AsyncSession) -> tuple:
+        count, newest = (await db.execute(self._fingerprint_query())).one()
+        return count, newest
+    
+    def _fingerprint_query(self):
+        return select(func.count(Credential.id), func.max(Credential.generated_at))
+    
+    def _remember_fingerprint(self, db: Session):
+        self._fingerprint = self._read_fingerprint(db)
+        self._checked_at = time.monotonic()
+
+
+honeytoken_index = HoneytokenIndex()
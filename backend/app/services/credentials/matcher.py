@@ -0,0 +1,184 @@
+import asyncio
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class HoneytokenMatcher:
+    """Aho-Corasick automaton over honeytoken usernames and passwords.
+    
+    All patterns are matched case-insensitively in a single pass over the
+    text, so the scan cost depends on the text length rather than on the
+    number of honeytokens.
+    
+    Credentials added after the automaton was compiled are kept in a small
+    pending set and checked directly; removed ones are filtered out of the
+    automaton output. The automaton is recompiled once either grows past
+    its threshold: in a worker thread when match() runs on an event loop,
+    since a build takes seconds for 100k tokens. Until the new automaton
+    is swapped in, matching goes on with the old one and the pending set.
+    """
+    
+    max_pending = 256
+    max_removed_ratio = 0.25
+    
+    def __init__(self):
+        self._patterns: Dict[str, Set[str]] = {}
+        self._credentials: Dict[str, tuple[Optional[str], Optional[str]]] = {}
+        self._compiled: Set[str] = set()
+        self._pending: Set[str] = set()
+        self._removed = 0
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[tuple[str, ...]] = [()]
+        self._compiling: Optional[asyncio.Task] = None
+    
+    @classmethod
+    def from_credentials(cls, credentials: Iterable) -> "HoneytokenMatcher":
+        matcher = cls()
+        for cred in credentials:
+            matcher.add(str(cred.id), cred.username, cred.password)
+        return matcher
+    
+    def __len__(self) -> int:
+        return len(self._credentials)
+    
+    def __contains__(self, credential_id: str) -> bool:
+        return credential_id in self._credentials
+    
+    def add(self, credential_id: str, username: Optional[str], password: Optional[str]):
+        if credential_id in self._credentials:
+            self.remove(credential_id)
+        
+        self._credentials[credential_id] = (username, password)
+        for value in (username, password):
+            if value:
+                pattern = value.lower()
+                self._patterns.setdefault(pattern, set()).add(credential_id)
+                if pattern not in self._compiled:
+                    self._pending.add(pattern)
+    
+    def remove(self, credential_id: str):
+        values = self._credentials.pop(credential_id, None)
+        if values is None:
+            return
+        
+        for value in values:
+            if not value:
+                continue
+            pattern = value.lower()
+            owners = self._patterns.get(pattern)
+            if owners is not None:
+                owners.discard(credential_id)
+                if not owners:
+                    del self._patterns[pattern]
+                    self._pending.discard(pattern)
+                    if pattern in self._compiled:
+                        self._removed += 1
+    
+    @property
+    def needs_compile(self) -> bool:
+        return (
+            len(self._pending) > self.max_pending
+            or self._removed > len(self._compiled) * self.max_removed_ratio
+        )
+    
+    def match(self, text: str) -> List[str]:
+        """Returns ids of all credentials found in text."""
+        if not text or not self._patterns:
+            return []
+        
+        if self.needs_compile:
+            self.schedule_compile()
+        
+        text = text.lower()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        
+        matched: List[str] = []
+        seen: Set[str] = set()
+        node = 0
+        
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            
+            if output[node]:
+                for pattern in output[node]:
+                    self._collect(pattern, matched, seen)
+        
+        for pattern in self._pending:
+            if pattern in text:
+                self._collect(pattern, matched, seen)
+        
+        return matched
+    
+    def _collect(self, pattern: str, matched: List[str], seen: Set[str]):
+        for credential_id in self._patterns.get(pattern, ()):
+            if credential_id not in seen:
+                seen.add(credential_id)
+                matched.append(credential_id)
+    
+    def compile(self):
+        self._install(self._build(list(self._patterns)))
+    
+    def schedule_compile(self):
+        """Starts a rebuild in a worker thread when called on a running loop; compiles inline otherwise."""
+        if self._compiling is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compile()
+            return
+        self._compiling = loop.create_task(self._compile_in_thread(list(self._patterns)))
+    
+    async def _compile_in_thread(self, patterns: List[str]):
+        try:
+            self._install(await asyncio.to_thread(self._build, patterns))
+        except Exception as e:
+            print(f"[HONEYTOKENS] Matcher rebuild failed: {e}")
+        finally:
+            self._compiling = None
+    
+    @staticmethod
+    def _build(patterns: List[str]) -> tuple:
+        """Builds the automaton for a snapshot of the patterns; touches no matcher state."""
+        goto: List[Dict[str, int]] = [{}]
+        output: List[tuple[str, ...]] = [()]
+        
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                next_node = goto[node].get(ch)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][ch] = next_node
+                    goto.append({})
+                    output.append(())
+                node = next_node
+            output[node] = (pattern,)
+        
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(ch, 0)
+                if output[fail[child]]:
+                    output[child] = output[child] + output[fail[child]]
+        
+        return goto, fail, output, set(patterns)
+    
+    def _install(self, automaton: tuple):
+        """Swaps in a built automaton; patterns added or removed since its snapshot stay pending or removed."""
+        self._goto, self._fail, self._output, self._compiled = automaton
+        self._pending = {pattern for pattern in self._patterns if pattern not in self._compiled}
+        self._removed = sum(1 for pattern in self._compiled if pattern not in self._patterns)
+
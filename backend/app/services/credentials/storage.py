@@ -1,6 +1,8 @@
 from sqlalchemy.orm import Session
 from app.models.credential import Credential
+from app.services.credentials.index import honeytoken_index
 from typing import Dict, List
+import uuid
 
 
 class CredentialStorage:
@@ -14,16 +16,8 @@ class CredentialStorage:
         service_id: str = None,
         meta_data: str = None
     ) -> Credential:
-        credential = Credential(
-            username=username,
-            password=password,
-            service_type=service_type,
-            service_id=service_id,
-            meta_data=meta_data
-        )
-        db.add(credential)
-        db.commit()
-        db.refresh(credential)
+        credential = self._insert(db, username, password, service_type, service_id, meta_data)
+        honeytoken_index.add(db, [credential])
         return credential
     
     async def save_multiple(
@@ -37,7 +31,7 @@ class CredentialStorage:
         for cred in credentials:
             token_meta_data = cred.get('meta_data') or meta_data
             
-            credential = await self.save_credential(
+            credential = self._insert(
                 db,
                 cred['username'],
                 cred['password'],
@@ -46,8 +40,43 @@ class CredentialStorage:
                 token_meta_data
             )
             saved.append(credential)
+        # One index update and fingerprint read for the whole batch
+        honeytoken_index.add(db, saved)
         return saved
     
+    def _insert(
+        self,
+        db: Session,
+        username: str,
+        password: str,
+        service_type: str,
+        service_id: str = None,
+        meta_data: str = None
+    ) -> Credential:
+        credential = Credential(
+            username=username,
+            password=password,
+            service_type=service_type,
+            service_id=service_id,
+            meta_data=meta_data
+        )
+        db.add(credential)
+        db.commit()
+        db.refresh(credential)
+        return credential
+    
+    async def delete_credential(self, db: Session, credential: Credential):
+        credential_id = credential.id
+        db.delete(credential)
+        db.commit()
+        honeytoken_index.remove([credential_id], db)
+    
+    async def bulk_delete_credentials(self, db: Session, credential_ids: List[uuid.UUID]) -> int:
+        deleted_count = db.query(Credential).filter(Credential.id.in_(credential_ids)).delete(synchronize_session=False)
+        db.commit()
+        honeytoken_index.remove(credential_ids, db)
+        return deleted_count
+    
     async def get_by_username(self, db: Session, username: str) -> Credential:
         return db.query(Credential).filter(Credential.username == username).first()
     
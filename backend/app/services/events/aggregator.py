@@ -0,0 +1,195 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.events.pipeline import event_pipeline
+from app.services.events.processor import EventProcessor
+from app.services.events.stream import event_stream
+
+WindowKey = tuple[str, str, str]
+
+
+class ScanAggregator:
+    """Collapses bursts of level-1 events from one source into summary rows.
+    
+    Events are counted per (honeypot_id, source_ip, event_type) in windows
+    of `window` seconds. The first `thresholds[event_type]` events of a
+    window are stored as usual; the rest are absorbed and, once the window
+    closes, written as one event carrying the first absorbed event's
+    details plus 'aggregated': the count, the first_seen and last_seen
+    times of the window's first and last events, and first_absorbed. The
+    incident still counts every absorbed event.
+    
+    Event types missing from `thresholds`, events of level 2 and above and
+    events that matched a honeytoken are never absorbed. Summaries go
+    through the configured ingest mode: the stream, the queue or a direct
+    batch write.
+    """
+    
+    def __init__(self, thresholds: Dict[str, int], window: float, max_keys: int, flush_interval: float):
+        self.thresholds = thresholds
+        self.window = window
+        self.max_keys = max_keys
+        self.flush_interval = flush_interval
+        self._windows: OrderedDict[WindowKey, Dict] = OrderedDict()
+        self._ready: List[Dict] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._stats = {
+            'absorbed': 0,
+            'summaries': 0,
+            'failed': 0,
+            'evictions': 0,
+        }
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.thresholds) and self._flusher is not None
+    
+    async def start(self):
+        if self._flusher is not None or not self.thresholds:
+            return
+        self._flusher = asyncio.create_task(self._flush_loop(), name="scan-aggregator-flusher")
+        print(f"[AGGREGATOR] Aggregating {', '.join(sorted(self.thresholds))} over {self.window:g}s windows")
+    
+    async def stop(self):
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self.flush(close_all=True)
+    
+    def absorb(self, event: Dict) -> bool:
+        """Counts a validated event; returns True if it was folded into a summary instead of being stored."""
+        threshold = self.thresholds.get(event['event_type'])
+        if not self.enabled or threshold is None or event['level'] >= 2 or event.get('honeytoken_id'):
+            return False
+        
+        key = (event['honeypot_id'], event['source_ip'], event['event_type'])
+        now = time.monotonic()
+        seen_at = datetime.now(timezone.utc)
+        window = self._windows.get(key)
+        if window is None or window['closes_at'] <= now:
+            if window is not None:
+                self._close(key)
+            window = {'seen': 0, 'count': 0, 'closes_at': now + self.window, 'first_seen': seen_at}
+            self._windows[key] = window
+            while len(self._windows) > self.max_keys:
+                self._close(next(iter(self._windows)))
+                self._stats['evictions'] += 1
+        
+        window['seen'] += 1
+        window['last_seen'] = seen_at
+        if window['seen'] <= threshold:
+            return False
+        
+        if window['count'] == 0:
+            window['sample'] = event
+            window['first_absorbed'] = seen_at
+        window['count'] += 1
+        self._stats['absorbed'] += 1
+        return True
+    
+    async def flush(self, close_all: bool = False):
+        """Writes summaries of the windows that have closed, or of every window when `close_all`."""
+        now = time.monotonic()
+        for key in [key for key, window in self._windows.items() if close_all or window['closes_at'] <= now]:
+            self._close(key)
+        
+        if not self._ready:
+            return
+        summaries, self._ready = self._ready, []
+        try:
+            await self._emit(summaries)
+        except Exception as e:
+            self._stats['failed'] += len(summaries)
+            print(f"[AGGREGATOR] Dropped {len(summaries)} summaries: {e}")
+    
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'thresholds': self.thresholds,
+            'window': self.window,
+            'open_windows': len(self._windows),
+            'pending_summaries': len(self._ready),
+            **self._stats
+        }
+    
+    def _close(self, key: WindowKey):
+        window = self._windows.pop(key)
+        if not window['count']:
+            return
+        
+        sample = window['sample']
+        self._ready.append({
+            'honeypot_id': sample['honeypot_id'],
+            'event_type': sample['event_type'],
+            'level': sample['level'],
+            'source_ip': sample['source_ip'],
+            'details': {
+                **sample['details'],
+                'aggregated': {
+                    'count': window['count'],
+                    'first_seen': window['first_seen'].isoformat(),
+                    'last_seen': window['last_seen'].isoformat(),
+                    'first_absorbed': window['first_absorbed'].isoformat(),
+                    'window_seconds': self.window
+                }
+            },
+            'honeytoken_id': None,
+            'count': window['count']
+        })
+    
+    async def _emit(self, summaries: List[Dict]):
+        if event_stream.running:
+            await event_stream.submit_many(summaries)
+            self._stats['summaries'] += len(summaries)
+            return
+        
+        if event_pipeline.running:
+            for i, summary in enumerate(summaries):
+                try:
+                    event_pipeline.submit(summary)
+                except asyncio.QueueFull:
+                    # Write what the queue has no room for directly
+                    summaries = summaries[i:]
+                    break
+                self._stats['summaries'] += 1
+            else:
+                return
+        
+        processor = EventProcessor()
+        async with AsyncSessionLocal() as db:
+            try:
+                await processor.process_batch(db, summaries)
+                self._stats['summaries'] += len(summaries)
+            except Exception as e:
+                await db.rollback()
+                print(f"[AGGREGATOR] Batch of {len(summaries)} summaries failed, retrying one by one: {e}")
+                for summary in summaries:
+                    try:
+                        await processor.process_batch(db, [summary])
+                        self._stats['summaries'] += 1
+                    except Exception as item_error:
+                        await db.rollback()
+                        self._stats['failed'] += 1
+                        print(f"[AGGREGATOR] Dropped summary of {summary['count']} events from {summary['source_ip']}: {item_error}")
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[AGGREGATOR] Flush error: {e}")
+
+
+scan_aggregator = ScanAggregator(
+    thresholds=settings.event_aggregation_thresholds,
+    window=settings.event_aggregation_window,
+    max_keys=settings.event_aggregation_max_keys,
+    flush_interval=settings.event_aggregation_flush_interval
+)
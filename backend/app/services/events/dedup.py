@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+_apply_repeats = text("""
+    WITH repeats AS (
+        SELECT *
+        FROM unnest(CAST(:ids AS uuid[]), CAST(:counts AS integer[]), CAST(:seen_at AS timestamptz[]))
+            AS r(id, count, seen_at)
+    ), updated AS (
+        UPDATE events
+        SET details = (
+            COALESCE(events.details::jsonb, '{}'::jsonb) || jsonb_build_object(
+                'repeat_count', COALESCE((events.details->>'repeat_count')::integer, 0) + repeats.count,
+                'last_repeat_at', repeats.seen_at
+            )
+        )::json
+        FROM repeats
+        WHERE events.id = repeats.id
+        RETURNING events.id, events.incident_id, repeats.count, repeats.seen_at
+    ), incident_totals AS (
+        UPDATE incidents
+        SET event_count = incidents.event_count + totals.count,
+            last_seen = GREATEST(incidents.last_seen, totals.seen_at)
+        FROM (
+            SELECT incident_id, SUM(count) AS count, MAX(seen_at) AS seen_at
+            FROM updated
+            WHERE incident_id IS NOT NULL
+            GROUP BY incident_id
+        ) AS totals
+        WHERE incidents.id = totals.incident_id
+    )
+    SELECT id FROM updated
+""")
+
+
+class DuplicateFilter:
+    """Bounded TTL set of recently stored event fingerprints.
+    
+    A fingerprint is a hash of honeypot_id, source_ip, event_type and the
+    details without `volatile_fields` (source port, connection id). An
+    event whose fingerprint was stored less than `ttl` seconds ago is not
+    written again: repeat() returns the id of the original event and the
+    repeat is added to its details.repeat_count, last_repeat_at and its
+    incident's event_count by a background task every `flush_interval`
+    seconds.
+    
+    Originals written by the queue or the stream may not be in the table
+    yet when their repeats are flushed; those repeats are kept for
+    `max_attempts` flushes. Events that matched a honeytoken are never
+    suppressed. The set is only used while the flusher is running.
+    """
+    
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        flush_interval: float,
+        volatile_fields: Iterable[str],
+        max_attempts: int = 10
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.volatile_fields = frozenset(volatile_fields)
+        self.max_attempts = max_attempts
+        self._entries: OrderedDict[bytes, Dict] = OrderedDict()
+        self._pending: Dict[uuid.UUID, Dict] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._stats = {
+            'duplicates': 0,
+            'evictions': 0,
+            'flushes': 0,
+            'flushed_events': 0,
+            'dropped_repeats': 0,
+            'flush_errors': 0,
+        }
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self._flusher is not None
+    
+    async def start(self):
+        if self._flusher is not None or self.max_size <= 0:
+            return
+        self._flusher = asyncio.create_task(self._flush_loop(), name="duplicate-filter-flusher")
+        print(f"[DEDUP] Duplicate filter started (size {self.max_size}, ttl {self.ttl}s)")
+    
+    async def stop(self):
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self.flush()
+        self._entries.clear()
+    
+    def key(self, event: Dict) -> Optional[bytes]:
+        """Returns the fingerprint of an event, or None if it must always be stored."""
+        if not self.enabled or event.get('honeytoken_id'):
+            return None
+        
+        details = event['details'] or {}
+        payload = json.dumps(
+            [
+                event['honeypot_id'],
+                event['source_ip'],
+                event['event_type'],
+                {name: value for name, value in details.items() if name not in self.volatile_fields}
+            ],
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str
+        )
+        return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+    
+    def repeat(self, key: Optional[bytes]) -> Optional[uuid.UUID]:
+        """Counts a repeat of a stored event; returns the original's id, or None if the event is new."""
+        if key is None:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is None or entry['expires_at'] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            return None
+        
+        seen_at = datetime.now(timezone.utc)
+        pending = self._pending.get(entry['id'])
+        if pending is None:
+            self._pending[entry['id']] = {'count': 1, 'seen_at': seen_at, 'attempts': 0}
+        else:
+            pending['count'] += 1
+            pending['seen_at'] = seen_at
+        self._stats['duplicates'] += 1
+        return entry['id']
+    
+    def remember(self, key: Optional[bytes], event_id: uuid.UUID):
+        if key is None or not self.enabled:
+            return
+        
+        self._entries.pop(key, None)
+        self._entries[key] = {'id': uuid.UUID(str(event_id)), 'expires_at': time.monotonic() + self.ttl}
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+    
+    def forget(self, keys: Iterable[Optional[bytes]]):
+        """Drops fingerprints of events that could not be stored."""
+        for key in keys:
+            if key is not None:
+                self._entries.pop(key, None)
+    
+    async def flush(self):
+        if not self._pending:
+            return
+        
+        pending, self._pending = self._pending, {}
+        ids = list(pending)
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(_apply_repeats, {
+                    'ids': ids,
+                    'counts': [pending[event_id]['count'] for event_id in ids],
+                    'seen_at': [pending[event_id]['seen_at'] for event_id in ids]
+                })
+                updated = set(result.scalars())
+                await db.commit()
+        except Exception as e:
+            self._restore(pending)
+            self._stats['flush_errors'] += 1
+            print(f"[DEDUP] Failed to flush repeats of {len(ids)} events: {e}")
+            return
+        
+        self._stats['flushes'] += 1
+        self._stats['flushed_events'] += len(updated)
+        # Originals still in the queue or the stream are retried on the next flush
+        missing = {event_id: repeats for event_id, repeats in pending.items() if event_id not in updated}
+        for repeats in missing.values():
+            repeats['attempts'] += 1
+        dropped = [event_id for event_id, repeats in missing.items() if repeats['attempts'] >= self.max_attempts]
+        for event_id in dropped:
+            self._stats['dropped_repeats'] += missing.pop(event_id)['count']
+        self._restore(missing)
+    
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'pending_events': len(self._pending),
+            **self._stats
+        }
+    
+    def _restore(self, pending: Dict[uuid.UUID, Dict]):
+        for event_id, repeats in pending.items():
+            current = self._pending.get(event_id)
+            if current is None:
+                self._pending[event_id] = repeats
+            else:
+                current['count'] += repeats['count']
+                current['seen_at'] = max(current['seen_at'], repeats['seen_at'])
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+duplicate_filter = DuplicateFilter(
+    max_size=settings.event_dedup_size,
+    ttl=settings.event_dedup_ttl,
+    flush_interval=settings.event_dedup_flush_interval,
+    volatile_fields=settings.event_dedup_volatile_fields
+)
@@ -0,0 +1,198 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy import bindparam, func, update
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.incident import Incident
+
+IncidentKey = tuple[uuid.UUID, str]
+
+_incidents = Incident.__table__
+
+_apply_deltas = (
+    update(_incidents)
+    .where(_incidents.c.id == bindparam('incident_id'))
+    .values(
+        event_count=_incidents.c.event_count + bindparam('delta'),
+        threat_level=func.greatest(_incidents.c.threat_level, bindparam('level')),
+        last_seen=func.greatest(_incidents.c.last_seen, bindparam('seen_at'))
+    )
+)
+
+
+class OpenIncidentCache:
+    """LRU/TTL cache of open incident ids keyed by (honeypot_id, source_ip).
+    
+    A hit lets EventProcessor attach events to the incident without
+    touching the incidents table: the counter, threat level and last_seen
+    deltas are accumulated in memory and written by a background task
+    every `flush_interval` seconds with one executemany UPDATE.
+    
+    Entries expire after `ttl` seconds so incidents closed by another
+    process stop receiving events within that window. The cache is only
+    used while the flusher is running.
+    """
+    
+    def __init__(self, max_size: int, ttl: float, flush_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._entries: OrderedDict[IncidentKey, Dict] = OrderedDict()
+        self._keys_by_id: Dict[uuid.UUID, IncidentKey] = {}
+        self._pending: Dict[uuid.UUID, Dict] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'flushes': 0,
+            'flushed_incidents': 0,
+            'flush_errors': 0,
+        }
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self._flusher is not None
+    
+    async def start(self):
+        if self._flusher is not None or self.max_size <= 0:
+            return
+        self._flusher = asyncio.create_task(self._flush_loop(), name="incident-cache-flusher")
+        print(f"[INCIDENTS] Open incident cache started (size {self.max_size}, ttl {self.ttl}s)")
+    
+    async def stop(self):
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        await self.flush()
+        self.clear()
+    
+    def get(self, key: IncidentKey) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is None or entry['expires_at'] <= time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self._stats['misses'] += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        return entry
+    
+    def put(self, key: IncidentKey, incident_id: uuid.UUID, event_count: int):
+        if not self.enabled:
+            return
+        
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = {
+            'id': incident_id,
+            'event_count': event_count,
+            'expires_at': time.monotonic() + self.ttl
+        }
+        self._keys_by_id[incident_id] = key
+        
+        while len(self._entries) > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self._keys_by_id.pop(evicted['id'], None)
+            self._stats['evictions'] += 1
+    
+    def record(self, entry: Dict, count: int, level: int, seen_at: datetime) -> int:
+        """Adds stored events to an entry returned by get() and returns its event_count after them."""
+        entry['event_count'] += count
+        
+        pending = self._pending.get(entry['id'])
+        if pending is None:
+            self._pending[entry['id']] = {'delta': count, 'level': level, 'seen_at': seen_at}
+        else:
+            pending['delta'] += count
+            pending['level'] = max(pending['level'], level)
+            pending['seen_at'] = max(pending['seen_at'], seen_at)
+        return entry['event_count']
+    
+    def invalidate(self, incident_id: uuid.UUID):
+        """Forgets the incident; its pending deltas are still written by the next flush."""
+        key = self._keys_by_id.get(incident_id)
+        if key is not None:
+            self._drop(key)
+            self._stats['invalidations'] += 1
+    
+    def forget(self, keys: Iterable[IncidentKey]):
+        """Drops entries whose incident could not be used, e.g. after a failed write."""
+        for key in keys:
+            self._drop(key)
+    
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_id.clear()
+    
+    async def flush(self):
+        if not self._pending:
+            return
+        
+        pending, self._pending = self._pending, {}
+        params = [
+            {'incident_id': incident_id, **delta}
+            for incident_id, delta in pending.items()
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(_apply_deltas, params)
+                await db.commit()
+        except Exception as e:
+            self._restore(pending)
+            self._stats['flush_errors'] += 1
+            print(f"[INCIDENTS] Failed to flush {len(params)} incident counters: {e}")
+            return
+        
+        self._stats['flushes'] += 1
+        self._stats['flushed_incidents'] += len(params)
+    
+    def stats(self) -> Dict:
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'pending_incidents': len(self._pending),
+            'hit_ratio': round(self._stats['hits'] / lookups, 4) if lookups else 0.0,
+            **self._stats
+        }
+    
+    def _drop(self, key: IncidentKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._keys_by_id.pop(entry['id'], None)
+    
+    def _restore(self, pending: Dict[uuid.UUID, Dict]):
+        for incident_id, delta in pending.items():
+            current = self._pending.get(incident_id)
+            if current is None:
+                self._pending[incident_id] = delta
+            else:
+                current['delta'] += delta['delta']
+                current['level'] = max(current['level'], delta['level'])
+                current['seen_at'] = max(current['seen_at'], delta['seen_at'])
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+incident_cache = OpenIncidentCache(
+    max_size=settings.incident_cache_size,
+    ttl=settings.incident_cache_ttl,
+    flush_interval=settings.incident_cache_flush_interval
+)
@@ -0,0 +1,159 @@
+import asyncio
+import time
+import uuid
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.events.processor import EventProcessor
+
+
+class EventPipeline:
+    """Bounded in-process queue drained by a pool of batching writer tasks.
+    
+    submit() only enqueues, so the ingest endpoint can acknowledge as soon
+    as an event is validated. Writers collect up to `batch_size` events or
+    wait at most `flush_interval` seconds, then store the batch through
+    EventProcessor.process_batch.
+    """
+    
+    def __init__(
+        self,
+        queue_size: int,
+        writer_count: int,
+        batch_size: int,
+        flush_interval: float
+    ):
+        self.queue_size = queue_size
+        self.writer_count = writer_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._writers: List[asyncio.Task] = []
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._writers)
+    
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._writers = [
+            asyncio.create_task(self._writer(), name=f"event-writer-{i}")
+            for i in range(self.writer_count)
+        ]
+        print(f"[PIPELINE] Started {self.writer_count} writers (queue {self.queue_size}, batch {self.batch_size})")
+    
+    async def stop(self):
+        if not self.running:
+            return
+        await self._queue.join()
+        for task in self._writers:
+            task.cancel()
+        await asyncio.gather(*self._writers, return_exceptions=True)
+        self._writers = []
+        print(f"[PIPELINE] Stopped, {self._stats['written']} events written")
+    
+    def submit(self, event: Dict) -> uuid.UUID:
+        """Enqueues an event and returns its pre-assigned id.
+        
+        Raises asyncio.QueueFull when the pipeline is saturated.
+        """
+        if not self.running:
+            raise RuntimeError("Event pipeline is not running")
+        
+        event.setdefault('id', uuid.uuid4())
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._stats['rejected'] += 1
+            raise
+        self._stats['enqueued'] += 1
+        return event['id']
+    
+    def stats(self) -> Dict:
+        batches = self._stats['batches']
+        return {
+            'running': self.running,
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'queue_size': self.queue_size,
+            'writers': self.writer_count,
+            'batch_size': self.batch_size,
+            'flush_interval': self.flush_interval,
+            'enqueued': self._stats['enqueued'],
+            'rejected': self._stats['rejected'],
+            'written': self._stats['written'],
+            'failed': self._stats['failed'],
+            'batches': batches,
+            'last_batch_size': self._stats['last_batch_size'],
+            'avg_batch_size': round(self._stats['written'] / batches, 2) if batches else 0.0,
+            'last_flush_ms': round(self._stats['last_flush_ms'], 2),
+            'avg_flush_ms': round(self._stats['total_flush_ms'] / batches, 2) if batches else 0.0,
+            'max_flush_ms': round(self._stats['max_flush_ms'], 2),
+        }
+    
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _flush(self, batch: List[Dict]):
+        started = time.perf_counter()
+        processor = EventProcessor()
+        async with AsyncSessionLocal() as db:
+            try:
+                await processor.process_batch(db, batch)
+                self._stats['written'] += len(batch)
+            except Exception as e:
+                await db.rollback()
+                print(f"[PIPELINE] Batch of {len(batch)} failed, retrying one by one: {e}")
+                for event in batch:
+                    try:
+                        await processor.process_batch(db, [event])
+                        self._stats['written'] += 1
+                    except Exception as item_error:
+                        await db.rollback()
+                        self._stats['failed'] += 1
+                        print(f"[PIPELINE] Dropped event {event.get('id')}: {item_error}")
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats['batches'] += 1
+        self._stats['last_batch_size'] = len(batch)
+        self._stats['last_flush_ms'] = elapsed_ms
+        self._stats['total_flush_ms'] += elapsed_ms
+        self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
+
+
+event_pipeline = EventPipeline(
+    queue_size=settings.event_queue_size,
+    writer_count=settings.event_writer_count,
+    batch_size=settings.event_batch_size,
+    flush_interval=settings.event_flush_interval
+)
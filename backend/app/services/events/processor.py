@@ -1,111 +1,277 @@
-from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
 from app.models.event import Event
-from app.models.incident import Incident, IncidentStatus
+from app.models.incident import Incident, IncidentStatus, OPEN_INCIDENT_CONDITION
 from app.models.honeypot import HoneypotService
-from typing import Dict, Optional
+from app.services.credentials.index import honeytoken_index
+from app.services.events.incident_cache import OpenIncidentCache, incident_cache
+from typing import Dict, List, Optional
 import uuid
 
 
 class EventProcessor:
     
+    def __init__(self, cache: OpenIncidentCache = incident_cache):
+        self.cache = cache
+    
     async def process_event(
         self,
-        db: Session,
+        db: AsyncSession,
         honeypot_id: str,
         event_type: str,
         level: int,
         source_ip: str,
         details: Dict,
         honeytoken_id: Optional[str] = None
-    ) -> tuple[Event, Optional[Incident]]:
+    ) -> tuple[Event, Dict]:
+        """Stores one event and bumps its open incident.
+        
+        Returns the event and the incident it was attached to as
+        {'id', 'event_count'}.
+        """
         honeypot_uuid = uuid.UUID(honeypot_id)
+        now = datetime.now(timezone.utc)
+        key = (honeypot_uuid, source_ip)
+        
+        cached = self.cache.get(key)
+        if cached:
+            incident_id = cached['id']
+        else:
+            incident_id, event_count = await self._upsert_incident(
+                db, honeypot_uuid, source_ip, level, 1, now
+            )
         
         event = Event(
             honeypot_id=honeypot_uuid,
+            incident_id=incident_id,
             event_type=event_type,
             level=level,
             source_ip=source_ip,
             honeytoken_id=uuid.UUID(honeytoken_id) if honeytoken_id else None,
+            timestamp=now,
             details=details
         )
         db.add(event)
-        db.flush()
-        
-        incident = await self._get_or_create_incident(
-            db, honeypot_uuid, source_ip, level
-        )
+        try:
+            await db.commit()
+        except Exception:
+            self.cache.forget([key])
+            raise
         
-        if incident:
-            event.incident_id = incident.id
-            incident.event_count += 1
-            incident.last_seen = datetime.utcnow()
-            if level > incident.threat_level:
-                incident.threat_level = level
-                if level == 3 and incident.status == IncidentStatus.RESOLVED:
-                    incident.status = IncidentStatus.NEW
+        if cached:
+            event_count = self.cache.record(cached, 1, level, now)
+        else:
+            self.cache.put(key, incident_id, event_count)
         
-        db.commit()
-        db.refresh(event)
+        incident = {'id': str(incident_id), 'event_count': event_count}
+        if not await self._wants_alert(db, level):
+            return event, incident
         
-        from app.services.alerts.notifier import AlertNotifier
-        from app.models.honeypot import HoneypotService
-        
-        honeypot = db.query(HoneypotService).filter(HoneypotService.id == honeypot_uuid).first()
+        honeypot = await db.get(HoneypotService, honeypot_uuid)
         
         honeytoken_username = None
         if honeytoken_id:
-            from app.models.credential import Credential
-            credential = db.query(Credential).filter(Credential.id == uuid.UUID(honeytoken_id)).first()
-            if credential:
-                honeytoken_username = credential.username
+            honeytoken_username = honeytoken_index.usernames.get(str(honeytoken_id))
         
-        notifier = AlertNotifier()
-        await notifier.notify_event(
-            db=db,
-            level=event.level,
-            event={
-                'honeypot_type': honeypot.type if honeypot else 'unknown',
-                'honeypot_name': honeypot.name if honeypot else None,
-                'source_ip': source_ip,
-                'timestamp': event.timestamp.isoformat(),
-                'event_type': event_type,
-                'honeytoken_username': honeytoken_username or details.get('honeytoken_username'),
-                'details': details
+        alert = self._build_alert(
+            {
+                'level': event.level,
+                'source_ip': event.source_ip,
+                'timestamp': event.timestamp,
+                'event_type': event.event_type,
+                'details': event.details
             },
-            incident={
-                'id': str(incident.id) if incident else None,
-                'event_count': incident.event_count if incident else 1
-            } if incident else None
+            incident,
+            honeypot,
+            honeytoken_username
         )
+        await self._notify(db, *alert)
         
         return event, incident
     
-    async def _get_or_create_incident(
+    async def process_batch(
         self,
-        db: Session,
+        db: AsyncSession,
+        events: List[Dict]
+    ) -> List[uuid.UUID]:
+        """Stores a batch of events and their incident updates in a single transaction.
+        
+        Each item carries the same fields as process_event() arguments and may
+        carry a pre-assigned 'id' and, for scan summaries, the 'count' of
+        events it stands for, added to the incident instead of 1. Events are
+        written with one multi-row INSERT and every incident touched by the
+        batch is upserted once, or not at all when it is found in the open
+        incident cache.
+        Returns the ids of the stored events in input order.
+        """
+        now = datetime.now(timezone.utc)
+        groups: Dict[tuple[uuid.UUID, str], Dict] = {}
+        rows = []
+        counts = []
+        
+        for item in events:
+            honeypot_uuid = uuid.UUID(item['honeypot_id'])
+            honeytoken_id = item.get('honeytoken_id')
+            
+            key = (honeypot_uuid, item['source_ip'])
+            group = groups.setdefault(key, {'count': 0, 'level': item['level']})
+            group['count'] += item.get('count', 1)
+            group['level'] = max(group['level'], item['level'])
+            counts.append(item.get('count', 1))
+            
+            rows.append({
+                'id': uuid.UUID(str(item['id'])) if item.get('id') else uuid.uuid4(),
+                'honeypot_id': honeypot_uuid,
+                'incident_id': None,
+                'event_type': item['event_type'],
+                'level': item['level'],
+                'source_ip': item['source_ip'],
+                'honeytoken_id': uuid.UUID(honeytoken_id) if honeytoken_id else None,
+                'timestamp': now,
+                'details': item['details']
+            })
+        
+        incidents: Dict[tuple[uuid.UUID, str], Dict] = {}
+        for key, group in sorted(groups.items(), key=lambda g: (str(g[0][0]), g[0][1])):
+            cached = self.cache.get(key)
+            if cached:
+                incidents[key] = {'id': cached['id'], 'cached': cached}
+                continue
+            
+            honeypot_uuid, source_ip = key
+            incident_id, event_count = await self._upsert_incident(
+                db, honeypot_uuid, source_ip, group['level'], group['count'], now
+            )
+            incidents[key] = {'id': incident_id, 'event_count': event_count}
+        
+        for row in rows:
+            row['incident_id'] = incidents[(row['honeypot_id'], row['source_ip'])]['id']
+        
+        if rows:
+            try:
+                await db.execute(insert(Event), rows)
+                await db.commit()
+            except Exception:
+                self.cache.forget(groups)
+                raise
+        
+        for key, group in groups.items():
+            incident = incidents[key]
+            if 'cached' in incident:
+                incident['event_count'] = self.cache.record(incident['cached'], group['count'], group['level'], now)
+            else:
+                self.cache.put(key, incident['id'], incident['event_count'])
+            incident['event_count'] -= group['count']
+        
+        # Levels nobody is notified about cost no honeypot lookup and no alert
+        alert_levels = set()
+        for level in {row['level'] for row in rows}:
+            if await self._wants_alert(db, level):
+                alert_levels.add(level)
+        
+        honeypots = {}
+        honeypot_ids = {row['honeypot_id'] for row in rows if row['level'] in alert_levels}
+        if honeypot_ids:
+            result = await db.execute(
+                select(HoneypotService).where(HoneypotService.id.in_(honeypot_ids))
+            )
+            honeypots = {honeypot.id: honeypot for honeypot in result.scalars()}
+        
+        alerts = []
+        for row, count in zip(rows, counts):
+            incident = incidents[(row['honeypot_id'], row['source_ip'])]
+            incident['event_count'] += count
+            if row['level'] not in alert_levels:
+                continue
+            incident_info = {'id': str(incident['id']), 'event_count': incident['event_count']}
+            alerts.append(self._build_alert(row, incident_info, honeypots.get(row['honeypot_id'])))
+        
+        for alert in alerts:
+            await self._notify(db, *alert)
+        
+        return [row['id'] for row in rows]
+    
+    def _build_alert(
+        self,
+        event: Dict,
+        incident: Optional[Dict],
+        honeypot: Optional[HoneypotService],
+        honeytoken_username: Optional[str] = None
+    ) -> tuple[int, Dict, Optional[Dict]]:
+        details = event['details'] or {}
+        
+        event_info = {
+            'honeypot_type': honeypot.type if honeypot else 'unknown',
+            'honeypot_name': honeypot.name if honeypot else None,
+            'source_ip': event['source_ip'],
+            'timestamp': event['timestamp'].isoformat(),
+            'event_type': event['event_type'],
+            'honeytoken_username': honeytoken_username or details.get('honeytoken_username'),
+            'details': details
+        }
+        
+        return event['level'], event_info, incident
+    
+    async def _wants_alert(self, db: AsyncSession, level: int) -> bool:
+        from app.services.alerts.notifier import notification_settings_cache
+        
+        return await notification_settings_cache.wants(db, level)
+    
+    async def _notify(
+        self,
+        db: AsyncSession,
+        level: int,
+        event: Dict,
+        incident: Optional[Dict]
+    ):
+        from app.services.alerts.notifier import alert_notifier
+        
+        await alert_notifier.notify_event(
+            db=db,
+            level=level,
+            event=event,
+            incident=incident
+        )
+    
+    async def _upsert_incident(
+        self,
+        db: AsyncSession,
         honeypot_id: uuid.UUID,
         source_ip: str,
-        level: int
-    ) -> Optional[Incident]:
-        incident = db.query(Incident).filter(
-            Incident.honeypot_id == honeypot_id,
-            Incident.source_ip == source_ip,
-            Incident.status.in_([IncidentStatus.NEW, IncidentStatus.INVESTIGATING])
-        ).first()
-        
-        if incident:
-            return incident
-        
-        incident = Incident(
+        level: int,
+        count: int,
+        seen_at: datetime
+    ) -> tuple[uuid.UUID, int]:
+        """Opens an incident for the attacker or adds `count` events to the open one.
+        
+        A single INSERT ... ON CONFLICT against the partial unique index on
+        open incidents, so concurrent writers never create duplicates and
+        the counters are updated inside the database.
+        Returns the incident id and its event_count after the update.
+        """
+        stmt = pg_insert(Incident).values(
+            id=uuid.uuid4(),
             honeypot_id=honeypot_id,
             source_ip=source_ip,
             threat_level=level,
             status=IncidentStatus.NEW,
-            event_count=0,
+            event_count=count,
+            first_seen=seen_at,
+            last_seen=seen_at,
             details={}
         )
-        db.add(incident)
-        db.flush()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Incident.honeypot_id, Incident.source_ip],
+            index_where=OPEN_INCIDENT_CONDITION,
+            set_={
+                'event_count': Incident.event_count + stmt.excluded.event_count,
+                'threat_level': func.greatest(Incident.threat_level, stmt.excluded.threat_level),
+                'last_seen': stmt.excluded.last_seen
+            }
+        ).returning(Incident.id, Incident.event_count)
         
-        return incident
+        result = await db.execute(stmt)
+        incident_id, event_count = result.one()
+        return incident_id, event_count
@@ -1,2 +1,251 @@
-# Event stream
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.event import Event
+from app.services.events.processor import EventProcessor
 
+
+class EventStream:
+    """Durable ingest bus on a Redis Stream.
+    
+    submit() appends events to the stream and returns as soon as Redis has
+    them. A pool of consumers in the `group` consumer group reads batches
+    with XREADGROUP, stores them through EventProcessor.process_batch and
+    acknowledges them only after the transaction commits. Entries left
+    unacknowledged by a crashed or restarted consumer are reclaimed with
+    XAUTOCLAIM once idle for `claim_idle_ms`, so several backend processes
+    can share one stream without losing events.
+    
+    Every event carries its id from submit(), so reclaimed entries that a
+    previous consumer already committed are skipped instead of being
+    written twice.
+    """
+    
+    def __init__(
+        self,
+        redis_url: str,
+        stream: str,
+        group: str,
+        consumer_count: int,
+        batch_size: int,
+        block_ms: int,
+        maxlen: int,
+        claim_idle_ms: int
+    ):
+        self.redis_url = redis_url
+        self.stream = stream
+        self.group = group
+        self.consumer_count = consumer_count
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.maxlen = maxlen
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._redis: Optional[aioredis.Redis] = None
+        self._consumers: List[asyncio.Task] = []
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'failed': 0,
+            'batches': 0,
+            'reclaimed': 0,
+            'last_batch_size': 0,
+            'total_flush_ms': 0.0,
+        }
+    
+    @property
+    def running(self) -> bool:
+        return self._redis is not None
+    
+    async def start(self, client: Optional[aioredis.Redis] = None, consumers: bool = True):
+        if self.running:
+            return
+        self._redis = client or aioredis.from_url(self.redis_url)
+        try:
+            await self._redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        
+        if consumers:
+            self._consumers = [
+                asyncio.create_task(self._consume(f"{self.consumer_prefix}-{i}"), name=f"event-stream-{i}")
+                for i in range(self.consumer_count)
+            ]
+        print(f"[STREAM] Ingest stream {self.stream} ready ({len(self._consumers)} consumers in group {self.group})")
+    
+    async def stop(self):
+        if not self.running:
+            return
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        await self._redis.aclose()
+        self._redis = None
+        print(f"[STREAM] Stopped, {self._stats['written']} events written by this process")
+    
+    async def submit(self, event: Dict) -> uuid.UUID:
+        return (await self.submit_many([event]))[0]
+    
+    async def submit_many(self, events: List[Dict]) -> List[uuid.UUID]:
+        """Appends events with one pipelined round trip and returns their ids."""
+        if not self.running:
+            raise RuntimeError("Event stream is not running")
+        
+        ids = []
+        pipe = self._redis.pipeline(transaction=False)
+        for event in events:
+            event.setdefault('id', uuid.uuid4())
+            ids.append(event['id'])
+            pipe.xadd(
+                self.stream,
+                {'event': json.dumps({**event, 'id': str(event['id'])})},
+                maxlen=self.maxlen,
+                approximate=True
+            )
+        await pipe.execute()
+        self._stats['enqueued'] += len(events)
+        return ids
+    
+    async def stats(self) -> Dict:
+        stream_length = 0
+        pending = 0
+        if self.running:
+            try:
+                stream_length = await self._redis.xlen(self.stream)
+                pending = (await self._redis.xpending(self.stream, self.group))['pending']
+            except RedisError as e:
+                print(f"[STREAM] Failed to read stream stats: {e}")
+        batches = self._stats['batches']
+        return {
+            'running': self.running,
+            'stream': self.stream,
+            'group': self.group,
+            'consumers': len(self._consumers),
+            'stream_length': stream_length,
+            'pending': pending,
+            'enqueued': self._stats['enqueued'],
+            'written': self._stats['written'],
+            'failed': self._stats['failed'],
+            'reclaimed': self._stats['reclaimed'],
+            'batches': batches,
+            'last_batch_size': self._stats['last_batch_size'],
+            'avg_batch_size': round(self._stats['written'] / batches, 2) if batches else 0.0,
+            'avg_flush_ms': round(self._stats['total_flush_ms'] / batches, 2) if batches else 0.0,
+        }
+    
+    async def _consume(self, consumer: str):
+        while True:
+            try:
+                entries = await self._reclaim(consumer)
+                reclaimed = bool(entries)
+                if not entries:
+                    read_started = time.monotonic()
+                    response = await self._redis.xreadgroup(
+                        self.group,
+                        consumer,
+                        {self.stream: '>'},
+                        count=self.batch_size,
+                        block=self.block_ms
+                    )
+                    entries = response[0][1] if response else []
+                    if not entries:
+                        # Servers that ignore BLOCK answer at once; do not spin on them
+                        await asyncio.sleep(max(0.0, self.block_ms / 1000 - (time.monotonic() - read_started)))
+                if entries:
+                    await self._flush(entries, reclaimed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[STREAM] Consumer {consumer} error: {e}")
+                await asyncio.sleep(1)
+    
+    async def _reclaim(self, consumer: str) -> list:
+        result = await self._redis.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id='0-0',
+            count=self.batch_size
+        )
+        entries = [entry for entry in result[1] if entry[1]]
+        self._stats['reclaimed'] += len(entries)
+        return entries
+    
+    async def _flush(self, entries: list, reclaimed: bool = False):
+        started = time.perf_counter()
+        entry_ids = [entry_id for entry_id, _ in entries]
+        batch = []
+        for entry_id, fields in entries:
+            try:
+                batch.append(json.loads(fields[b'event']))
+            except (KeyError, ValueError) as e:
+                self._stats['failed'] += 1
+                print(f"[STREAM] Dropped malformed entry {entry_id}: {e}")
+        
+        processor = EventProcessor()
+        async with AsyncSessionLocal() as db:
+            try:
+                if reclaimed:
+                    batch = await self._skip_stored(db, batch)
+                await processor.process_batch(db, batch)
+                self._stats['written'] += len(batch)
+            except Exception as e:
+                await db.rollback()
+                if self._is_unavailable(e):
+                    # Leave the entries pending; they are reclaimed once the database is back
+                    raise
+                print(f"[STREAM] Batch of {len(batch)} failed, retrying one by one: {e}")
+                for event in batch:
+                    try:
+                        await processor.process_batch(db, [event])
+                        self._stats['written'] += 1
+                    except Exception as item_error:
+                        await db.rollback()
+                        self._stats['failed'] += 1
+                        print(f"[STREAM] Dropped event {event.get('id')}: {item_error}")
+        
+        await self._redis.xack(self.stream, self.group, *entry_ids)
+        
+        self._stats['batches'] += 1
+        self._stats['last_batch_size'] = len(batch)
+        self._stats['total_flush_ms'] += (time.perf_counter() - started) * 1000
+    
+    async def _skip_stored(self, db, batch: List[Dict]) -> List[Dict]:
+        """Drops redelivered events that a previous consumer already committed."""
+        result = await db.execute(
+            select(Event.id).where(Event.id.in_([uuid.UUID(event['id']) for event in batch]))
+        )
+        stored = {str(event_id) for event_id in result.scalars()}
+        if stored:
+            print(f"[STREAM] Skipping {len(stored)} redelivered events that are already stored")
+        return [event for event in batch if event['id'] not in stored]
+    
+    def _is_unavailable(self, error: Exception) -> bool:
+        if isinstance(error, DBAPIError):
+            return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+        return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+event_stream = EventStream(
+    redis_url=settings.redis_url,
+    stream=settings.event_stream_name,
+    group=settings.event_stream_group,
+    consumer_count=settings.event_stream_consumers,
+    batch_size=settings.event_batch_size,
+    block_ms=settings.event_stream_block_ms,
+    maxlen=settings.event_stream_maxlen,
+    claim_idle_ms=settings.event_stream_claim_idle_ms
+)
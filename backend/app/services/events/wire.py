@@ -0,0 +1,98 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional
+import msgpack
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+EVENT_FORMATS = ["msgpack", "json"]
+
+CONTENT_TYPES = {
+    "application/json": "json",
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+}
+
+
+def supported_encodings() -> List[str]:
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+class PayloadError(ValueError):
+    """Body of an internal ingest request that cannot be decoded."""
+    
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+def unsupported(detail: str) -> PayloadError:
+    return PayloadError(
+        415,
+        detail,
+        headers={
+            "Accept-Encoding": ", ".join(supported_encodings()),
+            "Accept-Post": ", ".join(f"application/{name}" for name in EVENT_FORMATS),
+        }
+    )
+
+
+def decompress(body: bytes, content_encoding: Optional[str], max_size: int) -> bytes:
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, max_size)
+        except zlib.error as e:
+            raise PayloadError(400, f"Invalid gzip body: {e}")
+        if decompressor.unconsumed_tail:
+            raise PayloadError(413, f"Decompressed body exceeds {max_size} bytes")
+        return data
+    
+    if encoding == "zstd" and zstandard is not None:
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                data = reader.read(max_size + 1)
+        except zstandard.ZstdError as e:
+            raise PayloadError(400, f"Invalid zstd body: {e}")
+        if len(data) > max_size:
+            raise PayloadError(413, f"Decompressed body exceeds {max_size} bytes")
+        return data
+    
+    raise unsupported(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+def decode_event_payload(
+    body: bytes,
+    content_type: Optional[str],
+    content_encoding: Optional[str],
+    max_size: int
+) -> Any:
+    """Decodes the body of /events/internal or /events/internal/batch.
+    
+    Honeypot runners send JSON or msgpack (Content-Type), optionally
+    compressed with gzip or zstd (Content-Encoding). A missing Content-Type
+    is treated as JSON, as before.
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    wire_format = CONTENT_TYPES.get(media_type)
+    if wire_format is None:
+        raise unsupported(f"Unsupported Content-Type: {content_type}")
+    
+    data = decompress(body, content_encoding, max_size)
+    try:
+        if wire_format == "msgpack":
+            return msgpack.unpackb(data, raw=False, unicode_errors="replace", strict_map_key=False)
+        return json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise PayloadError(400, f"Invalid {wire_format} body: {e}")
@@ -31,12 +31,10 @@ class BaseHoneypot(ABC):
         pass
     
     async def log_event(self, event_type: str, source_ip: str, details: Dict):
-        from app.core.database import SessionLocal
+        from app.core.database import AsyncSessionLocal
         from app.services.events.processor import EventProcessor
-        from app.services.alerts.notifier import AlertNotifier
         
-        db = SessionLocal()
-        try:
+        async with AsyncSessionLocal() as db:
             processor = EventProcessor()
             event, incident = await processor.process_event(
                 db=db,
@@ -47,8 +45,6 @@ class BaseHoneypot(ABC):
                 details=details,
                 honeytoken_id=details.get('credential_id')
             )
-        finally:
-            db.close()
     
     async def check_credentials(
         self,
@@ -230,6 +230,7 @@ class HoneypotManager:
         
         from app.models.incident import Incident
         from app.models.event import Event
+        from app.services.events.incident_cache import incident_cache
         
         incidents = db.query(Incident).filter(Incident.honeypot_id == honeypot.id).all()
         for incident in incidents:
@@ -237,6 +238,7 @@ class HoneypotManager:
             for event in events:
                 db.delete(event)
             db.delete(incident)
+            incident_cache.invalidate(incident.id)
         
         events = db.query(Event).filter(Event.honeypot_id == honeypot.id).all()
         for event in events:
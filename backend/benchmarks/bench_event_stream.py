@@ -0,0 +1,157 @@
+"""Measures Redis Streams ingest against writing events in the request.
+
+Uses fakeredis as a stand-in Redis server and the database in DATABASE_URL
+(migrated). Creates a temporary honeypot and removes it afterwards.
+
+Reports:
+  - request-path throughput: process_event per event (sync mode) versus
+    appending to the stream (single XADD and pipelined batches);
+  - drain throughput of the consumer group into Postgres;
+  - a restart in the middle of draining: the first consumer pool is
+    cancelled with unacknowledged entries, a second one reclaims them and
+    every event is stored exactly once.
+
+Run from backend/:
+    python -m benchmarks.bench_event_stream
+"""
+import asyncio
+import time
+
+import fakeredis
+from sqlalchemy import delete, func, select
+
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.event import Event
+from app.models.honeypot import HoneypotService
+from app.models.incident import Incident
+from app.services.events.incident_cache import incident_cache
+from app.services.events.processor import EventProcessor
+from app.services.events.stream import EventStream
+
+SYNC_EVENTS = 500
+STREAM_EVENTS = 5_000
+BATCH_SIZE = 200
+
+
+def make_stream(server, stream, claim_idle_ms=60_000):
+    event_stream = EventStream(
+        redis_url="redis://stand-in",
+        stream=stream,
+        group="bench",
+        consumer_count=2,
+        batch_size=BATCH_SIZE,
+        block_ms=100,
+        maxlen=1_000_000,
+        claim_idle_ms=claim_idle_ms
+    )
+    return event_stream, fakeredis.aioredis.FakeRedis(server=server)
+
+
+def make_events(honeypot_id, count, offset=0):
+    return [
+        {
+            'honeypot_id': str(honeypot_id),
+            'event_type': 'http_request',
+            'level': 1,
+            'source_ip': f"203.0.113.{(offset + i) % 200}",
+            'details': {'method': 'GET', 'path': f'/wp-login.php?i={offset + i}'}
+        }
+        for i in range(count)
+    ]
+
+
+async def count_events(honeypot_id):
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count(Event.id)).where(Event.honeypot_id == honeypot_id))
+
+
+async def wait_for_events(honeypot_id, expected, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if await count_events(honeypot_id) >= expected:
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"expected {expected} events")
+
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        honeypot = HoneypotService(name="bench-event-stream", type="http", port=0)
+        db.add(honeypot)
+        await db.commit()
+        honeypot_id = honeypot.id
+    
+    server = fakeredis.FakeServer()
+    await incident_cache.start()
+    try:
+        processor = EventProcessor()
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            for item in make_events(honeypot_id, SYNC_EVENTS):
+                await processor.process_event(db, **item)
+        sync_rate = SYNC_EVENTS / (time.perf_counter() - started)
+        
+        event_stream, client = make_stream(server, "bench:events")
+        await event_stream.start(client, consumers=False)
+        
+        started = time.perf_counter()
+        for item in make_events(honeypot_id, SYNC_EVENTS):
+            await event_stream.submit(item)
+        xadd_rate = SYNC_EVENTS / (time.perf_counter() - started)
+        
+        events = make_events(honeypot_id, STREAM_EVENTS, offset=SYNC_EVENTS)
+        started = time.perf_counter()
+        for i in range(0, len(events), BATCH_SIZE):
+            await event_stream.submit_many(events[i:i + BATCH_SIZE])
+        pipelined_rate = STREAM_EVENTS / (time.perf_counter() - started)
+        await event_stream.stop()
+        
+        print("request path (events/s)")
+        print(f"  sync process_event       {sync_rate:>10.0f}")
+        print(f"  stream XADD per event    {xadd_rate:>10.0f}")
+        print(f"  stream XADD batch of {BATCH_SIZE} {pipelined_rate:>10.0f}")
+        
+        queued = SYNC_EVENTS + STREAM_EVENTS
+        event_stream, client = make_stream(server, "bench:events")
+        started = time.perf_counter()
+        await event_stream.start(client)
+        await wait_for_events(honeypot_id, SYNC_EVENTS + queued)
+        drain_rate = queued / (time.perf_counter() - started)
+        stats = await event_stream.stats()
+        await event_stream.stop()
+        print(f"drain into Postgres        {drain_rate:>10.0f} events/s "
+              f"(2 consumers, avg batch {stats['avg_batch_size']}, pending {stats['pending']})")
+        
+        before = await count_events(honeypot_id)
+        restart_events = make_events(honeypot_id, STREAM_EVENTS, offset=100_000)
+        first, client = make_stream(server, "bench:restart", claim_idle_ms=2_000)
+        await first.start(client)
+        for i in range(0, len(restart_events), BATCH_SIZE):
+            await first.submit_many(restart_events[i:i + BATCH_SIZE])
+        while first._stats['batches'] < 3:
+            await asyncio.sleep(0.01)
+        await first.stop()
+        written_before_restart = await count_events(honeypot_id) - before
+        
+        second, client = make_stream(server, "bench:restart", claim_idle_ms=2_000)
+        await second.start(client)
+        await wait_for_events(honeypot_id, before + STREAM_EVENTS)
+        await asyncio.sleep(0.5)
+        stats = await second.stats()
+        await second.stop()
+        total = await count_events(honeypot_id) - before
+        print(f"restart: {written_before_restart} stored before restart, "
+              f"{stats['reclaimed']} reclaimed, {total}/{STREAM_EVENTS} stored after, pending {stats['pending']}")
+        assert total == STREAM_EVENTS
+    finally:
+        await incident_cache.stop()
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Event).where(Event.honeypot_id == honeypot_id))
+            await db.execute(delete(Incident).where(Incident.honeypot_id == honeypot_id))
+            await db.execute(delete(HoneypotService).where(HoneypotService.id == honeypot_id))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
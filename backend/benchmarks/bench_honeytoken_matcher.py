@@ -0,0 +1,77 @@
+"""Compares the compiled honeytoken matcher with the per-credential substring loop.
+
+Run from backend/:
+    python -m benchmarks.bench_honeytoken_matcher
+"""
+import random
+import string
+import time
+import uuid
+from types import SimpleNamespace
+
+from app.services.credentials.generator import CredentialGenerator
+from app.services.credentials.matcher import HoneytokenMatcher
+
+TOKEN_COUNTS = (1_000, 10_000, 100_000)
+REQUESTS = 200
+
+
+def make_credentials(count):
+    generator = CredentialGenerator()
+    credentials = []
+    for i in range(count):
+        pair = generator.generate_pair("ssh")
+        credentials.append(SimpleNamespace(
+            id=uuid.uuid4(),
+            username=f"{pair['username']}_{i}",
+            password=pair['password']
+        ))
+    return credentials
+
+
+def make_request_text(size=2048):
+    alphabet = string.ascii_letters + string.digits + " =&/:\n"
+    return ''.join(random.choices(alphabet, k=size))
+
+
+def linear_scan(request_text, credentials):
+    request_text_lower = request_text.lower()
+    for cred in credentials:
+        if cred.username and cred.username.lower() in request_text_lower:
+            return cred
+        if cred.password and cred.password.lower() in request_text_lower:
+            return cred
+    return None
+
+
+def timed(fn, texts):
+    started = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return (time.perf_counter() - started) / len(texts) * 1000
+
+
+def main():
+    random.seed(1)
+    texts = [make_request_text() for _ in range(REQUESTS)]
+    
+    print(f"{'tokens':>8} {'compile ms':>11} {'loop ms/req':>12} {'matcher ms/req':>15} {'speedup':>8}")
+    for count in TOKEN_COUNTS:
+        credentials = make_credentials(count)
+        hit = credentials[count // 2]
+        texts[0] = texts[0][:100] + hit.username + texts[0][100:]
+        
+        started = time.perf_counter()
+        matcher = HoneytokenMatcher.from_credentials(credentials)
+        matcher.match("warmup")
+        compile_ms = (time.perf_counter() - started) * 1000
+        
+        assert matcher.match(texts[0]) == [str(hit.id)]
+        
+        loop_ms = timed(lambda text: linear_scan(text, credentials), texts)
+        matcher_ms = timed(matcher.match, texts)
+        print(f"{count:>8} {compile_ms:>11.1f} {loop_ms:>12.3f} {matcher_ms:>15.3f} {loop_ms / matcher_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Replays a brute-force session through EventProcessor with and without the open incident cache.
+
+Counts database round trips (all statements, and those touching incidents)
+for one attacker IP hammering one honeypot. Needs a migrated database in
+DATABASE_URL. Creates a temporary honeypot and removes it afterwards.
+
+Run from backend/:
+    python -m benchmarks.bench_incident_cache
+"""
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import delete, event
+
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.event import Event
+from app.models.honeypot import HoneypotService
+from app.models.incident import Incident
+from app.services.events.incident_cache import OpenIncidentCache
+from app.services.events.processor import EventProcessor
+
+SESSION_EVENTS = 500
+BATCH_SIZE = 50
+
+
+class StatementCounter:
+    def __init__(self):
+        self.total = 0
+        self.incidents = 0
+    
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += 1
+        if "incidents" in statement:
+            self.incidents += 1
+
+
+def make_events(honeypot_id, source_ip):
+    return [
+        {
+            'honeypot_id': str(honeypot_id),
+            'event_type': 'ssh_login_attempt',
+            'level': 2 if i % 100 == 99 else 1,
+            'source_ip': source_ip,
+            'details': {'username': 'root', 'password': f'pass{i}'}
+        }
+        for i in range(SESSION_EVENTS)
+    ]
+
+
+async def replay(cache, honeypot_id, batched):
+    source_ip = f"198.51.100.{uuid.uuid4().int % 250}"
+    events = make_events(honeypot_id, source_ip)
+    processor = EventProcessor(cache)
+    counter = StatementCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    
+    started = time.perf_counter()
+    try:
+        async with AsyncSessionLocal() as db:
+            if batched:
+                for i in range(0, len(events), BATCH_SIZE):
+                    await processor.process_batch(db, events[i:i + BATCH_SIZE])
+            else:
+                for item in events:
+                    await processor.process_event(db, **item)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        await cache.stop()
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
+    
+    async with AsyncSessionLocal() as db:
+        incident = (await db.execute(
+            Incident.__table__.select().where(Incident.source_ip == source_ip)
+        )).one()
+    assert incident.event_count == SESSION_EVENTS, incident.event_count
+    return counter, elapsed_ms
+
+
+async def main():
+    async with AsyncSessionLocal() as db:
+        honeypot = HoneypotService(name="bench-incident-cache", type="ssh", port=0)
+        db.add(honeypot)
+        await db.commit()
+        honeypot_id = honeypot.id
+    
+    try:
+        print(f"{SESSION_EVENTS} events from one IP, batches of {BATCH_SIZE}")
+        print(f"{'mode':>8} {'cache':>6} {'statements':>11} {'incident stmts':>15} {'ms':>9} {'hit ratio':>10}")
+        for batched in (False, True):
+            for enabled in (False, True):
+                cache = OpenIncidentCache(
+                    max_size=1000 if enabled else 0,
+                    ttl=60.0,
+                    flush_interval=1.0
+                )
+                await cache.start()
+                counter, elapsed_ms = await replay(cache, honeypot_id, batched)
+                stats = cache.stats()
+                print(
+                    f"{'batch' if batched else 'single':>8} {'on' if enabled else 'off':>6} "
+                    f"{counter.total:>11} {counter.incidents:>15} {elapsed_ms:>9.1f} {stats['hit_ratio']:>10.2%}"
+                )
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Event).where(Event.honeypot_id == honeypot_id))
+            await db.execute(delete(Incident).where(Incident.honeypot_id == honeypot_id))
+            await db.execute(delete(HoneypotService).where(HoneypotService.id == honeypot_id))
+            await db.commit()
+        await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
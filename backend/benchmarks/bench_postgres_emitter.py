@@ -0,0 +1,164 @@
+"""Measures Postgres honeypot latency with inline versus async event delivery.
+
+Runs postgres_honeypot_runner.handle_client on a local port and opens many
+simultaneous psql-style sessions: startup, cleartext password, then simple
+queries, each timed until ReadyForQuery. Every step emits an event to a
+mock backend that answers after BACKEND_LATENCY seconds.
+
+  - inline: the previous behaviour, a blocking requests.post per event on
+    the event loop, so every session waits for every other session's
+    deliveries;
+  - async: AsyncEventEmitter, events batched from an in-loop queue.
+
+Run from backend/:
+    python -m benchmarks.bench_postgres_emitter
+"""
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import postgres_honeypot_runner as runner
+from event_sender import AsyncEventEmitter
+
+SESSIONS = 50
+QUERIES = 10
+BACKEND_LATENCY = 0.01
+TOKEN = "bench-token"
+READY_FOR_QUERY = b'Z' + struct.pack('!I', 5) + b'I'
+
+
+class MockBackend(BaseHTTPRequestHandler):
+    received = 0
+    lock = threading.Lock()
+    
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        events = body if isinstance(body, list) else [body]
+        time.sleep(BACKEND_LATENCY)
+        with MockBackend.lock:
+            MockBackend.received += len(events)
+        payload = json.dumps({'status': 'ok', 'accepted': len(events), 'failed': 0}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class InlineSender:
+    """The previous behaviour: a blocking POST per event, on the event loop."""
+    
+    def __init__(self, api_url):
+        self.api_url = api_url
+    
+    def send(self, event):
+        requests.post(
+            f"{self.api_url}/api/events/internal",
+            json=event,
+            headers={"X-Honeypot-Token": TOKEN},
+            timeout=2
+        )
+        return True
+
+
+def startup_message(user, database):
+    params = f"user\x00{user}\x00database\x00{database}\x00\x00".encode()
+    return struct.pack('!II', 8 + len(params), 196608) + params
+
+
+def frontend_message(kind, payload):
+    return kind + struct.pack('!I', 4 + len(payload)) + payload
+
+
+async def read_until_ready(reader):
+    buf = b''
+    while not buf.endswith(READY_FOR_QUERY):
+        data = await reader.read(4096)
+        if not data:
+            raise ConnectionError("honeypot closed the connection")
+        buf += data
+
+
+async def psql_session(port, n, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    started = time.perf_counter()
+    writer.write(startup_message(f"user{n}", "postgres"))
+    await reader.readexactly(9)
+    writer.write(frontend_message(b'p', b'secret\x00'))
+    await read_until_ready(reader)
+    latencies.append(time.perf_counter() - started)
+    
+    for i in range(QUERIES):
+        started = time.perf_counter()
+        writer.write(frontend_message(b'Q', f"SELECT * FROM users WHERE id = {i}\x00".encode()))
+        await read_until_ready(reader)
+        latencies.append(time.perf_counter() - started)
+    
+    writer.write(frontend_message(b'X', b''))
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(emitter):
+    runner.event_emitter = emitter
+    # Every session comes from 127.0.0.1
+    runner.connection_limiter = runner.ConnectionLimiter(SESSIONS, SESSIONS, runner.LIMIT_REPORT_INTERVAL)
+    server = await asyncio.start_server(runner.handle_client, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(psql_session(port, n, latencies) for n in range(SESSIONS)))
+    elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies)
+
+
+async def main():
+    backend = ThreadingHTTPServer(('127.0.0.1', 0), MockBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{backend.server_address[1]}"
+    messages = SESSIONS * (QUERIES + 1)
+    
+    print(f"{SESSIONS} concurrent sessions x {QUERIES + 1} messages, backend answers in {BACKEND_LATENCY * 1000:.0f} ms")
+    print(f"{'delivery':>8} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'delivered':>10}")
+    try:
+        for name in ('inline', 'async'):
+            MockBackend.received = 0
+            if name == 'inline':
+                emitter = InlineSender(api_url)
+            else:
+                emitter = AsyncEventEmitter([api_url], TOKEN, flush_interval=0.05)
+                await emitter.start()
+            
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed, latencies = await run(emitter)
+                if name == 'async':
+                    await emitter.stop()
+            
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            print(f"{name:>8} {messages / elapsed:>8.0f} {p50:>8.2f} {p99:>8.2f} "
+                  f"{latencies[-1] * 1000:>8.2f} {MockBackend.received:>10}")
+            assert MockBackend.received == messages
+    finally:
+        backend.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
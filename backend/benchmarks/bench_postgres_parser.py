@@ -0,0 +1,100 @@
+"""Measures the Postgres honeypot frame parser against the previous bytes buffer.
+
+Feeds each workload to the parsers in chunks, as reader.read() would
+deliver it, both in the previous 4096-byte reads and in READ_SIZE reads,
+and pulls every complete message out:
+
+  - legacy: the previous handle_client buffering, `_buf += data` on every
+    read and `_buf = _buf[total:]` after every message;
+  - parser: postgres_honeypot_runner.FrameParser, a bytearray with
+    memoryview frames.
+
+Workloads:
+  - copy: COPY-style CopyData messages of COPY_MESSAGE bytes;
+  - pipelined: extended-protocol Parse/Bind/Execute/Sync rounds sent back
+    to back.
+
+Run from backend/:
+    python -m benchmarks.bench_postgres_parser
+"""
+import struct
+import time
+
+from postgres_honeypot_runner import FrameParser, READ_SIZE
+
+COPY_MESSAGES = 8
+COPY_MESSAGE = 4 * 1024 * 1024
+LEGACY_READ_SIZE = 4096  # what handle_client used to read at a time
+PIPELINED_ROUNDS = 20000
+
+
+def frontend_message(kind, payload):
+    return kind + struct.pack('!I', 4 + len(payload)) + payload
+
+
+def copy_workload():
+    return frontend_message(b'd', b'1\tadmin\tsecret\n' * (COPY_MESSAGE // 15)) * COPY_MESSAGES
+
+
+def pipelined_workload():
+    rounds = []
+    for i in range(PIPELINED_ROUNDS):
+        rounds.append(frontend_message(b'P', f"s{i}\x00SELECT * FROM users WHERE id = $1\x00\x00\x00".encode()))
+        rounds.append(frontend_message(b'B', f"\x00s{i}\x00\x00\x00\x00\x01\x00\x00\x00\x011\x00\x00".encode()))
+        rounds.append(frontend_message(b'E', b'\x00\x00\x00\x00\x00'))
+        rounds.append(frontend_message(b'S', b''))
+    return b''.join(rounds)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def run_legacy(reads):
+    messages = 0
+    _buf = b''
+    for data in reads:
+        _buf += data
+        while len(_buf) >= 5:
+            mlen = struct.unpack('!I', _buf[1:5])[0]
+            total = 1 + mlen
+            if len(_buf) < total:
+                break
+            msg_data = _buf[:total]
+            _buf = _buf[total:]
+            messages += 1
+    return messages
+
+
+def run_parser(reads):
+    messages = 0
+    parser = FrameParser(max_message_size=COPY_MESSAGE + 5)
+    for data in reads:
+        parser.feed(data)
+        while parser.next_message() is not None:
+            messages += 1
+    return messages
+
+
+def measure(run, reads, size):
+    started = time.perf_counter()
+    messages = run(reads)
+    elapsed = time.perf_counter() - started
+    return messages, size / elapsed / 1e6, messages / elapsed
+
+
+def main():
+    print(f"{'workload':>10} {'parser':>7} {'read':>6} {'messages':>9} {'MB/s':>9} {'msg/s':>11}")
+    for name, data in (('copy', copy_workload()), ('pipelined', pipelined_workload())):
+        for parser, run, read_size in (
+            ('legacy', run_legacy, LEGACY_READ_SIZE),
+            ('legacy', run_legacy, READ_SIZE),
+            ('parser', run_parser, LEGACY_READ_SIZE),
+            ('parser', run_parser, READ_SIZE),
+        ):
+            messages, mb_per_s, rate = measure(run, chunks(data, read_size), len(data))
+            print(f"{name:>10} {parser:>7} {read_size:>6} {messages:>9} {mb_per_s:>9.1f} {rate:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Measures Postgres honeypot throughput for pipelined simple queries.
+
+Runs postgres_honeypot_runner.handle_client on a local port. SESSIONS
+clients log in and send QUERIES simple queries each, PIPELINE at a time
+back to back, waiting for every ReadyForQuery before the next group:
+
+  - per-message: the previous behaviour, every backend message handed to
+    the transport with its own write();
+  - coalesced: ResponseBuilder, one write and drain per client round.
+
+Run from backend/:
+    python -m benchmarks.bench_postgres_responses
+"""
+import asyncio
+import contextlib
+import io
+import struct
+import time
+
+import postgres_honeypot_runner as runner
+
+SESSIONS = 20
+QUERIES = 2000
+PIPELINE = 50
+
+
+class NullEmitter:
+    def send(self, event):
+        return True
+
+
+class PerMessageResponse(runner.ResponseBuilder):
+    """Writes every message as soon as it is appended, as the send_* helpers did."""
+    
+    def append(self, message):
+        self.writer.write(message)
+        type(self).writes += 1
+    
+    def query_response(self, rows=None):
+        self.command_complete()
+        self.ready_for_query()
+
+
+class CoalescedResponse(runner.ResponseBuilder):
+    async def flush(self):
+        if len(self):
+            type(self).writes += 1
+        await super().flush()
+
+
+def startup_message(user, database):
+    params = f"user\x00{user}\x00database\x00{database}\x00\x00".encode()
+    return struct.pack('!II', 8 + len(params), 196608) + params
+
+
+def frontend_message(kind, payload):
+    return kind + struct.pack('!I', 4 + len(payload)) + payload
+
+
+async def read_ready(reader, count):
+    """Reads backend messages until `count` ReadyForQuery messages have arrived."""
+    buf = b''
+    while count:
+        while len(buf) < 5:
+            buf += await reader.read(65536)
+        total = 1 + struct.unpack('!I', buf[1:5])[0]
+        while len(buf) < total:
+            buf += await reader.read(65536)
+        if buf[0:1] == b'Z':
+            count -= 1
+        buf = buf[total:]
+
+
+async def session(port, n):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(startup_message(f"user{n}", "postgres"))
+    await reader.readexactly(9)
+    writer.write(frontend_message(b'p', b'secret\x00'))
+    await read_ready(reader, 1)
+    
+    batch = b''.join(
+        frontend_message(b'Q', f"SELECT * FROM users WHERE id = {i}\x00".encode())
+        for i in range(PIPELINE)
+    )
+    for _ in range(QUERIES // PIPELINE):
+        writer.write(batch)
+        await read_ready(reader, PIPELINE)
+    
+    writer.write(frontend_message(b'X', b''))
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(response_class):
+    response_class.writes = 0
+    runner.ResponseBuilder = response_class
+    server = await asyncio.start_server(runner.handle_client, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(session(port, n) for n in range(SESSIONS)))
+    elapsed = time.perf_counter() - started
+    queries = SESSIONS * QUERIES
+    return queries / elapsed, response_class.writes / queries
+
+
+async def main():
+    runner.event_emitter = NullEmitter()
+    builder = runner.ResponseBuilder
+    print(f"{SESSIONS} sessions x {QUERIES} simple queries, {PIPELINE} pipelined")
+    print(f"{'responses':>12} {'queries/s':>10} {'writes/query':>13}")
+    try:
+        for name, response_class in (('per-message', PerMessageResponse), ('coalesced', CoalescedResponse)):
+            with contextlib.redirect_stdout(io.StringIO()):
+                rate, writes = await run(response_class)
+            print(f"{name:>12} {rate:>10.0f} {writes:>13.2f}")
+    finally:
+        runner.ResponseBuilder = builder
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
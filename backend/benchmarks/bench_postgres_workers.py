@@ -0,0 +1,166 @@
+"""Measures Postgres honeypot throughput as the number of worker processes grows.
+
+Starts postgres_honeypot_runner.py with WORKER_COUNTS workers (one
+process, or forked workers sharing the port through SO_REUSEPORT) on the
+asyncio and the uvloop event loop, sends its events to a mock backend and
+drives it from CLIENT_PROCESSES load processes for DURATION seconds:
+
+  - accept: new connections per second, each sending a StartupMessage and
+    waiting for the password request before closing;
+  - queries: simple queries per second over SESSIONS persistent sessions
+    per load process, PIPELINE queries at a time.
+
+Throughput only grows with the worker count up to the number of cores the
+honeypot, the load processes and the mock backend share.
+
+Run from backend/:
+    python -m benchmarks.bench_postgres_workers
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from benchmarks.bench_postgres_emitter import MockBackend, frontend_message, startup_message
+
+WORKER_COUNTS = (1, 2, 4)
+LOOPS = ('asyncio', 'uvloop')
+CLIENT_PROCESSES = max(2, os.cpu_count() or 1)
+CONNECTORS = 16
+SESSIONS = 16
+PIPELINE = 20
+DURATION = 3.0
+
+
+class QuietBackend(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Emitters give up on slow requests when the load saturates the machine
+        pass
+
+
+async def connect_loop(port, deadline):
+    connections = 0
+    while time.monotonic() < deadline:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(startup_message("scanner", "postgres"))
+        await reader.readexactly(9)
+        writer.close()
+        await writer.wait_closed()
+        connections += 1
+    return connections
+
+
+async def query_loop(port, deadline):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(startup_message("user", "postgres"))
+    await reader.readexactly(9)
+    writer.write(frontend_message(b'p', b'secret\x00'))
+    await reader.readexactly(9 + 6)
+    
+    batch = frontend_message(b'Q', b"SELECT * FROM users WHERE id = 1\x00") * PIPELINE
+    queries = 0
+    buf = b''
+    while time.monotonic() < deadline:
+        writer.write(batch)
+        ready = 0
+        while ready < PIPELINE:
+            data = await reader.read(65536)
+            if not data:
+                raise ConnectionError("honeypot closed the connection")
+            buf += data
+            ready += buf.count(b'Z\x00\x00\x00\x05I')
+            buf = buf[-5:]
+        queries += PIPELINE
+    writer.close()
+    await writer.wait_closed()
+    return queries
+
+
+def load_process(mode, port, results):
+    async def run():
+        deadline = time.monotonic() + DURATION
+        if mode == 'accept':
+            counts = await asyncio.gather(*(connect_loop(port, deadline) for _ in range(CONNECTORS)))
+        else:
+            counts = await asyncio.gather(*(query_loop(port, deadline) for _ in range(SESSIONS)))
+        return sum(counts)
+    results.put(asyncio.run(run()))
+
+
+def measure(mode, port):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=load_process, args=(mode, port, results)) for _ in range(CLIENT_PROCESSES)]
+    for process in processes:
+        process.start()
+    total = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return total / DURATION
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_honeypot(workers, loop, api_url, spool_dir):
+    port = free_port()
+    env = {
+        **os.environ,
+        'WORKERS': str(workers),
+        'EVENT_LOOP': loop,
+        'HOST': '127.0.0.1',
+        'PORT': str(port),
+        'API_URL': api_url,
+        'EVENT_SPOOL_DIR': spool_dir,
+        'MAX_CONNECTIONS': '100000',
+        'MAX_CONNECTIONS_PER_IP': '100000',
+    }
+    honeypot = subprocess.Popen(
+        [sys.executable, 'postgres_honeypot_runner.py'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    # Let every worker bind before connections are spread over them
+    time.sleep(1)
+    return honeypot, port
+
+
+def main():
+    backend = QuietBackend(('127.0.0.1', 0), MockBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{backend.server_address[1]}"
+    
+    print(f"{os.cpu_count()} cores, {CLIENT_PROCESSES} load processes, {DURATION:g}s per measurement")
+    print(f"{'workers':>7} {'loop':>8} {'conn/s':>9} {'queries/s':>10}")
+    with tempfile.TemporaryDirectory() as spool_dir:
+        for workers in WORKER_COUNTS:
+            for loop in LOOPS:
+                honeypot, port = start_honeypot(workers, loop, api_url, os.path.join(spool_dir, f"{workers}-{loop}"))
+                try:
+                    accepted = measure('accept', port)
+                    queries = measure('queries', port)
+                finally:
+                    honeypot.send_signal(signal.SIGTERM)
+                    honeypot.wait(timeout=30)
+                print(f"{workers:>7} {loop:>8} {accepted:>9.0f} {queries:>10.0f}")
+    backend.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Measures SSH honeypot handshakes per second with inline versus threaded event delivery.
+
+Starts ssh_honeypot_runner in a subprocess against a mock backend that
+answers after BACKEND_LATENCY seconds, then runs HANDSHAKES Twisted conch
+clients, CONCURRENCY at a time. A handshake is counted once the key
+exchange is done and the server has offered password authentication; each
+client then tries one password and disconnects after the rejection.
+Every connection produces four events (connect, KEXINIT and the password
+attempt, logged once by the auth service and once by the checker); the
+readiness probe adds one connect event.
+  
+  - inline: the previous behaviour, a blocking requests.post per event on
+    the reactor thread;
+  - threaded: BackgroundEventSender, events batched from its own thread.
+
+Run from backend/:
+    python -m benchmarks.bench_ssh_sender
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from twisted.conch.ssh import connection, transport, userauth
+from twisted.internet import defer, endpoints, reactor, task
+
+from event_sender import _text
+
+HANDSHAKES = 200
+CONCURRENCY = 20
+BACKEND_LATENCY = 0.01
+EVENTS_PER_CONNECTION = 4
+
+
+class MockBackend(BaseHTTPRequestHandler):
+    received = 0
+    lock = threading.Lock()
+    
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        events = body if isinstance(body, list) else [body]
+        time.sleep(BACKEND_LATENCY)
+        with MockBackend.lock:
+            MockBackend.received += len(events)
+        payload = json.dumps({'status': 'ok', 'accepted': len(events), 'failed': 0}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class InlineSender:
+    """The previous behaviour: a blocking POST per event, on the reactor thread."""
+    
+    def __init__(self, api_url):
+        self.api_url = api_url
+    
+    def start(self):
+        return self
+    
+    def stop(self):
+        pass
+    
+    def send(self, event):
+        try:
+            requests.post(
+                f"{self.api_url}/api/events/internal",
+                data=json.dumps(event, default=_text),
+                headers={'Content-Type': 'application/json'},
+                timeout=2
+            )
+        except Exception:
+            return False
+        return True
+
+
+class BenchUserAuth(userauth.SSHUserAuthClient):
+    def __init__(self, handshake):
+        userauth.SSHUserAuthClient.__init__(self, b"root", connection.SSHConnection())
+        self.handshake = handshake
+        self.attempts = 0
+    
+    def getPassword(self, prompt=None):
+        self.attempts += 1
+        if self.attempts == 1:
+            self.handshake.callback(None)
+            return defer.succeed(b"toor")
+        self.transport.loseConnection()
+        return None
+    
+    def getPublicKey(self):
+        return None
+
+
+class BenchClientTransport(transport.SSHClientTransport):
+    def __init__(self):
+        self.handshake = defer.Deferred()
+        self.closed = defer.Deferred()
+    
+    def verifyHostKey(self, hostKey, fingerprint):
+        return defer.succeed(True)
+    
+    def connectionSecure(self):
+        self.requestService(BenchUserAuth(self.handshake))
+    
+    def connectionLost(self, reason):
+        transport.SSHClientTransport.connectionLost(self, reason)
+        if not self.handshake.called:
+            self.handshake.errback(reason)
+        self.closed.callback(None)
+
+
+def serve(mode, port, api_url):
+    os.environ.update(
+        PORT=str(port),
+        HOST='127.0.0.1',
+        API_URL=api_url,
+        SERVICE_ID='bench',
+        # Every client connects from 127.0.0.1
+        MAX_CONNECTIONS_PER_IP=str(HANDSHAKES),
+        EVENT_SPOOL_DIR=tempfile.mkdtemp(prefix='bench-ssh-spool-')
+    )
+    import ssh_honeypot_runner as runner
+    if mode == 'inline':
+        runner.event_sender = InlineSender(api_url)
+    else:
+        runner.event_sender.api_urls = [api_url]
+    runner.main()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"honeypot did not listen on {port}")
+
+
+async def run_handshakes(port):
+    endpoint = endpoints.TCP4ClientEndpoint(reactor, '127.0.0.1', port)
+    semaphore = defer.DeferredSemaphore(CONCURRENCY)
+    closed = []
+    
+    async def handshake():
+        client = BenchClientTransport()
+        closed.append(client.closed)
+        await endpoints.connectProtocol(endpoint, client)
+        await client.handshake
+    
+    started = time.perf_counter()
+    await defer.gatherResults(
+        [semaphore.run(lambda: defer.ensureDeferred(handshake())) for _ in range(HANDSHAKES)],
+        consumeErrors=True
+    )
+    elapsed = time.perf_counter() - started
+    await defer.gatherResults(closed)
+    return HANDSHAKES / elapsed
+
+
+async def bench(reactor_, api_url):
+    print(f"{HANDSHAKES} SSH handshakes, {CONCURRENCY} concurrent, backend answers in {BACKEND_LATENCY * 1000:.0f} ms")
+    print(f"{'delivery':>8} {'handshakes/s':>13} {'delivered':>10}")
+    for mode in ('inline', 'threaded'):
+        MockBackend.received = 0
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_ssh_sender', '--serve', mode, str(port), api_url],
+            stdout=subprocess.DEVNULL
+        )
+        try:
+            await task.deferLater(reactor, 0, wait_for_port, port)
+            rate = await run_handshakes(port)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:>8} {rate:>13.0f} {MockBackend.received:>10}")
+        assert MockBackend.received == HANDSHAKES * EVENTS_PER_CONNECTION + 1
+
+
+def main():
+    backend = ThreadingHTTPServer(('127.0.0.1', 0), MockBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{backend.server_address[1]}"
+    try:
+        task.react(lambda reactor_: defer.ensureDeferred(bench(reactor_, api_url)))
+    finally:
+        backend.shutdown()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--serve']:
+        serve(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main()
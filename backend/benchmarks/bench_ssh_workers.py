@@ -0,0 +1,123 @@
+"""Measures SSH honeypot handshakes per second as the number of worker processes grows.
+
+Starts ssh_honeypot_runner.py with WORKER_COUNTS workers (one process, or
+worker processes sharing the port through SO_REUSEPORT) against a mock
+backend, then runs CLIENT_PROCESSES load processes for DURATION seconds,
+each keeping CONCURRENCY Twisted conch clients in a handshake. As in
+bench_ssh_sender, a handshake counts once the key exchange is done and
+the server offers password authentication; each client then tries one
+password and disconnects after the rejection.
+
+Handshakes per second only grow with the worker count up to the number of
+cores the honeypot and the load processes share.
+
+Run from backend/:
+    python -m benchmarks.bench_ssh_workers
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from twisted.internet import defer, endpoints, reactor, task
+
+from benchmarks.bench_ssh_sender import BenchClientTransport, MockBackend, free_port, wait_for_port
+
+WORKER_COUNTS = (1, 2, 4)
+CLIENT_PROCESSES = max(2, os.cpu_count() or 1)
+CONCURRENCY = 10
+DURATION = 5.0
+
+
+def load(port):
+    """Body of a load process: prints the handshakes and failures it completed."""
+    async def run(reactor_):
+        endpoint = endpoints.TCP4ClientEndpoint(reactor, '127.0.0.1', port)
+        deadline = time.monotonic() + DURATION
+        counts = {'handshakes': 0, 'failures': 0}
+        closed = []
+        
+        async def client_loop():
+            while time.monotonic() < deadline:
+                client = BenchClientTransport()
+                closed.append(client.closed)
+                try:
+                    await endpoints.connectProtocol(endpoint, client)
+                    await client.handshake
+                    counts['handshakes'] += 1
+                except Exception:
+                    counts['failures'] += 1
+        
+        await defer.gatherResults([defer.ensureDeferred(client_loop()) for _ in range(CONCURRENCY)])
+        # The server rejects the password after its failed-login delay
+        await defer.gatherResults(closed)
+        print(counts['handshakes'], counts['failures'])
+    
+    task.react(lambda reactor_: defer.ensureDeferred(run(reactor_)))
+
+
+def measure(port):
+    clients = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_ssh_workers', '--load', str(port)],
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        for _ in range(CLIENT_PROCESSES)
+    ]
+    handshakes = failures = 0
+    for client in clients:
+        done, failed = client.communicate()[0].split()
+        handshakes += int(done)
+        failures += int(failed)
+    return handshakes / DURATION, failures
+
+
+def main():
+    backend = ThreadingHTTPServer(('127.0.0.1', 0), MockBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{backend.server_address[1]}"
+    
+    print(f"{os.cpu_count()} cores, {CLIENT_PROCESSES} load processes x {CONCURRENCY} clients, {DURATION:g}s per measurement")
+    print(f"{'workers':>7} {'handshakes/s':>13} {'failures':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for workers in WORKER_COUNTS:
+            port = free_port()
+            env = {
+                **os.environ,
+                'WORKERS': str(workers),
+                'HOST': '127.0.0.1',
+                'PORT': str(port),
+                'API_URL': api_url,
+                'SERVICE_ID': 'bench',
+                # Every load process connects from 127.0.0.1
+                'MAX_CONNECTIONS_PER_IP': '100000',
+                'SSH_KEYS_DIR': os.path.join(work_dir, 'keys'),
+                'EVENT_SPOOL_DIR': os.path.join(work_dir, f"spool-{workers}"),
+            }
+            honeypot = subprocess.Popen(
+                [sys.executable, 'ssh_honeypot_runner.py'],
+                env=env,
+                stdout=subprocess.DEVNULL
+            )
+            try:
+                wait_for_port(port)
+                # Let every worker bind before connections are spread over them
+                time.sleep(2)
+                rate, failures = measure(port)
+            finally:
+                honeypot.send_signal(signal.SIGTERM)
+                honeypot.wait(timeout=30)
+            print(f"{workers:>7} {rate:>13.0f} {failures:>9}")
+    backend.shutdown()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--load']:
+        load(int(sys.argv[2]))
+    else:
+        main()
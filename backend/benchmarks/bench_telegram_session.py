@@ -0,0 +1,93 @@
+"""Compares a new aiohttp session per alert with the pooled TelegramNotifier session.
+
+Starts a local mock of the Bot API sendMessage method and sends the same
+alerts both ways, sequentially and with concurrent senders. The mock
+speaks plain HTTP, so the per-message cost measured for the old path is
+TCP setup only; against api.telegram.org the TLS handshake adds to it.
+
+Run from backend/:
+    python -m benchmarks.bench_telegram_session
+"""
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from app.core.config import settings
+from app.services.alerts.telegram import TelegramNotifier, telegram_sessions
+
+BOT_TOKEN = "123456:bench"
+CHAT_ID = "42"
+MESSAGES = 500
+CONCURRENCY = (1, 20)
+
+ALERT_EVENT = {
+    'event_type': 'ssh_auth_attempt',
+    'honeypot_type': 'ssh',
+    'honeypot_name': 'bench',
+    'source_ip': '198.51.100.7',
+    'timestamp': '2024-01-01T00:00:00+00:00',
+    'details': {'username': 'root', 'password': 'toor'}
+}
+
+
+async def send_message(request):
+    payload = await request.json()
+    request.app['stats']['received'] += 1
+    return web.json_response({'ok': True, 'result': {'chat': {'id': payload['chat_id']}}})
+
+
+async def start_mock_server():
+    app = web.Application()
+    app['stats'] = {'received': 0}
+    app.router.add_post(f"/bot{BOT_TOKEN}/sendMessage", send_message)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, app, f"http://127.0.0.1:{port}"
+
+
+class SessionPerMessageNotifier(TelegramNotifier):
+    """The previous behaviour: a fresh ClientSession for every message."""
+    
+    async def send_message(self, chat_id, text, parse_mode="Markdown"):
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.base_url}/sendMessage", json=payload) as response:
+                await response.read()
+                return response.status == 200
+
+
+async def run(notifier, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def send_one():
+        async with semaphore:
+            assert await notifier.send_alert(CHAT_ID, 2, ALERT_EVENT)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(send_one() for _ in range(MESSAGES)))
+    return MESSAGES / (time.perf_counter() - started)
+
+
+async def main():
+    runner, app, base_url = await start_mock_server()
+    settings.telegram_api_url = base_url
+    try:
+        print(f"{MESSAGES} alerts to a local mock Bot API")
+        print(f"{'senders':>8} {'session/msg msg/s':>18} {'pooled msg/s':>13} {'speedup':>8}")
+        for concurrency in CONCURRENCY:
+            before = await run(SessionPerMessageNotifier(BOT_TOKEN), concurrency)
+            after = await run(TelegramNotifier(BOT_TOKEN), concurrency)
+            print(f"{concurrency:>8} {before:>18.0f} {after:>13.0f} {after / before:>7.1f}x")
+        assert app['stats']['received'] == MESSAGES * 2 * len(CONCURRENCY)
+    finally:
+        await telegram_sessions.close()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Measures the size and CPU cost of the honeypot event wire formats.
+
+Builds a batch of HTTP honeypot events shaped like honeypot_runner's
+(headers, query, form body) and, for every format, encodes it the way the
+runner does and decodes it the way the backend does:
+  
+  - json + request_text: the previous format, every event carrying its
+    request_text, a second copy of URL, query, headers and body;
+  - json, json+gzip, msgpack, msgpack+gzip, msgpack+zstd: request_text
+    left to the backend to rebuild.
+
+Reports bytes per event on the wire and microseconds per event on each side.
+
+Run from backend/:
+    python -m benchmarks.bench_wire_format
+"""
+import json
+import random
+import time
+
+import event_sender
+from app.services.events.wire import decode_event_payload, supported_encodings
+
+EVENTS = 100
+ROUNDS = 50
+MAX_BODY = 64 * 1024 * 1024
+
+
+def make_event(i, rng):
+    token = rng.randbytes(16).hex()
+    query = {'q': f"admin' OR 1=1 -- {i}", 'page': str(i % 7)}
+    query_string = f"q=admin%27+OR+1%3D1+--+{i}&page={i % 7}"
+    full_url = f"http://203.0.113.10:8080/search?{query_string}"
+    headers = {
+        'Host': '203.0.113.10:8080',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate',
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': f"session={token}",
+        'X-Forwarded-For': f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+    }
+    body = f"username=admin&password={rng.randbytes(9).hex()}&csrf={rng.randbytes(24).hex()}"
+    return {
+        'honeypot_id': '5f1d8a0e-7c2b-4f3e-9a61-0d2c4b8e1f37',
+        'event_type': 'http_connection',
+        'source_ip': f"198.51.100.{i % 250}",
+        'details': {
+            'method': 'POST',
+            'path': '/search',
+            'query_string': query_string,
+            'query': query,
+            'headers': headers,
+            'user_agent': headers['User-Agent'],
+            'body': body,
+            'body_length': len(body),
+            'content_type': headers['Content-Type'],
+            'cookies': {'session': token},
+            'full_url': full_url
+        },
+        'honeytoken_check': None
+    }
+
+
+def with_request_text(event):
+    details = dict(event['details'])
+    details['request_text'] = (
+        f"{details['full_url']}\n{details['path']}\n{details['query_string']}\n"
+        f"{json.dumps(details['query'], ensure_ascii=False)}\n"
+        f"{json.dumps(details['headers'], ensure_ascii=False)}\n{details['body']}"
+    )
+    return {**event, 'details': details}
+
+
+def make_sender(wire_format, encoding):
+    sender = event_sender.BackgroundEventSender([], "bench", wire_format=wire_format, compression=encoding)
+    sender._format = wire_format
+    sender._encoding = encoding
+    return sender
+
+
+def measure(sender, batch):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        body, headers = sender._body(sender._encode(batch))
+    encode_us = (time.perf_counter() - started) / (ROUNDS * len(batch)) * 1e6
+    
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        decoded = decode_event_payload(body, headers['Content-Type'], headers.get('Content-Encoding'), MAX_BODY)
+    decode_us = (time.perf_counter() - started) / (ROUNDS * len(batch)) * 1e6
+    assert decoded == batch
+    return len(body) / len(batch), encode_us, decode_us
+
+
+def main():
+    rng = random.Random(0)
+    events = [make_event(i, rng) for i in range(EVENTS)]
+    variants = [
+        ('json + request_text', 'json', 'identity', [with_request_text(event) for event in events]),
+        ('json', 'json', 'identity', events),
+        ('json+gzip', 'json', 'gzip', events),
+    ]
+    if event_sender.msgpack is not None:
+        variants += [
+            ('msgpack', 'msgpack', 'identity', events),
+            ('msgpack+gzip', 'msgpack', 'gzip', events),
+        ]
+        if 'zstd' in supported_encodings() and event_sender.zstandard is not None:
+            variants.append(('msgpack+zstd', 'msgpack', 'zstd', events))
+    
+    print(f"batches of {EVENTS} HTTP events, {ROUNDS} rounds")
+    print(f"{'format':>20} {'bytes/event':>12} {'vs old':>7} {'encode us':>10} {'decode us':>10}")
+    baseline = None
+    for name, wire_format, encoding, batch in variants:
+        size, encode_us, decode_us = measure(make_sender(wire_format, encoding), batch)
+        baseline = baseline or size
+        print(f"{name:>20} {size:>12.0f} {size / baseline:>6.0%} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,903 @@
+#!/usr/bin/env python3
+"""Delivery of honeypot events to the backend, shared by the honeypot runners."""
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+
+import aiohttp
+import requests
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONTENT_TYPES = {'json': 'application/json', 'msgpack': 'application/msgpack'}
+
+
+def _text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _msgpack_array_header(count):
+    if count < 16:
+        return bytes([0x90 | count])
+    if count < 0x10000:
+        return b'\xdc' + struct.pack('>H', count)
+    return b'\xdd' + struct.pack('>I', count)
+
+
+def default_api_urls(api_url):
+    urls = [
+        api_url,
+        "http://host.docker.internal:8000",
+        "http://172.17.0.1:8000",
+        "http://172.19.0.1:8000",
+    ]
+    return list(dict.fromkeys(url for url in urls if url))
+
+
+class MemorySpool:
+    """Bounded FIFO of encoded events kept while the backend is unreachable.
+    
+    When full, the oldest events are dropped and counted in `dropped`.
+    Records are numbered from the head so that consume() after a peek()
+    skips the ones dropped in between instead of removing newer ones.
+    """
+    
+    def __init__(self, max_events=10000):
+        self.max_events = max_events
+        self.dropped = 0
+        self.size_bytes = 0
+        self._records = deque()
+        self._head = 0  # number of records ever removed from the front
+        self._peeked_head = 0
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._records)
+    
+    def append(self, records):
+        with self._lock:
+            self._records.extend(records)
+            self.size_bytes += sum(len(record) for record in records)
+            while len(self._records) > self.max_events:
+                self.size_bytes -= len(self._records.popleft())
+                self._head += 1
+                self.dropped += 1
+    
+    def peek(self, count):
+        with self._lock:
+            self._peeked_head = self._head
+            return list(itertools.islice(self._records, count))
+    
+    def consume(self, count):
+        with self._lock:
+            # Records dropped since the peek were part of the peeked ones; only remove what is left of them
+            count = max(0, self._peeked_head + count - self._head)
+            for _ in range(min(count, len(self._records))):
+                self.size_bytes -= len(self._records.popleft())
+                self._head += 1
+    
+    def close(self):
+        pass
+
+
+class SegmentSpool:
+    """Append-only on-disk spool of encoded events, capped at `max_bytes`.
+    
+    Records are stored as a 4-byte big-endian length followed by the
+    encoded event, in segment files of about `segment_bytes` that are
+    deleted once fully replayed. The replay position is kept in a cursor
+    file, so events spooled before a restart of the runner are replayed
+    by the next one. Over the cap, whole segments are dropped oldest
+    first and their events counted in `dropped`.
+    """
+    
+    HEADER = struct.Struct('>I')
+    
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024, segment_bytes=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._segments = {}  # seq -> [size_bytes, record_count]
+        self._read_seq = None
+        self._read_offset = 0
+        self._pending = 0
+        self._peeked = []
+        self._writer = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+    
+    def __len__(self):
+        return self._pending
+    
+    @property
+    def size_bytes(self):
+        return sum(size for size, _ in self._segments.values())
+    
+    def append(self, records):
+        with self._lock:
+            for record in records:
+                if self._writer is None or self._segments[self._write_seq][0] >= self.segment_bytes:
+                    self._roll()
+                self._writer.write(self.HEADER.pack(len(record)))
+                self._writer.write(record)
+                segment = self._segments[self._write_seq]
+                segment[0] += self.HEADER.size + len(record)
+                segment[1] += 1
+                self._pending += 1
+            self._writer.flush()
+            self._enforce_cap()
+    
+    def peek(self, count):
+        with self._lock:
+            records = []
+            self._peeked = []
+            seq, offset = self._read_seq, self._read_offset
+            for seq in sorted(s for s in self._segments if s >= seq):
+                if seq != self._read_seq:
+                    offset = 0
+                if self._segments[seq][0] <= offset:
+                    continue
+                with open(self._path(seq), 'rb') as f:
+                    f.seek(offset)
+                    while len(records) < count:
+                        header = f.read(self.HEADER.size)
+                        if len(header) < self.HEADER.size:
+                            break
+                        (length,) = self.HEADER.unpack(header)
+                        record = f.read(length)
+                        if len(record) < length:
+                            break
+                        offset += self.HEADER.size + length
+                        records.append(record)
+                        self._peeked.append((seq, offset))
+                if len(records) >= count:
+                    break
+            return records
+    
+    def consume(self, count):
+        with self._lock:
+            if not count or count > len(self._peeked):
+                return
+            seq, offset = self._peeked[count - 1]
+            self._peeked = []
+            self._pending = max(0, self._pending - count)
+            for done in [s for s in self._segments if s < seq]:
+                self._remove(done)
+            self._read_seq, self._read_offset = seq, offset
+            if seq != self._write_seq and offset >= self._segments[seq][0]:
+                self._remove(seq)
+                self._read_seq, self._read_offset = min(self._segments), 0
+            self._save_cursor()
+    
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+    
+    def _path(self, seq):
+        return os.path.join(self.directory, f"segment-{seq:012d}.spool")
+    
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if name.startswith('segment-') and name.endswith('.spool'):
+                seq = int(name[len('segment-'):-len('.spool')])
+                self._segments[seq] = [os.path.getsize(self._path(seq)), 0]
+        
+        cursor_seq, cursor_offset = None, 0
+        try:
+            with open(os.path.join(self.directory, 'cursor'), 'r') as f:
+                cursor_seq, cursor_offset = (int(value) for value in f.read().split())
+        except (OSError, ValueError):
+            pass
+        
+        for seq in sorted(self._segments):
+            if cursor_seq is not None and seq < cursor_seq:
+                self._remove(seq)
+                continue
+            start = cursor_offset if seq == cursor_seq else 0
+            self._segments[seq][1] = self._count_records(seq, start)
+            self._pending += self._segments[seq][1]
+        
+        self._write_seq = max(self._segments, default=0) + 1
+        self._segments[self._write_seq] = [0, 0]
+        if cursor_seq in self._segments:
+            self._read_seq, self._read_offset = cursor_seq, cursor_offset
+        else:
+            self._read_seq, self._read_offset = min(self._segments), 0
+    
+    def _count_records(self, seq, offset):
+        count = 0
+        with open(self._path(seq), 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return count
+                (length,) = self.HEADER.unpack(header)
+                if len(f.read(length)) < length:
+                    return count
+                count += 1
+    
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+            if self._segments[self._write_seq][1]:
+                self._write_seq += 1
+                self._segments[self._write_seq] = [0, 0]
+        self._writer = open(self._path(self._write_seq), 'ab')
+    
+    def _remove(self, seq):
+        self._segments.pop(seq, None)
+        try:
+            os.remove(self._path(seq))
+        except OSError:
+            pass
+    
+    def _enforce_cap(self):
+        while self.size_bytes > self.max_bytes and len(self._segments) > 1:
+            oldest = min(self._segments)
+            count = self._segments[oldest][1]
+            if oldest == self._read_seq:
+                count = self._count_records(oldest, self._read_offset)
+            self.dropped += count
+            self._pending = max(0, self._pending - count)
+            self._remove(oldest)
+            self._peeked = []
+            self._read_seq, self._read_offset = min(self._segments), 0
+            self._save_cursor()
+    
+    def _save_cursor(self):
+        with open(os.path.join(self.directory, 'cursor'), 'w') as f:
+            f.write(f"{self._read_seq} {self._read_offset}")
+
+
+def open_spool(directory, max_bytes, log_prefix="[HONEYPOT]"):
+    """Opens a SegmentSpool in `directory`, or a MemorySpool if it is not writable."""
+    try:
+        spool = SegmentSpool(directory, max_bytes=max_bytes)
+    except OSError as e:
+        print(f"{log_prefix} Cannot use spool directory {directory} ({e}), spooling in memory")
+        return MemorySpool()
+    if len(spool):
+        print(f"{log_prefix} {len(spool)} spooled events from a previous run will be replayed")
+    return spool
+
+
+class EventSenderBase:
+    """Settings, endpoint discovery, circuit breaker and counters shared by the senders.
+    
+    The backend URL is discovered once by probing GET /health on each of
+    `api_urls` and reused for every batch. When no URL answers, or the
+    chosen one fails a batch, the circuit opens: batches go straight to
+    the spool without touching the network for `reset_timeout` seconds,
+    doubling up to `max_reset_timeout` while probes keep failing. Once a
+    probe succeeds the spool is replayed in batches between live ones.
+    Events of an accepted batch that the backend could not take because of
+    its own backpressure are spooled again; when that is the whole batch
+    the circuit opens as well.
+    Events that do not fit in the queue wait in an overflow buffer of up
+    to `overflow_size` events (default `queue_size`) until the sender
+    moves them to the spool, so send() never encodes or touches the disk
+    on the honeypot's thread; past that they are dropped and counted.
+    
+    The /health probe also lists the formats the backend accepts; batches
+    go out as `wire_format` (msgpack or json) compressed with
+    `compression` (zstd or gzip) when both sides support them, and as
+    plain JSON otherwise.
+    """
+    
+    def __init__(
+        self,
+        api_urls,
+        token,
+        queue_size=10000,
+        overflow_size=None,
+        batch_size=100,
+        flush_interval=0.5,
+        timeout=2.0,
+        probe_timeout=1.0,
+        reset_timeout=5.0,
+        max_reset_timeout=60.0,
+        spool=None,
+        wire_format='msgpack',
+        compression='zstd',
+        stats_interval=60.0,
+        log_prefix="[HONEYPOT]"
+    ):
+        self.api_urls = list(api_urls)
+        self.token = token
+        self.queue_size = queue_size
+        self.overflow_size = overflow_size if overflow_size is not None else queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.wire_format = wire_format
+        self.compression = compression
+        self.stats_interval = stats_interval
+        self.log_prefix = log_prefix
+        self._spool = spool if spool is not None else MemorySpool()
+        self._overflow = deque()
+        self._endpoint = None
+        self._open_until = 0.0
+        self._backoff = reset_timeout
+        self._format = 'json'
+        self._encoding = 'identity'
+        self._zstd = zstandard.ZstdCompressor(level=3) if zstandard is not None else None
+        self._lock = threading.Lock()
+        self._stats = {
+            'queued': 0,
+            'overflow': 0,
+            'dropped': 0,
+            'invalid': 0,
+            'sent': 0,
+            'rejected': 0,
+            'retried': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'circuit_opens': 0,
+            'batches': 0,
+            'last_latency_ms': 0.0,
+            'max_latency_ms': 0.0,
+            'total_latency_ms': 0.0,
+        }
+    
+    def queue_depth(self):
+        raise NotImplementedError
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats.pop('batches')
+        total_latency_ms = stats.pop('total_latency_ms')
+        stats['queue_depth'] = self.queue_depth()
+        stats['overflow_depth'] = len(self._overflow)
+        stats['spool_depth'] = len(self._spool)
+        stats['spool_bytes'] = self._spool.size_bytes
+        stats['spool_dropped'] = self._spool.dropped
+        stats['circuit'] = self._circuit_state()
+        stats['endpoint'] = self._endpoint
+        stats['wire_format'] = f"{self._format}+{self._encoding}"
+        stats['batches'] = batches
+        stats['avg_latency_ms'] = round(total_latency_ms / batches, 2) if batches else 0.0
+        stats['last_latency_ms'] = round(stats['last_latency_ms'], 2)
+        stats['max_latency_ms'] = round(stats['max_latency_ms'], 2)
+        return stats
+    
+    def log_stats(self):
+        print(f"{self.log_prefix} Event sender: {self.stats()}")
+    
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+    
+    def _encode(self, batch):
+        """Serializes each event in the negotiated format, dropping events that cannot be encoded."""
+        records = []
+        for event in batch:
+            try:
+                if self._format == 'msgpack':
+                    records.append(msgpack.packb(event, use_bin_type=False, default=_text))
+                else:
+                    records.append(json.dumps(event, default=_text).encode())
+            except (TypeError, ValueError):
+                self._count('invalid')
+        return records
+    
+    def _body(self, records):
+        """Builds the request body and headers for encoded records.
+        
+        Records are kept in the spool as they were encoded; ones from before a
+        format change (JSON records start with '{', msgpack ones with a map
+        header) are converted here.
+        """
+        if self._format == 'msgpack':
+            records = [
+                msgpack.packb(json.loads(record), use_bin_type=False) if record[:1] == b'{' else record
+                for record in records
+            ]
+            body = _msgpack_array_header(len(records)) + b''.join(records)
+        else:
+            records = [
+                record if record[:1] == b'{' else json.dumps(msgpack.unpackb(record, raw=False)).encode()
+                for record in records
+            ]
+            body = b'[' + b','.join(records) + b']'
+        
+        headers = {'Content-Type': CONTENT_TYPES[self._format]}
+        if self._encoding == 'zstd':
+            body = self._zstd.compress(body)
+            headers['Content-Encoding'] = 'zstd'
+        elif self._encoding == 'gzip':
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+    
+    def _negotiate(self, health):
+        """Picks the wire format from what the backend lists in GET /health."""
+        formats = health.get('event_formats') or ['json']
+        encodings = health.get('event_encodings') or []
+        self._format = 'msgpack' if self.wire_format == 'msgpack' and msgpack is not None and 'msgpack' in formats else 'json'
+        if self.compression == 'zstd' and zstandard is not None and 'zstd' in encodings:
+            self._encoding = 'zstd'
+        elif self.compression in ('zstd', 'gzip') and 'gzip' in encodings:
+            self._encoding = 'gzip'
+        else:
+            self._encoding = 'identity'
+    
+    def _circuit_state(self):
+        if self._endpoint is not None:
+            return 'closed'
+        return 'open' if time.monotonic() < self._open_until else 'half-open'
+    
+    def _circuit_blocked(self):
+        return self._endpoint is None and time.monotonic() < self._open_until
+    
+    def _replay_due(self):
+        return len(self._spool) > 0 and not self._circuit_blocked()
+    
+    def _discovered(self, api_url, health=None):
+        if api_url is None:
+            self._open_circuit("no backend URL answered")
+            return
+        self._negotiate(health if isinstance(health, dict) else {})
+        self._endpoint = api_url
+        self._backoff = self.reset_timeout
+        print(f"{self.log_prefix} Backend reachable at {api_url}, sending {self._format}+{self._encoding}")
+    
+    def _open_circuit(self, reason):
+        self._endpoint = None
+        self._open_until = time.monotonic() + self._backoff
+        self._count('circuit_opens')
+        print(f"{self.log_prefix} Backend unavailable ({reason}), spooling events for {self._backoff:g}s")
+        self._backoff = min(self._backoff * 2, self.max_reset_timeout)
+    
+    def _spill(self, event):
+        """Parks an event the queue has no room for; returns False if the overflow buffer is full too."""
+        if len(self._overflow) >= self.overflow_size:
+            self._count('dropped')
+            return False
+        self._overflow.append(event)
+        self._count('overflow')
+        return True
+    
+    def _spool_overflow(self):
+        """Encodes and spools the parked overflow events; only the sender calls this."""
+        events = []
+        while self._overflow:
+            events.append(self._overflow.popleft())
+        if events:
+            self._spool_records(self._encode(events))
+    
+    def _consume_and_spool(self, count, records):
+        self._spool.consume(count)
+        self._spool_records(records)
+    
+    def _spool_records(self, records):
+        if not records:
+            return
+        self._spool.append(records)
+        self._count('spooled', len(records))
+    
+    def _delivered(self, records, result, started, replayed=False):
+        """Counts a delivered batch; returns the records the backend asked to have retried."""
+        count = len(records)
+        retry = [records[i] for i in result.get('retry', [])]
+        if count and len(retry) == count:
+            # The backend shed the whole batch; back off as for a 503 instead of replaying it right away
+            self._open_circuit("backend shed the whole batch")
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['last_latency_ms'] = latency_ms
+            self._stats['total_latency_ms'] += latency_ms
+            self._stats['max_latency_ms'] = max(self._stats['max_latency_ms'], latency_ms)
+            self._stats['sent'] += result.get('accepted', count)
+            # Only events the backend refused as invalid are lost; the rest go back to the spool
+            self._stats['rejected'] += max(0, result.get('failed', 0) - len(retry))
+            self._stats['retried'] += len(retry)
+            if replayed:
+                self._stats['replayed'] += count
+        return retry
+    
+    def _result(self, status, payload, count):
+        """Maps a batch response to its result, or None when the batch should be spooled.
+        
+        A 415 switches the sender to plain JSON for good and asks for the
+        batch to be sent again right away with {'resend': True}.
+        
+        For a 200, result['retry'] holds the indices of the events whose
+        per-item result is an error the backend flagged as retryable (its
+        queue, stream or database could not take them right now); those are
+        spooled again and the other failures are counted as rejected.
+        """
+        if status == 200:
+            result = payload if isinstance(payload, dict) else {}
+            retry = set()
+            for item in result.get('results') or []:
+                if isinstance(item, dict) and item.get('status') == 'error' and item.get('retry'):
+                    index = item.get('index')
+                    if isinstance(index, int) and 0 <= index < count:
+                        retry.add(index)
+            result['retry'] = sorted(retry)
+            return result
+        if status == 415:
+            if (self._format, self._encoding) == ('json', 'identity'):
+                return None
+            # The backend does not take this format after all; send plain JSON from now on, this batch included
+            print(f"{self.log_prefix} Backend refused {self._format}+{self._encoding}, switching to json+identity")
+            self.wire_format, self.compression = 'json', None
+            self._format, self._encoding = 'json', 'identity'
+            return {'resend': True}
+        if 400 <= status < 500 and status != 429:
+            # Retrying cannot help (bad token, oversized or malformed batch)
+            print(f"{self.log_prefix} Backend rejected {count} events with status {status}")
+            return {'accepted': 0, 'failed': count}
+        return None
+
+
+class BackgroundEventSender(EventSenderBase):
+    """Ships events to /api/events/internal/batch from a daemon thread.
+    
+    send() only puts the event on a bounded queue, so the honeypot can
+    answer the attacker right away; what does not fit is spooled by the
+    worker. The worker drains the queue in batches
+    of up to `batch_size` events or whatever arrived within
+    `flush_interval` seconds, and posts them over one keep-alive
+    requests.Session. Overflow, spooling and send latency are counted and
+    logged every `stats_interval` seconds.
+    """
+    
+    def __init__(self, api_urls, token, **kwargs):
+        super().__init__(api_urls, token, **kwargs)
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._session = requests.Session()
+        self._session.headers.update({"X-Honeypot-Token": token})
+        self._thread = None
+        self._stopping = threading.Event()
+    
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="event-sender", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self, timeout=5.0):
+        """Flushes what is queued (bounded by timeout) and stops the worker."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            print(f"{self.log_prefix} Spooling {len(leftover)} unsent events on shutdown")
+            self._spool_records(self._encode(leftover))
+        self._spool_overflow()
+        self._session.close()
+        self._spool.close()
+        self.log_stats()
+    
+    def send(self, event):
+        """Queues an event, parking it for the spool if the queue is full; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            return self._spill(event)
+        self._count('queued')
+        return True
+    
+    def queue_depth(self):
+        return self._queue.qsize()
+    
+    def _run(self):
+        next_stats = time.monotonic() + self.stats_interval
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = self._collect(block=not self._replay_due())
+                if batch:
+                    records = self._encode(batch)
+                    retry = self._deliver(records)
+                    self._spool_records(records if retry is None else retry)
+                self._spool_overflow()
+                if self._replay_due() and not self._stopping.is_set():
+                    self._replay()
+            except Exception as e:
+                print(f"{self.log_prefix} Error sending events: {e}")
+            if time.monotonic() >= next_stats:
+                self.log_stats()
+                next_stats = time.monotonic() + self.stats_interval
+    
+    def _collect(self, block=True):
+        try:
+            if block:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            else:
+                batch = [self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+        
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                remaining = 0
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _ensure_endpoint(self):
+        if self._endpoint is None and not self._circuit_blocked():
+            for api_url in self.api_urls:
+                health = self._probe(api_url)
+                if health is not None:
+                    self._discovered(api_url, health)
+                    break
+            else:
+                self._discovered(None)
+        return self._endpoint
+    
+    def _probe(self, api_url):
+        """Returns the GET /health response of a backend URL, or None if it does not answer."""
+        try:
+            response = self._session.get(f"{api_url}/health", timeout=self.probe_timeout)
+            if response.status_code != 200:
+                return None
+            try:
+                return response.json()
+            except ValueError:
+                return {}
+        except requests.RequestException:
+            return None
+    
+    def _deliver(self, records, replayed=False):
+        """Posts records to the discovered backend.
+        
+        Returns the records to spool again, or None if the whole batch
+        belongs in the spool.
+        """
+        if not records:
+            return []
+        if self._ensure_endpoint() is None:
+            return None
+        
+        started = time.perf_counter()
+        while True:
+            try:
+                body, headers = self._body(records)
+                response = self._session.post(
+                    f"{self._endpoint}/api/events/internal/batch",
+                    data=body,
+                    headers=headers,
+                    timeout=self.timeout
+                )
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = {}
+                result = self._result(response.status_code, payload, len(records))
+                reason = f"status {response.status_code}"
+            except requests.RequestException as e:
+                result = None
+                reason = type(e).__name__
+            if result is None or not result.get('resend'):
+                break
+        
+        if result is None:
+            self._open_circuit(reason)
+            return None
+        return self._delivered(records, result, started, replayed)
+    
+    def _replay(self):
+        records = self._spool.peek(self.batch_size)
+        retry = self._deliver(records, replayed=True)
+        if retry is not None:
+            self._consume_and_spool(len(records), retry)
+
+
+class AsyncEventEmitter(EventSenderBase):
+    """Ships events to /api/events/internal/batch from a task on the running loop.
+    
+    For the asyncio honeypots: send() is a plain put_nowait on an in-loop
+    queue, so connection handlers never wait on the backend. One task
+    batches the queue the same way BackgroundEventSender does and posts
+    the batches over one pooled keep-alive aiohttp session.
+    """
+    
+    def __init__(self, api_urls, token, connection_limit=4, **kwargs):
+        super().__init__(api_urls, token, **kwargs)
+        self.connection_limit = connection_limit
+        self._queue = None
+        self._session = None
+        self._task = None
+        self._next_stats = 0.0
+    
+    @property
+    def running(self):
+        return self._task is not None
+    
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connection_limit),
+            headers={"X-Honeypot-Token": self.token},
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self._next_stats = time.monotonic() + self.stats_interval
+        self._task = asyncio.create_task(self._run(), name="event-emitter")
+    
+    async def stop(self, timeout=5.0):
+        """Flushes what is queued (bounded by timeout) and stops the task."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            print(f"{self.log_prefix} Spooling {len(leftover)} unsent events on shutdown")
+            await asyncio.to_thread(self._spool_records, self._encode(leftover))
+        await asyncio.to_thread(self._spool_overflow)
+        await self._session.close()
+        self._spool.close()
+        self.log_stats()
+    
+    def send(self, event):
+        """Queues an event, parking it for the spool if the queue is full; returns False if it was dropped."""
+        if self._queue is None:
+            return self._spill(event)
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return self._spill(event)
+        self._count('queued')
+        return True
+    
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue else 0
+    
+    async def _run(self):
+        while True:
+            batch = await self._collect(block=not self._replay_due())
+            try:
+                if batch:
+                    records = self._encode(batch)
+                    retry = await self._deliver(records)
+                    # Spool I/O goes to a thread so it does not stall the connection handlers
+                    await asyncio.to_thread(self._spool_records, records if retry is None else retry)
+                if self._overflow:
+                    await asyncio.to_thread(self._spool_overflow)
+                if self._replay_due():
+                    await self._replay()
+            except Exception as e:
+                print(f"{self.log_prefix} Error sending events: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if time.monotonic() >= self._next_stats:
+                self.log_stats()
+                self._next_stats = time.monotonic() + self.stats_interval
+    
+    async def _collect(self, block=True):
+        if not block and self._queue.empty():
+            return []
+        try:
+            # Wake up periodically while events are spooled so a recovered backend gets the replay
+            batch = [await asyncio.wait_for(self._queue.get(), self.flush_interval if len(self._spool) or self._overflow else None)]
+        except asyncio.TimeoutError:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _ensure_endpoint(self):
+        if self._endpoint is None and not self._circuit_blocked():
+            for api_url in self.api_urls:
+                health = await self._probe(api_url)
+                if health is not None:
+                    self._discovered(api_url, health)
+                    break
+            else:
+                self._discovered(None)
+        return self._endpoint
+    
+    async def _probe(self, api_url):
+        """Returns the GET /health response of a backend URL, or None if it does not answer."""
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+            async with self._session.get(f"{api_url}/health", timeout=timeout) as response:
+                if response.status != 200:
+                    return None
+                try:
+                    return await response.json(content_type=None) or {}
+                except ValueError:
+                    return {}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+    
+    async def _deliver(self, records, replayed=False):
+        """Posts records to the discovered backend.
+        
+        Returns the records to spool again, or None if the whole batch
+        belongs in the spool.
+        """
+        if not records:
+            return []
+        if await self._ensure_endpoint() is None:
+            return None
+        
+        started = time.perf_counter()
+        while True:
+            try:
+                body, headers = self._body(records)
+                async with self._session.post(
+                    f"{self._endpoint}/api/events/internal/batch",
+                    data=body,
+                    headers=headers
+                ) as response:
+                    try:
+                        payload = await response.json(content_type=None)
+                    except ValueError:
+                        payload = {}
+                    result = self._result(response.status, payload, len(records))
+                    reason = f"status {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result = None
+                reason = type(e).__name__
+            if result is None or not result.get('resend'):
+                break
+        
+        if result is None:
+            self._open_circuit(reason)
+            return None
+        return self._delivered(records, result, started, replayed)
+    
+    async def _replay(self):
+        records = await asyncio.to_thread(self._spool.peek, self.batch_size)
+        retry = await self._deliver(records, replayed=True)
+        if retry is not None:
+            await asyncio.to_thread(self._consume_and_spool, len(records), retry)
@@ -2,8 +2,9 @@
 import os
 import sys
 from flask import Flask, request, jsonify
-import requests
 import json
+import atexit
+from event_sender import BackgroundEventSender, default_api_urls, open_spool
 
 SERVICE_ID = os.getenv('SERVICE_ID', 'unknown')
 PORT = int(os.getenv('PORT', '8080'))
@@ -13,31 +14,21 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
 
 app = Flask(__name__)
 
-def send_event_to_backend(event_data):
-    try:
-        token = SECRET_KEY[:16]
-        api_urls = [
-            API_URL,
-            "http://host.docker.internal:8000",
-            "http://172.17.0.1:8000",
-            "http://172.19.0.1:8000",
-        ]
-        
-        for api_url in api_urls:
-            try:
-                response = requests.post(
-                    f"{api_url}/api/events/internal",
-                    json=event_data,
-                    headers={"X-Honeypot-Token": token},
-                    timeout=2
-                )
-                if response.status_code == 200:
-                    return True
-            except Exception:
-                continue
-    except Exception as e:
-        print(f"[HONEYPOT] Failed to send event: {e}")
-    return False
+event_sender = BackgroundEventSender(
+    default_api_urls(API_URL),
+    SECRET_KEY[:16],
+    queue_size=int(os.getenv('EVENT_QUEUE_SIZE', '10000')),
+    batch_size=int(os.getenv('EVENT_BATCH_SIZE', '100')),
+    flush_interval=float(os.getenv('EVENT_FLUSH_INTERVAL', '0.5')),
+    spool=open_spool(
+        os.getenv('EVENT_SPOOL_DIR', '/tmp/honeypot-spool'),
+        int(os.getenv('EVENT_SPOOL_MAX_MB', '50')) * 1024 * 1024,
+        log_prefix="[HONEYPOT]"
+    ),
+    wire_format=os.getenv('EVENT_WIRE_FORMAT', 'msgpack'),
+    compression=os.getenv('EVENT_COMPRESSION', 'zstd'),
+    log_prefix="[HONEYPOT]"
+)
 
 @app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
 @app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
@@ -109,9 +100,6 @@ def handle_request(path):
     
     all_headers = dict(request.headers)
     
-    query_params_str = json.dumps(query_params, ensure_ascii=False) if query_params else ''
-    request_text = f"{full_url}\n{request.path}\n{query_string}\n{query_params_str}\n{json.dumps(all_headers, ensure_ascii=False)}\n{body_data}"
-    
     event_data = {
         'honeypot_id': SERVICE_ID,
         'event_type': 'http_connection',
@@ -128,13 +116,17 @@ def handle_request(path):
             'body_length': len(body_data) if body_data else 0,
             'content_type': request.content_type,
             'cookies': dict(request.cookies),
-            'full_url': full_url,
-            'request_text': request_text
+            'full_url': full_url
         },
         'honeytoken_check': None
     }
     
-    send_event_to_backend(event_data)
+    if body_data and len(body_data) > 10000:
+        # The backend rebuilds request_text from details, which only keep the first 10000 characters of the body
+        query_params_str = json.dumps(query_params, ensure_ascii=False) if query_params else ''
+        event_data['details']['request_text'] = f"{full_url}\n{request.path}\n{query_string}\n{query_params_str}\n{json.dumps(all_headers, ensure_ascii=False)}\n{body_data}"
+    
+    event_sender.send(event_data)
     
     search_query = query_params.get('q', '')
     response_html = f"""
@@ -189,4 +181,6 @@ if __name__ == '__main__':
     print(f"[HONEYPOT] Starting Flask HTTP Honeypot on {HOST}:{PORT}")
     print(f"[HONEYPOT] Service ID: {SERVICE_ID}")
     print(f"[HONEYPOT] API URL: {API_URL}")
+    event_sender.start()
+    atexit.register(event_sender.stop)
     app.run(host=HOST, port=PORT, debug=False)
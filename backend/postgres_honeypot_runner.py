@@ -4,41 +4,138 @@ import sys
 import socket
 import struct
 import json
-import requests
 import asyncio
+import signal
+import time
+import traceback
+from datetime import datetime, timezone
 from typing import Optional, Dict
+from event_sender import AsyncEventEmitter, default_api_urls, open_spool
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 SERVICE_ID = os.getenv('SERVICE_ID', 'unknown')
 PORT = int(os.getenv('PORT', '5432'))
 HOST = os.getenv('HOST', '0.0.0.0')
 API_URL = os.getenv('API_URL', 'http://172.17.0.1:8000')
 SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
+MAX_MESSAGE_SIZE = int(os.getenv('MAX_MESSAGE_SIZE', str(1024 * 1024)))
+READ_SIZE = 65536
+# Postgres rejects startup packets over 10000 bytes; nothing longer is expected before authentication
+AUTH_MESSAGE_SIZE = 10000
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', '1000'))
+MAX_CONNECTIONS_PER_IP = int(os.getenv('MAX_CONNECTIONS_PER_IP', '20'))
+IDLE_TIMEOUT = float(os.getenv('IDLE_TIMEOUT', '60'))
+SESSION_TIMEOUT = float(os.getenv('SESSION_TIMEOUT', '600'))
+MAX_PREPARED_STATEMENTS = int(os.getenv('MAX_PREPARED_STATEMENTS', '1000'))
+MAX_PREPARED_BYTES = int(os.getenv('MAX_PREPARED_BYTES', str(1024 * 1024)))
+LIMIT_REPORT_INTERVAL = float(os.getenv('LIMIT_REPORT_INTERVAL', '60'))
+CLOSE_TIMEOUT = 5.0
+WORKERS = int(os.getenv('WORKERS', '1'))
+EVENT_LOOP = os.getenv('EVENT_LOOP', 'asyncio')
+EVENT_SPOOL_DIR = os.getenv('EVENT_SPOOL_DIR', '/tmp/honeypot-spool')
+EVENT_SPOOL_MAX_BYTES = int(os.getenv('EVENT_SPOOL_MAX_MB', '50')) * 1024 * 1024
 
-def send_event_to_backend(event_data):
-    try:
-        token = SECRET_KEY[:16]
-        api_urls = [
-            API_URL,
-            "http://host.docker.internal:8000",
-            "http://172.17.0.1:8000",
-            "http://172.19.0.1:8000",
-        ]
-        
-        for api_url in api_urls:
+
+def create_event_emitter(spool_dir: str, spool_max_bytes: int) -> AsyncEventEmitter:
+    return AsyncEventEmitter(
+        default_api_urls(API_URL),
+        SECRET_KEY[:16],
+        queue_size=int(os.getenv('EVENT_QUEUE_SIZE', '10000')),
+        batch_size=int(os.getenv('EVENT_BATCH_SIZE', '100')),
+        flush_interval=float(os.getenv('EVENT_FLUSH_INTERVAL', '0.5')),
+        spool=open_spool(spool_dir, spool_max_bytes, log_prefix="[POSTGRES-HONEYPOT]"),
+        wire_format=os.getenv('EVENT_WIRE_FORMAT', 'msgpack'),
+        compression=os.getenv('EVENT_COMPRESSION', 'zstd'),
+        log_prefix="[POSTGRES-HONEYPOT]"
+    )
+
+# Created by main() in the process that serves connections, so forked workers never share a spool
+event_emitter: Optional[AsyncEventEmitter] = None
+
+class FrameError(ValueError):
+    pass
+
+
+class FrameParser:
+    """Incremental parser for Postgres frontend messages.
+    
+    feed() appends received data to one bytearray; next_startup() and
+    next_message() return complete messages as memoryviews into it, without
+    copying, or None until enough data has arrived. A view stays valid until
+    the next feed(). A message longer than max_message_size raises
+    FrameError as soon as its length is known, before it is buffered.
+    """
+    
+    HEADER = struct.Struct('!cI')
+    STARTUP_HEADER = struct.Struct('!I')
+    
+    def __init__(self, max_message_size: int = MAX_MESSAGE_SIZE):
+        self.max_message_size = max_message_size
+        self._buf = bytearray()
+        self._view = memoryview(self._buf)
+        self._start = 0
+    
+    @property
+    def buffered(self) -> int:
+        return len(self._buf) - self._start
+    
+    def feed(self, data: bytes):
+        self._view.release()
+        if self._start == len(self._buf):
+            self._buf = bytearray(data)
+        else:
             try:
-                response = requests.post(
-                    f"{api_url}/api/events/internal",
-                    json=event_data,
-                    headers={"X-Honeypot-Token": token},
-                    timeout=2
-                )
-                if response.status_code == 200:
-                    return True
-            except Exception:
-                continue
-    except Exception as e:
-        print(f"[POSTGRES-HONEYPOT] Failed to send event: {e}")
-    return False
+                del self._buf[:self._start]
+                self._buf += data
+            except BufferError:
+                # Frames handed out earlier still pin the buffer; move the unread tail to a new one
+                self._buf = self._buf[self._start:] + data
+        self._start = 0
+        self._view = memoryview(self._buf)
+    
+    def next_startup(self) -> Optional[memoryview]:
+        """Returns the next untyped message (StartupMessage, SSLRequest, CancelRequest)."""
+        start = self._start
+        if len(self._buf) - start < 4:
+            return None
+        (length,) = self.STARTUP_HEADER.unpack_from(self._buf, start)
+        if length < 8:
+            raise FrameError(f"invalid startup message length {length}")
+        if length > self.max_message_size:
+            raise FrameError(f"message of {length} bytes exceeds {self.max_message_size}")
+        end = start + length
+        if end > len(self._buf):
+            return None
+        self._start = end
+        return self._view[start:end]
+    
+    def next_message(self) -> Optional[tuple[bytes, memoryview]]:
+        """Returns the type and the whole message, type byte and length included."""
+        start = self._start
+        if len(self._buf) - start < 5:
+            return None
+        mtype, mlen = self.HEADER.unpack_from(self._buf, start)
+        if mlen < 4:
+            raise FrameError(f"invalid message length {mlen}")
+        if mlen >= self.max_message_size:
+            raise FrameError(f"message of {mlen + 1} bytes exceeds {self.max_message_size}")
+        end = start + 1 + mlen
+        if end > len(self._buf):
+            return None
+        self._start = end
+        return mtype, self._view[start:end]
+
+
+def read_cstring(data, pos: int) -> Optional[str]:
+    """Returns the NUL-terminated string at pos of a message, or None if it is not terminated."""
+    rest = bytes(data[pos:])
+    end = rest.find(b'\x00')
+    if end == -1:
+        return None
+    return rest[:end].decode('utf-8', errors='replace')
 
 def parse_startup_message(data: bytes) -> Dict:
     if len(data) < 8:
@@ -52,7 +149,7 @@ def parse_startup_message(data: bytes) -> Dict:
     if proto == 80877102:
         return {}
     
-    payload = data[8:length]
+    payload = bytes(data[8:length])
     params = {}
     
     try:
@@ -86,15 +183,12 @@ def parse_query_message(data: bytes) -> Optional[str]:
     if length == 5:
         return ""
     
-    query_bytes = data[5:length-1]
+    # The length excludes the type byte, so the terminating NUL is at data[length]
+    query_bytes = data[5:length]
     if not query_bytes:
         return ""
     
-    try:
-        query = query_bytes.decode('utf-8', errors='replace')
-        return query.strip()
-    except Exception:
-        return query_bytes.decode('utf-8', errors='replace').strip()
+    return str(query_bytes, 'utf-8', errors='replace').strip()
 
 def parse_parse_message(data: bytes) -> Optional[str]:
     """Parse PostgreSQL Parse message (extended query protocol) to extract SQL query"""
@@ -114,6 +208,7 @@ def parse_parse_message(data: bytes) -> Optional[str]:
     if length == 5:
         return ""
     
+    data = bytes(data[:length])
     pos = 5
     
     stmt_name_end = data.find(b'\x00', pos)
@@ -138,91 +233,220 @@ def parse_parse_message(data: bytes) -> Optional[str]:
     except Exception:
         return query_bytes.decode('utf-8', errors='replace').strip()
 
-async def send_authentication_request(writer, auth_type=3):
-    response = b'R' + struct.pack('!I', 8) + struct.pack('!I', auth_type)
-    writer.write(response)
-    await writer.drain()
-
-async def send_authentication_ok(writer):
-    response = b'R' + struct.pack('!I', 8) + struct.pack('!I', 0)
-    writer.write(response)
-    await writer.drain()
+def error_message(code: str, message: str) -> bytes:
+    """Builds a FATAL ErrorResponse with the given SQLSTATE code."""
+    fields = [
+        (b'S', b'FATAL'),
+        (b'C', code.encode()),
+        (b'M', message.encode('utf-8', errors='replace')),
+    ]
+    message_content = b''.join([code + value + b'\x00' for code, value in fields]) + b'\x00'
+    return b'E' + struct.pack('!I', 4 + len(message_content)) + message_content
 
-async def send_ready_for_query(writer):
-    response = b'Z' + struct.pack('!I', 5) + b'I'
-    writer.write(response)
-    await writer.drain()
+AUTH_CLEARTEXT_PASSWORD = b'R' + struct.pack('!II', 8, 3)
+AUTH_OK = b'R' + struct.pack('!II', 8, 0)
+READY_FOR_QUERY = b'Z' + struct.pack('!I', 5) + b'I'
+PARSE_COMPLETE = b'1' + struct.pack('!I', 4)
+BIND_COMPLETE = b'2' + struct.pack('!I', 4)
+SELECT_0_COMPLETE = b'C' + struct.pack('!I', 13) + b'SELECT 0\x00'
+SSL_REFUSED = b'N'
+# One int4 column named "id", sent in text format
+ID_ROW_DESCRIPTION = b'T' + struct.pack('!IH', 27, 1) + b'id\x00' + struct.pack('!IhIhih', 0, 0, 23, 4, -1, 0)
+DATA_ROW_HEADER = struct.Struct('!cIHI')
+TOO_MANY_CONNECTIONS = error_message('53300', 'sorry, too many clients already')
 
-async def send_parse_complete(writer):
-    response = b'1' + struct.pack('!I', 4)
-    writer.write(response)
-    await writer.drain()
+class ResponseBuilder:
+    """Collects the backend messages of one client round and sends them with one write.
+    
+    Messages are appended to a preallocated bytearray that grows by doubling
+    and is reused across rounds; flush() writes what was collected and drains
+    the writer once.
+    """
+    
+    def __init__(self, writer, size: int = 4096):
+        self.writer = writer
+        self._buf = bytearray(size)
+        self._len = 0
+    
+    def __len__(self):
+        return self._len
+    
+    def _reserve(self, n: int) -> int:
+        end = self._len + n
+        if end > len(self._buf):
+            self._buf.extend(bytes(max(n, len(self._buf))))
+        return end
+    
+    def append(self, message: bytes):
+        end = self._reserve(len(message))
+        self._buf[self._len:end] = message
+        self._len = end
+    
+    def ssl_refused(self):
+        self.append(SSL_REFUSED)
+    
+    def authentication_request(self):
+        self.append(AUTH_CLEARTEXT_PASSWORD)
+    
+    def authentication_ok(self):
+        self.append(AUTH_OK)
+    
+    def ready_for_query(self):
+        self.append(READY_FOR_QUERY)
+    
+    def parse_complete(self):
+        self.append(PARSE_COMPLETE)
+    
+    def bind_complete(self):
+        self.append(BIND_COMPLETE)
+    
+    def command_complete(self):
+        self.append(SELECT_0_COMPLETE)
+    
+    def error_response(self, message: str, code: str = '28P01'):
+        self.append(error_message(code, message))
+    
+    def query_response(self, rows=None):
+        if rows:
+            self.append(ID_ROW_DESCRIPTION)
+            for row in rows:
+                value = str(row).encode()
+                end = self._reserve(DATA_ROW_HEADER.size + len(value))
+                DATA_ROW_HEADER.pack_into(self._buf, self._len, b'D', 10 + len(value), 1, len(value))
+                self._buf[end - len(value):end] = value
+                self._len = end
+        self.command_complete()
+        self.ready_for_query()
+    
+    async def flush(self):
+        if not self._len:
+            return
+        # The transport may keep a reference to what it is given, so hand it a copy
+        self.writer.write(bytes(memoryview(self._buf)[:self._len]))
+        self._len = 0
+        await self.writer.drain()
 
-async def send_bind_complete(writer):
-    response = b'2' + struct.pack('!I', 4)
-    writer.write(response)
-    await writer.drain()
 
-async def send_execute_complete(writer):
-    command_complete = b'C' + b'SELECT 0\x00'
-    length = len(command_complete) + 4
-    complete_response = struct.pack('!I', length) + command_complete[1:]
-    writer.write(complete_response)
-    await writer.drain()
+class LimitExceeded(Exception):
+    """A session limit tripped; the client gets a FATAL error and is disconnected."""
+    
+    def __init__(self, limit: str, value, code: str, message: str):
+        super().__init__(f"{limit} of {value} exceeded")
+        self.limit = limit
+        self.value = value
+        self.code = code
+        self.message = message
 
-async def send_error_response(writer, message: str, username: str = "unknown"):
-    fields = [
-        (b'S', b'FATAL'),
-        (b'C', b'28P01'),
-        (b'M', message.encode('utf-8', errors='replace')),
-        (b'\x00', b''),
-    ]
-    message_content = b''.join([code + value + b'\x00' for code, value in fields])
-    message_length = 4 + len(message_content)
-    response = b'E' + struct.pack('!I', message_length) + message_content
-    writer.write(response)
-    await writer.drain()
 
-async def send_query_response(writer, rows=None):
-    if rows is None:
-        rows = []
-    
-    if rows:
-        row_desc = b'T'
-        row_desc += struct.pack('!H', 1)
-        row_desc += b'id\x00'
-        row_desc += struct.pack('!I', 0)
-        row_desc += struct.pack('!H', 0)
-        row_desc += struct.pack('!I', 23)
-        row_desc += struct.pack('!h', -1)
-        row_desc += struct.pack('!H', 0)
-        
-        length = len(row_desc) + 4
-        desc_response = struct.pack('!I', length) + row_desc[1:]
-        writer.write(desc_response)
-        await writer.drain()
+class ConnectionLimiter:
+    """Admission control for incoming connections.
+    
+    admit() takes a slot for a new connection, or refuses it when
+    max_connections are open or its source already holds max_per_ip.
+    Refusals are counted per source and limit and sent as one
+    postgres_limit event per pair every report_interval seconds, or as soon
+    as max_sources pairs are pending, so a connection flood costs a handful
+    of events instead of one per connection.
+    """
+    
+    def __init__(self, max_connections: int, max_per_ip: int, report_interval: float, max_sources: int = 10000):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.report_interval = report_interval
+        self.max_sources = max_sources
+        self.active = 0
+        self._per_ip: Dict[str, int] = {}
+        self._refused: Dict[tuple[str, str], Dict] = {}
+    
+    def admit(self, source_ip: str) -> bool:
+        if self.active >= self.max_connections:
+            self._refuse(source_ip, 'max_connections', self.max_connections)
+            return False
+        count = self._per_ip.get(source_ip, 0)
+        if count >= self.max_per_ip:
+            self._refuse(source_ip, 'max_connections_per_ip', self.max_per_ip)
+            return False
+        self.active += 1
+        self._per_ip[source_ip] = count + 1
+        return True
+    
+    def release(self, source_ip: str):
+        self.active -= 1
+        count = self._per_ip.pop(source_ip) - 1
+        if count:
+            self._per_ip[source_ip] = count
+    
+    def report(self):
+        if not self._refused:
+            return
         
-        for row in rows:
-            row_data = b'D'
-            row_data += struct.pack('!H', 1)
-            row_data += struct.pack('!I', 4)
-            row_data += struct.pack('!I', row)
-            length = len(row_data) + 4
-            row_response = struct.pack('!I', length) + row_data[1:]
-            writer.write(row_response)
-            await writer.drain()
-    
-    command_complete = b'C' + b'SELECT 0\x00'
-    length = len(command_complete) + 4
-    complete_response = struct.pack('!I', length) + command_complete[1:]
-    writer.write(complete_response)
-    await writer.drain()
-    
-    await send_ready_for_query(writer)
+        refused, self._refused = self._refused, {}
+        for (source_ip, limit), entry in refused.items():
+            event_data = {
+                'honeypot_id': SERVICE_ID,
+                'event_type': 'postgres_limit',
+                'level': 1,
+                'source_ip': source_ip,
+                'details': {
+                    'limit': limit,
+                    'value': entry['value'],
+                    'refused': entry['count'],
+                    'first_seen': datetime.fromtimestamp(entry['first_seen'], timezone.utc).isoformat(),
+                    'last_seen': datetime.fromtimestamp(entry['last_seen'], timezone.utc).isoformat(),
+                    'request_text': f"{entry['count']} connections refused by {limit}={entry['value']}"
+                },
+                'honeytoken_check': None
+            }
+            event_emitter.send(event_data)
+        print(f"[POSTGRES-HONEYPOT] Refused {sum(entry['count'] for entry in refused.values())} connections from {len(refused)} sources")
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+    
+    def _refuse(self, source_ip: str, limit: str, value: int):
+        now = time.time()
+        entry = self._refused.get((source_ip, limit))
+        if entry is None:
+            if len(self._refused) >= self.max_sources:
+                self.report()
+            self._refused[(source_ip, limit)] = {'value': value, 'count': 1, 'first_seen': now, 'last_seen': now}
+        else:
+            entry['count'] += 1
+            entry['last_seen'] = now
+
+
+connection_limiter = ConnectionLimiter(MAX_CONNECTIONS, MAX_CONNECTIONS_PER_IP, LIMIT_REPORT_INTERVAL)
+
+
+async def receive(reader, response: ResponseBuilder, deadline: float) -> bytes:
+    """Sends the replies collected so far and reads more data.
+    
+    Both must finish within IDLE_TIMEOUT and before the session deadline, so
+    a client that stops sending or stops reading is disconnected.
+    """
+    timeout = min(IDLE_TIMEOUT, deadline - asyncio.get_running_loop().time())
+    try:
+        async with asyncio.timeout(timeout):
+            await response.flush()
+            return await reader.read(READ_SIZE)
+    except TimeoutError:
+        if timeout < IDLE_TIMEOUT:
+            raise LimitExceeded('session_timeout', SESSION_TIMEOUT, '57P01', 'terminating connection due to session timeout')
+        raise LimitExceeded('idle_timeout', IDLE_TIMEOUT, '57P05', 'terminating connection due to idle-session timeout')
 
 async def handle_client(reader, writer):
     source_ip = writer.get_extra_info('peername')[0] if writer.get_extra_info('peername') else 'unknown'
-    _buf = b''
+    if not connection_limiter.admit(source_ip):
+        writer.write(TOO_MANY_CONNECTIONS)
+        writer.close()
+        return
+    
+    started = asyncio.get_running_loop().time()
+    deadline = started + SESSION_TIMEOUT
+    parser = FrameParser(max_message_size=AUTH_MESSAGE_SIZE)
+    response = ResponseBuilder(writer)
     state = "startup"
     username = None
     database = None
@@ -231,41 +455,15 @@ async def handle_client(reader, writer):
     connection_logged = False
     startup_params = {}
     prepared_statements = {}  # Store prepared statements: name -> query
+    prepared_bytes = 0
     
     try:
         while True:
             if state == "startup":
-                if len(_buf) < 8:
-                    data = await reader.read(4096)
-                    if not data:
-                        if not connection_logged:
-                            event_data = {
-                                'honeypot_id': SERVICE_ID,
-                                'event_type': 'postgres_connection',
-                                'level': 1,
-                                'source_ip': source_ip,
-                                'details': {
-                                    'username': username or 'unknown',
-                                    'database': database or 'unknown',
-                                    'request_text': request_text or 'connection attempt without data'
-                                },
-                                'honeytoken_check': None
-                            }
-                            send_event_to_backend(event_data)
-                        break
-                    _buf += data
-                    continue
-                
-                length = struct.unpack('!I', _buf[0:4])[0]
-                code = struct.unpack('!I', _buf[4:8])[0]
-                
-                if length == 8 and code in (80877103, 80877104):
-                    _buf = _buf[8:]
-                    writer.write(b'N')
-                    await writer.drain()
-                    continue
-                
-                if length < 8:
+                try:
+                    msg = parser.next_startup()
+                except FrameError as e:
+                    print(f"[POSTGRES-HONEYPOT] Invalid startup message: {e}")
                     if not connection_logged:
                         event_data = {
                             'honeypot_id': SERVICE_ID,
@@ -279,11 +477,11 @@ async def handle_client(reader, writer):
                             },
                             'honeytoken_check': None
                         }
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                     break
                 
-                if len(_buf) < length:
-                    data = await reader.read(4096)
+                if msg is None:
+                    data = await receive(reader, response, deadline)
                     if not data:
                         if not connection_logged:
                             event_data = {
@@ -294,17 +492,23 @@ async def handle_client(reader, writer):
                                 'details': {
                                     'username': username or 'unknown',
                                     'database': database or 'unknown',
-                                    'request_text': request_text or 'incomplete connection attempt'
+                                    'request_text': request_text or (
+                                        'connection attempt without data' if parser.buffered < 8
+                                        else 'incomplete connection attempt'
+                                    )
                                 },
                                 'honeytoken_check': None
                             }
-                            send_event_to_backend(event_data)
+                            event_emitter.send(event_data)
                         break
-                    _buf += data
+                    parser.feed(data)
                     continue
                 
-                msg = _buf[:length]
-                _buf = _buf[length:]
+                length, code = struct.unpack_from('!II', msg)
+                
+                if length == 8 and code in (80877103, 80877104):
+                    response.ssl_refused()
+                    continue
                 
                 startup_params = parse_startup_message(msg)
                 username = startup_params.get('user')
@@ -323,44 +527,21 @@ async def handle_client(reader, writer):
                         },
                         'honeytoken_check': None
                     }
-                    send_event_to_backend(event_data)
+                    event_emitter.send(event_data)
                     break
                 
                 request_text = f"username={username}\ndatabase={database}\n"
                 request_text += json.dumps(startup_params)
                 
-                await send_authentication_request(writer, auth_type=3)
+                response.authentication_request()
                 state = "authentication"
                 continue
             
             if state == "authentication":
-                if len(_buf) < 5:
-                    data = await reader.read(4096)
-                    if not data:
-                        if not connection_logged:
-                            event_data = {
-                                'honeypot_id': SERVICE_ID,
-                                'event_type': 'postgres_connection',
-                                'level': 1,
-                                'source_ip': source_ip,
-                                'details': {
-                                    'username': username,
-                                    'database': database,
-                                    'startup_params': startup_params,
-                                    'request_text': request_text
-                                },
-                                'honeytoken_check': None
-                            }
-                            send_event_to_backend(event_data)
-                        break
-                    _buf += data
-                    continue
-                
-                mtype = _buf[0:1]
-                mlen = struct.unpack('!I', _buf[1:5])[0]
-                total = 1 + mlen
-                
-                if mlen < 4:
+                try:
+                    message = parser.next_message()
+                except FrameError as e:
+                    print(f"[POSTGRES-HONEYPOT] Invalid authentication message: {e}")
                     if not connection_logged:
                         event_data = {
                             'honeypot_id': SERVICE_ID,
@@ -374,38 +555,38 @@ async def handle_client(reader, writer):
                             },
                             'honeytoken_check': None
                         }
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                     break
                 
-                if len(_buf) < total:
-                    data = await reader.read(4096)
+                if message is None:
+                    data = await receive(reader, response, deadline)
                     if not data:
                         if not connection_logged:
+                            details = {'username': username, 'database': database}
+                            if parser.buffered < 5:
+                                details['startup_params'] = startup_params
+                            details['request_text'] = request_text
                             event_data = {
                                 'honeypot_id': SERVICE_ID,
                                 'event_type': 'postgres_connection',
                                 'level': 1,
                                 'source_ip': source_ip,
-                                'details': {
-                                    'username': username,
-                                    'database': database,
-                                    'request_text': request_text
-                                },
+                                'details': details,
                                 'honeytoken_check': None
                             }
-                            send_event_to_backend(event_data)
+                            event_emitter.send(event_data)
                         break
-                    _buf += data
+                    parser.feed(data)
                     continue
                 
-                payload = _buf[5:total]
-                _buf = _buf[total:]
+                mtype, msg = message
+                payload = msg[5:]
                 
                 if mtype == b'p':
                     pw = payload
-                    if pw.endswith(b'\x00'):
+                    if pw[-1:] == b'\x00':
                         pw = pw[:-1]
-                    password = pw.decode('utf-8', errors='replace')
+                    password = str(pw, 'utf-8', errors='replace')
                     
                     request_text += f"\npassword={password}"
                     
@@ -423,11 +604,12 @@ async def handle_client(reader, writer):
                         'honeytoken_check': None
                     }
                     
-                    send_event_to_backend(event_data)
+                    event_emitter.send(event_data)
                     connection_logged = True
                     
-                    await send_authentication_ok(writer)
-                    await send_ready_for_query(writer)
+                    response.authentication_ok()
+                    response.ready_for_query()
+                    parser.max_message_size = MAX_MESSAGE_SIZE
                     state = "ready"
                     continue
                 else:
@@ -444,34 +626,25 @@ async def handle_client(reader, writer):
                             },
                             'honeytoken_check': None
                         }
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                     break
             
             if state == "ready":
-                if len(_buf) < 5:
-                    data = await reader.read(4096)
-                    if not data:
-                        break
-                    _buf += data
-                    continue
-                
-                msg_type = _buf[0:1]
-                mlen = struct.unpack('!I', _buf[1:5])[0]
-                total = 1 + mlen
-                
-                if mlen < 4:
-                    print(f"[POSTGRES-HONEYPOT] Invalid message length: {mlen}")
+                try:
+                    message = parser.next_message()
+                except FrameError as e:
+                    print(f"[POSTGRES-HONEYPOT] Invalid message: {e}")
                     break
                 
-                if len(_buf) < total:
-                    data = await reader.read(4096)
+                if message is None:
+                    data = await receive(reader, response, deadline)
                     if not data:
                         break
-                    _buf += data
+                    parser.feed(data)
                     continue
                 
-                msg_data = _buf[:total]
-                _buf = _buf[total:]
+                msg_type, msg_data = message
+                mlen = len(msg_data) - 1
                 
                 msg_type_char = msg_type.decode('latin-1', errors='replace')
                 raw_preview = msg_data[:min(100, len(msg_data))].hex() if len(msg_data) > 0 else ''
@@ -498,15 +671,15 @@ async def handle_client(reader, writer):
                         }
                         
                         print(f"[POSTGRES-HONEYPOT] Query received: {query}")
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                         
-                        await send_query_response(writer)
+                        response.query_response()
                     else:
                         if query is None:
                             print(f"[POSTGRES-HONEYPOT] Failed to parse query message, raw: {msg_data.hex()}")
                         elif not query.strip():
                             print(f"[POSTGRES-HONEYPOT] Empty query received")
-                        await send_ready_for_query(writer)
+                        response.ready_for_query()
                 
                 elif msg_type == b'X':
                     print(f"[POSTGRES-HONEYPOT] Terminate message received")
@@ -514,12 +687,17 @@ async def handle_client(reader, writer):
                 elif msg_type == b'P':
                     query = parse_parse_message(msg_data)
                     if query is not None:
-                        if len(msg_data) >= 5:
-                            pos = 5
-                            stmt_name_end = msg_data.find(b'\x00', pos)
-                            if stmt_name_end != -1:
-                                stmt_name = msg_data[pos:stmt_name_end].decode('utf-8', errors='replace')
-                                prepared_statements[stmt_name] = query
+                        stmt_name = read_cstring(msg_data, 5)
+                        if stmt_name is not None:
+                            previous = prepared_statements.get(stmt_name)
+                            if previous is not None:
+                                prepared_bytes -= len(stmt_name) + len(previous)
+                            elif len(prepared_statements) >= MAX_PREPARED_STATEMENTS:
+                                raise LimitExceeded('prepared_statements', MAX_PREPARED_STATEMENTS, '53200', 'out of memory')
+                            prepared_bytes += len(stmt_name) + len(query)
+                            if prepared_bytes > MAX_PREPARED_BYTES:
+                                raise LimitExceeded('prepared_bytes', MAX_PREPARED_BYTES, '53200', 'out of memory')
+                            prepared_statements[stmt_name] = query
                         
                         request_text += f"\nparse_query={query}"
                         
@@ -540,22 +718,19 @@ async def handle_client(reader, writer):
                         }
                         
                         print(f"[POSTGRES-HONEYPOT] Parse query received: {query}")
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                     else:
                         print(f"[POSTGRES-HONEYPOT] Failed to parse Parse message, raw: {msg_data.hex()}")
-                    await send_parse_complete(writer)
+                    response.parse_complete()
                 elif msg_type == b'B':
                     print(f"[POSTGRES-HONEYPOT] Bind message received")
-                    await send_bind_complete(writer)
+                    response.bind_complete()
                 elif msg_type == b'E':
                     query = None
                     stmt_name = None
-                    if len(msg_data) >= 5:
-                        pos = 5
-                        stmt_name_end = msg_data.find(b'\x00', pos)
-                        if stmt_name_end != -1:
-                            stmt_name = msg_data[pos:stmt_name_end].decode('utf-8', errors='replace')
-                            query = prepared_statements.get(stmt_name, None)
+                    stmt_name = read_cstring(msg_data, 5)
+                    if stmt_name is not None:
+                        query = prepared_statements.get(stmt_name, None)
                     
                     if query:
                         request_text += f"\nexecute_query={query}"
@@ -577,7 +752,7 @@ async def handle_client(reader, writer):
                         }
                         
                         print(f"[POSTGRES-HONEYPOT] Execute query received: {query} (stmt: {stmt_name})")
-                        send_event_to_backend(event_data)
+                        event_emitter.send(event_data)
                     else:
                         print(f"[POSTGRES-HONEYPOT] Execute message received (stmt: {stmt_name}, available: {list(prepared_statements.keys())})")
                         if stmt_name:
@@ -596,26 +771,26 @@ async def handle_client(reader, writer):
                                 },
                                 'honeytoken_check': None
                             }
-                            send_event_to_backend(event_data)
-                    await send_execute_complete(writer)
-                    await send_ready_for_query(writer)
+                            event_emitter.send(event_data)
+                    response.command_complete()
+                    response.ready_for_query()
                 elif msg_type == b'D':
                     print(f"[POSTGRES-HONEYPOT] Describe message received")
-                    await send_ready_for_query(writer)
+                    response.ready_for_query()
                 elif msg_type == b'C':
                     print(f"[POSTGRES-HONEYPOT] Close message received")
-                    await send_ready_for_query(writer)
+                    response.ready_for_query()
                 elif msg_type == b'H':
                     print(f"[POSTGRES-HONEYPOT] Flush message received")
-                    await send_ready_for_query(writer)
+                    response.ready_for_query()
                 elif msg_type == b'S':
                     print(f"[POSTGRES-HONEYPOT] Sync message received")
-                    await send_ready_for_query(writer)
+                    response.ready_for_query()
                 else:
                     print(f"[POSTGRES-HONEYPOT] Unknown message type: '{msg_type_char}' (0x{msg_type.hex()}), length: {mlen}, raw: {msg_data[:min(50, len(msg_data))].hex()}")
                     if len(msg_data) > 5:
                         try:
-                            potential_text = msg_data[5:min(200, len(msg_data)-1)].decode('utf-8', errors='replace')
+                            potential_text = str(msg_data[5:min(200, len(msg_data)-1)], 'utf-8', errors='replace')
                             if potential_text.strip():
                                 print(f"[POSTGRES-HONEYPOT] Potential text in unknown message: {potential_text[:100]}")
                                 event_data = {
@@ -634,35 +809,180 @@ async def handle_client(reader, writer):
                                     },
                                     'honeytoken_check': None
                                 }
-                                send_event_to_backend(event_data)
+                                event_emitter.send(event_data)
                         except Exception:
                             pass
-                    await send_ready_for_query(writer)
+                    response.ready_for_query()
     
+    except LimitExceeded as e:
+        print(f"[POSTGRES-HONEYPOT] Disconnecting {source_ip}: {e}")
+        event_data = {
+            'honeypot_id': SERVICE_ID,
+            'event_type': 'postgres_limit',
+            'level': 1,
+            'source_ip': source_ip,
+            'details': {
+                'limit': e.limit,
+                'value': e.value,
+                'username': username or 'unknown',
+                'database': database or 'unknown',
+                'duration': round(asyncio.get_running_loop().time() - started, 3),
+                'request_text': f"username={username or 'unknown'}\ndatabase={database or 'unknown'}\n{e.limit}={e.value} exceeded"
+            },
+            'honeytoken_check': None
+        }
+        event_emitter.send(event_data)
+        response.error_response(e.message, e.code)
     except Exception as e:
         print(f"[POSTGRES-HONEYPOT] Connection error: {e}")
-        import traceback
         traceback.print_exc()
     finally:
+        connection_limiter.release(source_ip)
         try:
-            writer.close()
-            await writer.wait_closed()
+            # A client that does not read must not hold the connection open
+            async with asyncio.timeout(CLOSE_TIMEOUT):
+                await response.flush()
+                writer.close()
+                await writer.wait_closed()
         except Exception:
-            pass
+            writer.transport.abort()
+
+async def watch_supervisor(supervisor: int):
+    """Stops a worker whose supervisor died without stopping it."""
+    while os.getppid() == supervisor:
+        await asyncio.sleep(1)
+    print(f"[POSTGRES-HONEYPOT] Supervisor {supervisor} is gone, stopping worker {os.getpid()}")
+    signal.raise_signal(signal.SIGINT)
 
-async def main():
-    server = await asyncio.start_server(handle_client, HOST, PORT)
+def worker_share(total: int, workers: int) -> int:
+    """Splits a limit across workers, rounding up so no worker gets zero."""
+    return max(1, -(-total // workers))
+
+async def main(worker: int = 0):
+    global event_emitter, connection_limiter
+    if WORKERS > 1:
+        # Worker 0 keeps the base directory so events spooled by a single-process run are replayed
+        spool_dir = EVENT_SPOOL_DIR if worker == 0 else os.path.join(EVENT_SPOOL_DIR, f"worker-{worker}")
+        event_emitter = create_event_emitter(spool_dir, EVENT_SPOOL_MAX_BYTES // WORKERS)
+        # The kernel spreads connections over the workers, so each enforces its share of the limits
+        connection_limiter = ConnectionLimiter(
+            worker_share(MAX_CONNECTIONS, WORKERS),
+            worker_share(MAX_CONNECTIONS_PER_IP, WORKERS),
+            LIMIT_REPORT_INTERVAL
+        )
+    else:
+        event_emitter = create_event_emitter(EVENT_SPOOL_DIR, EVENT_SPOOL_MAX_BYTES)
     
-    print(f"[POSTGRES-HONEYPOT] PostgreSQL Honeypot started on {HOST}:{PORT}")
-    print(f"[POSTGRES-HONEYPOT] Service ID: {SERVICE_ID}")
-    print(f"[POSTGRES-HONEYPOT] API URL: {API_URL}")
+    await event_emitter.start()
+    tasks = [asyncio.create_task(connection_limiter.run())]
+    if WORKERS > 1:
+        tasks.append(asyncio.create_task(watch_supervisor(os.getppid())))
+    server = await asyncio.start_server(handle_client, HOST, PORT, reuse_port=WORKERS > 1)
+    
+    if WORKERS > 1:
+        print(f"[POSTGRES-HONEYPOT] Worker {worker} (pid {os.getpid()}) listening on {HOST}:{PORT}")
+    else:
+        print(f"[POSTGRES-HONEYPOT] PostgreSQL Honeypot started on {HOST}:{PORT}")
+        print(f"[POSTGRES-HONEYPOT] Service ID: {SERVICE_ID}")
+        print(f"[POSTGRES-HONEYPOT] API URL: {API_URL}")
+        print(f"[POSTGRES-HONEYPOT] Limits: {MAX_CONNECTIONS} connections, {MAX_CONNECTIONS_PER_IP} per IP, "
+              f"idle {IDLE_TIMEOUT:g}s, session {SESSION_TIMEOUT:g}s")
     
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        connection_limiter.report()
+        await event_emitter.stop()
 
-if __name__ == '__main__':
+def run(coro):
+    """Runs coro on a new event loop, uvloop's when EVENT_LOOP=uvloop and it is installed."""
+    loop_factory = None
+    if EVENT_LOOP == 'uvloop':
+        if uvloop is None:
+            print("[POSTGRES-HONEYPOT] uvloop is not installed, using the asyncio event loop")
+        else:
+            loop_factory = uvloop.new_event_loop
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coro)
+
+def run_worker(worker: int):
+    """Body of a forked worker process; never returns."""
+    # SIGTERM from the supervisor stops the worker the way Ctrl-C does, flushing its events
+    signal.signal(signal.SIGTERM, lambda signum, frame: signal.raise_signal(signal.SIGINT))
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    code = 0
     try:
-        asyncio.run(main())
+        run(main(worker))
     except KeyboardInterrupt:
-        print("\n[POSTGRES-HONEYPOT] Shutting down...")
+        pass
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
 
+def run_workers():
+    """Forks WORKERS processes that each accept on PORT through SO_REUSEPORT.
+    
+    The kernel balances new connections across the workers; each one runs
+    its own event loop and event emitter. A worker that dies is restarted
+    until the supervisor gets SIGTERM or SIGINT, which it passes on to the
+    workers before waiting for them to flush and exit.
+    """
+    children = {}
+    stopping = False
+    
+    def spawn(worker):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(worker)
+        children[pid] = worker
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[POSTGRES-HONEYPOT] PostgreSQL Honeypot starting {WORKERS} workers on {HOST}:{PORT} ({EVENT_LOOP} loop)")
+    print(f"[POSTGRES-HONEYPOT] Service ID: {SERVICE_ID}")
+    print(f"[POSTGRES-HONEYPOT] API URL: {API_URL}")
+    print(f"[POSTGRES-HONEYPOT] Limits per worker: {worker_share(MAX_CONNECTIONS, WORKERS)} connections, "
+          f"{worker_share(MAX_CONNECTIONS_PER_IP, WORKERS)} per IP, idle {IDLE_TIMEOUT:g}s, session {SESSION_TIMEOUT:g}s")
+    sys.stdout.flush()
+    for worker in range(WORKERS):
+        spawn(worker)
+    
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker = children.pop(pid)
+        if stopping:
+            continue
+        print(f"[POSTGRES-HONEYPOT] Worker {worker} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        sys.stdout.flush()
+        time.sleep(1)
+        if not stopping:
+            spawn(worker)
+    print("[POSTGRES-HONEYPOT] Shutting down...")
+
+if __name__ == '__main__':
+    if WORKERS > 1:
+        run_workers()
+    else:
+        try:
+            run(main())
+        except KeyboardInterrupt:
+            print("\n[POSTGRES-HONEYPOT] Shutting down...")
@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 import os
 import sys
+import signal
+import socket
+import subprocess
+import time
 import base64
 import binascii
 import hashlib
 import random
 import json
-import requests
+from datetime import datetime, timezone
 from warnings import filterwarnings
 filterwarnings("ignore")
 
-from twisted.internet import reactor, endpoints, defer
+from twisted.internet import reactor, endpoints, defer, task
 from twisted.conch.ssh import factory, keys, userauth, connection, transport, channel
 from twisted.conch import avatar, interfaces as conchinterfaces
 from twisted.cred import portal, credentials, error
@@ -24,6 +28,7 @@ try:
 except Exception:
     ed25519 = None
 from zope.interface import implementer
+from event_sender import BackgroundEventSender, default_api_urls, open_spool
 
 SERVICE_ID = os.getenv('SERVICE_ID', 'unknown')
 PORT = int(os.getenv('PORT', '2222'))
@@ -31,34 +36,41 @@ HOST = os.getenv('HOST', '0.0.0.0')
 API_URL = os.getenv('API_URL', 'http://172.17.0.1:8000')
 SECRET_KEY = os.getenv('SECRET_KEY', 'default-secret-key')
 SSH_VERSION = os.getenv('SSH_VERSION', 'SSH-2.0-OpenSSH_7.4')
+WORKERS = int(os.getenv('WORKERS', '1'))
+# Index of this process when the supervisor started it as a worker, None otherwise
+WORKER = int(os.environ['SSH_WORKER']) if 'SSH_WORKER' in os.environ else None
+EVENT_SPOOL_DIR = os.getenv('EVENT_SPOOL_DIR', '/tmp/honeypot-spool')
+EVENT_SPOOL_MAX_BYTES = int(os.getenv('EVENT_SPOOL_MAX_MB', '50')) * 1024 * 1024
+# Admission control, split across workers: connections over a limit are dropped before the key exchange
+MAX_KEX_IN_PROGRESS = int(os.getenv('MAX_KEX_IN_PROGRESS', '100'))
+MAX_CONNECTIONS_PER_IP = int(os.getenv('MAX_CONNECTIONS_PER_IP', '20'))
+KEX_TIMEOUT = float(os.getenv('KEX_TIMEOUT', '30'))
+LIMIT_REPORT_INTERVAL = float(os.getenv('LIMIT_REPORT_INTERVAL', '60'))
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-def send_event_to_backend(event_data):
-    try:
-        token = SECRET_KEY[:16]
-        api_urls = [
-            API_URL,
-            "http://host.docker.internal:8000",
-            "http://172.17.0.1:8000",
-            "http://172.19.0.1:8000",
-        ]
-        
-        for api_url in api_urls:
-            try:
-                response = requests.post(
-                    f"{api_url}/api/events/internal",
-                    json=event_data,
-                    headers={"X-Honeypot-Token": token},
-                    timeout=2
-                )
-                if response.status_code == 200:
-                    return True
-            except Exception:
-                continue
-    except Exception as e:
-        print(f"[SSH-HONEYPOT] Failed to send event: {e}")
-    return False
+def create_event_sender():
+    spool_dir = EVENT_SPOOL_DIR
+    spool_max_bytes = EVENT_SPOOL_MAX_BYTES
+    if WORKER is not None:
+        # Worker 0 keeps the base directory so events spooled by a single-process run are replayed
+        if WORKER:
+            spool_dir = os.path.join(EVENT_SPOOL_DIR, f"worker-{WORKER}")
+        spool_max_bytes //= WORKERS
+    return BackgroundEventSender(
+        default_api_urls(API_URL),
+        SECRET_KEY[:16],
+        queue_size=int(os.getenv('EVENT_QUEUE_SIZE', '10000')),
+        batch_size=int(os.getenv('EVENT_BATCH_SIZE', '100')),
+        flush_interval=float(os.getenv('EVENT_FLUSH_INTERVAL', '0.5')),
+        spool=open_spool(spool_dir, spool_max_bytes, log_prefix="[SSH-HONEYPOT]"),
+        wire_format=os.getenv('EVENT_WIRE_FORMAT', 'msgpack'),
+        compression=os.getenv('EVENT_COMPRESSION', 'zstd'),
+        log_prefix="[SSH-HONEYPOT]"
+    )
+
+# The supervisor of a multi-process run serves no connections, so it has no sender or spool
+event_sender = create_event_sender() if WORKERS == 1 or WORKER is not None else None
 
 def _b2s(x):
     if x is None:
@@ -346,7 +358,7 @@ class CustomSSHUserAuthServer(userauth.SSHUserAuthServer):
                         'honeytoken_check': None
                     }
                     
-                    send_event_to_backend(event_data)
+                    event_sender.send(event_data)
                     print(f"[SSH-HONEYPOT] Auth attempt - Username: {username}, Password: {password}")
                 except Exception as e:
                     print(f"[SSH-HONEYPOT] Failed to parse password: {e}")
@@ -392,7 +404,7 @@ class CustomSSHUserAuthServer(userauth.SSHUserAuthServer):
                             'public_key_len': len(key_blob or b""),
                         })
                     
-                    send_event_to_backend(event_data)
+                    event_sender.send(event_data)
                     print(f"[SSH-HONEYPOT] Connection attempt - Username: {username}, Method: {meth}")
         except Exception as e:
             print(f"[SSH-HONEYPOT] Error in ssh_USERAUTH_REQUEST: {e}")
@@ -409,10 +421,15 @@ class CustomSSHServerTransport(transport.SSHServerTransport):
         self._ver_logged = False
         self._connection_logged = False
         self._kexinit_logged = False
+        self._kex_pending = False
+        self._kex_timer = None
+        self._admitted_ip = None
         self.source_ip = None
         transport.SSHServerTransport.__init__(self)
 
     def connectionMade(self):
+        if self._kex_pending:
+            self._kex_timer = reactor.callLater(KEX_TIMEOUT, self._kex_timed_out)
         try:
             peer = self.transport.getPeer()
             us = self.transport.getHost()
@@ -435,7 +452,7 @@ class CustomSSHServerTransport(transport.SSHServerTransport):
                 'honeytoken_check': None
             }
             
-            send_event_to_backend(event_data)
+            event_sender.send(event_data)
             print(f"[SSH-HONEYPOT] New connection from {self.source_ip}")
         except Exception as e:
             print(f"[SSH-HONEYPOT] Error in connectionMade: {e}")
@@ -494,12 +511,39 @@ class CustomSSHServerTransport(transport.SSHServerTransport):
                     'honeytoken_check': None
                 }
                 
-                send_event_to_backend(event_data)
+                event_sender.send(event_data)
         except Exception:
             pass
         
         return transport.SSHServerTransport.ssh_KEXINIT(self, packet)
 
+    def ssh_NEWKEYS(self, packet):
+        out = transport.SSHServerTransport.ssh_NEWKEYS(self, packet)
+        self._finish_kex()
+        return out
+
+    def connectionLost(self, reason=None):
+        self._finish_kex()
+        if self._admitted_ip is not None:
+            self.factory.release(self._admitted_ip)
+            self._admitted_ip = None
+        return transport.SSHServerTransport.connectionLost(self, reason)
+
+    def _finish_kex(self):
+        """Gives back the key exchange slot after the first exchange, or when the connection is lost."""
+        if not self._kex_pending:
+            return
+        self._kex_pending = False
+        self.factory.kex_in_progress -= 1
+        if self._kex_timer is not None and self._kex_timer.active():
+            self._kex_timer.cancel()
+        self._kex_timer = None
+
+    def _kex_timed_out(self):
+        self._kex_timer = None
+        self.factory.drop(self._admitted_ip or "", 'kex_timeout', KEX_TIMEOUT)
+        self.transport.abortConnection()
+
 class CustomSSHConnection(connection.SSHConnection):
     def __init__(self):
         connection.SSHConnection.__init__(self)
@@ -588,7 +632,7 @@ class CustomSSHChannel(channel.SSHChannel):
                 'honeytoken_check': None
             }
             
-            send_event_to_backend(event_data)
+            event_sender.send(event_data)
             print(f"[SSH-HONEYPOT] Command executed - Username: {username}, Command: {command}")
             
             self.write(b"Command executed (honeypot)\n")
@@ -632,7 +676,7 @@ class CustomSSHChannel(channel.SSHChannel):
                     'honeytoken_check': None
                 }
                 
-                send_event_to_backend(event_data)
+                event_sender.send(event_data)
                 print(f"[SSH-HONEYPOT] Command executed - Username: {username}, Command: {command}")
                 
                 self.write(b"$ ")
@@ -642,9 +686,30 @@ class CustomSSHChannel(channel.SSHChannel):
         return channel.SSHChannel.dataReceived(self, data)
 
 class SimpleSSHFactory(factory.SSHFactory):
-    def __init__(self, our_version_string):
+    """Serves the honeypot transport behind a cheap admission check.
+    
+    A connection takes a key exchange slot until its first NEWKEYS, and
+    counts against its source IP until it closes. When max_kex_in_progress
+    exchanges are running, or the IP already has max_connections_per_ip
+    connections, buildProtocol counts the refusal and returns None, so the
+    socket is closed before any key exchange work. Exchanges that have not
+    finished after KEX_TIMEOUT seconds are aborted, so idle sockets cannot
+    hold the slots. Refusals and timeouts are counted per source IP and
+    limit and sent as one ssh_connection event per pair every
+    LIMIT_REPORT_INTERVAL seconds, or as soon as max_sources pairs are
+    pending, so a flood costs a handful of events instead of one per
+    connection.
+    """
+    
+    def __init__(self, our_version_string, max_kex_in_progress=MAX_KEX_IN_PROGRESS, max_connections_per_ip=MAX_CONNECTIONS_PER_IP, max_sources=10000):
         self.ourVersionString = our_version_string
         self.publicKeys, self.privateKeys = getHostKeyDicts()
+        self.max_kex_in_progress = max_kex_in_progress
+        self.max_connections_per_ip = max_connections_per_ip
+        self.max_sources = max_sources
+        self.kex_in_progress = 0
+        self.connections_per_ip = {}
+        self.dropped = {}
 
     services = {
         b"ssh-userauth": CustomSSHUserAuthServer,
@@ -652,14 +717,74 @@ class SimpleSSHFactory(factory.SSHFactory):
     }
 
     def buildProtocol(self, addr):
+        source_ip = getattr(addr, "host", "")
+        connections = self.connections_per_ip.get(source_ip, 0)
+        if self.kex_in_progress >= self.max_kex_in_progress:
+            self.drop(source_ip, 'max_kex_in_progress', self.max_kex_in_progress)
+            return None
+        if connections >= self.max_connections_per_ip:
+            self.drop(source_ip, 'max_connections_per_ip', self.max_connections_per_ip)
+            return None
+        
         t = CustomSSHServerTransport(self.ourVersionString)
         try:
             t.supportedPublicKeys = list(self.privateKeys.keys())
         except Exception:
             t.supportedPublicKeys = self.privateKeys.keys()
         t.factory = self
+        self.kex_in_progress += 1
+        self.connections_per_ip[source_ip] = connections + 1
+        t._kex_pending = True
+        t._admitted_ip = source_ip
         return t
 
+    def release(self, source_ip):
+        connections = self.connections_per_ip.get(source_ip, 0) - 1
+        if connections > 0:
+            self.connections_per_ip[source_ip] = connections
+        else:
+            self.connections_per_ip.pop(source_ip, None)
+
+    def drop(self, source_ip, limit, value):
+        """Counts a connection refused or aborted by `limit` until the next report."""
+        now = time.time()
+        entry = self.dropped.get((source_ip, limit))
+        if entry is None:
+            if len(self.dropped) >= self.max_sources:
+                self.report_drops()
+            self.dropped[(source_ip, limit)] = {'value': value, 'count': 1, 'first_seen': now, 'last_seen': now}
+        else:
+            entry['count'] += 1
+            entry['last_seen'] = now
+
+    def report_drops(self):
+        if not self.dropped:
+            return
+        dropped, self.dropped = self.dropped, {}
+        for (source_ip, limit), entry in dropped.items():
+            event_data = {
+                'honeypot_id': SERVICE_ID,
+                'event_type': 'ssh_connection',
+                'level': 1,
+                'source_ip': source_ip,
+                'details': {
+                    'dst_port': PORT,
+                    'dropped': limit,
+                    'limit': entry['value'],
+                    'count': entry['count'],
+                    'first_seen': datetime.fromtimestamp(entry['first_seen'], timezone.utc).isoformat(),
+                    'last_seen': datetime.fromtimestamp(entry['last_seen'], timezone.utc).isoformat(),
+                    'request_text': f"{entry['count']} connections dropped by {limit}={entry['value']}"
+                },
+                'honeytoken_check': None
+            }
+            event_sender.send(event_data)
+        totals = {}
+        for (_, limit), entry in dropped.items():
+            totals[limit] = totals.get(limit, 0) + entry['count']
+        counts = ", ".join(f"{limit}={count}" for limit, count in sorted(totals.items()))
+        print(f"[SSH-HONEYPOT] Dropped connections from {len(dropped)} sources: {counts} ({self.kex_in_progress} key exchanges in progress)")
+
 class LoggingPasswordChecker:
     credentialInterfaces = [credentials.IUsernamePassword]
     
@@ -696,28 +821,125 @@ class LoggingPasswordChecker:
             'honeytoken_check': None
         }
         
-        send_event_to_backend(event_data)
+        event_sender.send(event_data)
         print(f"[SSH-HONEYPOT] Login attempt - Username: {username}, Password: {password}")
         
         return defer.fail(error.UnauthorizedLogin())
 
-def main():
-    print(f"[SSH-HONEYPOT] SSH Honeypot starting on {HOST}:{PORT}")
+def worker_share(total, workers):
+    """Splits a limit across workers, rounding up so no worker gets zero."""
+    return max(1, -(-total // workers))
+
+def listen_reuseport(ssh_factory):
+    """Listens on PORT with SO_REUSEPORT, so the kernel spreads connections over the workers."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(socket.SOMAXCONN)
+    sock.setblocking(False)
+    port = reactor.adoptStreamPort(sock.fileno(), socket.AF_INET, ssh_factory)
+    # The reactor listens on its own duplicate of the descriptor
+    sock.close()
+    return port
+
+def watch_supervisor(supervisor):
+    """Stops a worker whose supervisor died without stopping it."""
+    if os.getppid() != supervisor and reactor.running:
+        print(f"[SSH-HONEYPOT] Supervisor {supervisor} is gone, stopping worker {os.getpid()}")
+        reactor.stop()
+
+def run_workers():
+    """Starts WORKERS copies of this script that each accept on PORT through SO_REUSEPORT.
+    
+    Every worker is a fresh interpreter with its own reactor, host keys and
+    event sender: the reactor is created when Twisted is imported, so it
+    cannot be shared with forked children. The host keys are created here
+    first, so all workers load and present the same ones. A worker that
+    dies is restarted until the supervisor gets SIGTERM or SIGINT, which it
+    passes on to the workers before waiting for them to flush and exit.
+    """
+    getHostKeyDicts()
+    children = {}
+    stopping = False
+    
+    def spawn(worker):
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env={**os.environ, 'SSH_WORKER': str(worker)}
+        )
+        children[child.pid] = worker
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"[SSH-HONEYPOT] SSH Honeypot starting {WORKERS} workers on {HOST}:{PORT}")
     print(f"[SSH-HONEYPOT] Service ID: {SERVICE_ID}")
     print(f"[SSH-HONEYPOT] API URL: {API_URL}")
     print(f"[SSH-HONEYPOT] SSH Version: {SSH_VERSION}")
+    sys.stdout.flush()
+    for worker in range(WORKERS):
+        spawn(worker)
+    
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker = children.pop(pid, None)
+        if worker is None or stopping:
+            continue
+        print(f"[SSH-HONEYPOT] Worker {worker} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        sys.stdout.flush()
+        time.sleep(1)
+        if not stopping:
+            spawn(worker)
+    print("[SSH-HONEYPOT] Shutting down...")
+
+def main():
+    if WORKERS > 1 and WORKER is None:
+        run_workers()
+        return
     
-    ssh_factory = SimpleSSHFactory(SSH_VERSION)
+    if WORKER is None:
+        print(f"[SSH-HONEYPOT] SSH Honeypot starting on {HOST}:{PORT}")
+        print(f"[SSH-HONEYPOT] Service ID: {SERVICE_ID}")
+        print(f"[SSH-HONEYPOT] API URL: {API_URL}")
+        print(f"[SSH-HONEYPOT] SSH Version: {SSH_VERSION}")
+    
+    workers = WORKERS if WORKER is not None else 1
+    ssh_factory = SimpleSSHFactory(
+        SSH_VERSION,
+        max_kex_in_progress=worker_share(MAX_KEX_IN_PROGRESS, workers),
+        max_connections_per_ip=worker_share(MAX_CONNECTIONS_PER_IP, workers)
+    )
     ssh_realm = SimpleSSHRealm()
     ssh_portal = portal.Portal(ssh_realm)
     ssh_portal.registerChecker(LoggingPasswordChecker())
     ssh_factory.portal = ssh_portal
     
-    endpoint = endpoints.TCP4ServerEndpoint(reactor, PORT, interface=HOST)
-    endpoint.listen(ssh_factory)
+    if WORKER is None:
+        endpoint = endpoints.TCP4ServerEndpoint(reactor, PORT, interface=HOST)
+        endpoint.listen(ssh_factory)
+    else:
+        listen_reuseport(ssh_factory)
+        task.LoopingCall(watch_supervisor, os.getppid()).start(1.0, now=False)
+        print(f"[SSH-HONEYPOT] Worker {WORKER} (pid {os.getpid()}) listening on {HOST}:{PORT}")
     
+    task.LoopingCall(ssh_factory.report_drops).start(LIMIT_REPORT_INTERVAL, now=False)
+    event_sender.start()
+    # Pending drop counts are reported before the sender flushes
+    reactor.addSystemEventTrigger('before', 'shutdown', ssh_factory.report_drops)
+    reactor.addSystemEventTrigger('before', 'shutdown', event_sender.stop)
     reactor.run()
 
 if __name__ == "__main__":
     main()
-